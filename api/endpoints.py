@@ -2,10 +2,12 @@ from fastapi import APIRouter, UploadFile, File, HTTPException
 import json
 import tempfile
 import os
+from datetime import datetime
 from typing import List
 import logging
 
 from rag.core import RAGSystem
+from rag.executors import ExecutorBusy
 from config.models import Document
 
 router = APIRouter(prefix="/documents", tags=["documents"])
@@ -30,8 +32,8 @@ async def upload_document(file: UploadFile = File(...)):
             "upload_timestamp": datetime.now().isoformat()
         }
         
-        # Procesar documento
-        rag_system.add_document(text_content, metadata)
+        # Procesar documento (en el pool de ingesta)
+        await rag_system.aadd_document(text_content, metadata)
         
         return {
             "status": "success",
@@ -39,6 +41,8 @@ async def upload_document(file: UploadFile = File(...)):
             "message": "Documento procesado correctamente"
         }
         
+    except ExecutorBusy:
+        raise HTTPException(status_code=503, detail="Servidor ocupado, inténtalo de nuevo", headers={"Retry-After": "1"})
     except Exception as e:
         logger.error(f"Error subiendo documento: {e}")
         raise HTTPException(status_code=500, detail="Error procesando documento")
@@ -47,11 +51,11 @@ async def upload_document(file: UploadFile = File(...)):
 async def upload_json_documents(documents: List[Document]):
     """Subir documentos en formato estructurado"""
     try:
-        processed_count = 0
-        
-        for doc in documents:
-            rag_system.add_document(doc.content, doc.metadata)
-            processed_count += 1
+        # Un solo lote: los embeddings se calculan juntos en el pool de ingesta
+        await rag_system.aadd_documents_batch([
+            {"content": doc.content, "metadata": doc.metadata or {}} for doc in documents
+        ])
+        processed_count = len(documents)
         
         return {
             "status": "success",
@@ -59,6 +63,8 @@ async def upload_json_documents(documents: List[Document]):
             "message": f"{processed_count} documentos procesados"
         }
         
+    except ExecutorBusy:
+        raise HTTPException(status_code=503, detail="Servidor ocupado, inténtalo de nuevo", headers={"Retry-After": "1"})
     except Exception as e:
         logger.error(f"Error subiendo documentos JSON: {e}")
         raise HTTPException(status_code=500, detail="Error procesando documentos")
@@ -67,14 +73,8 @@ async def upload_json_documents(documents: List[Document]):
 async def search_documents(query: str, top_k: int = 5):
     """Buscar directamente en documentos"""
     try:
-        from rag.embeddings import EmbeddingModel
-        from rag.retriever import VectorStore
-        
-        embedder = EmbeddingModel()
-        vector_store = VectorStore()
-        
-        query_embedding = embedder.embed_text(query).tolist()
-        results = vector_store.search_documents(query_embedding, top_k=top_k)
+        query_embedding = await rag_system.query_executor.run(rag_system.embedder.embed_text, query)
+        results = await rag_system.query_executor.run(rag_system.vector_store.search_documents, query_embedding, top_k=top_k)
         
         # Formatear resultados
         formatted_results = []
@@ -84,7 +84,7 @@ async def search_documents(query: str, top_k: int = 5):
                     "rank": i + 1,
                     "content_preview": doc[:200] + "..." if len(doc) > 200 else doc,
                     "metadata": metadata,
-                    "similarity": 1 - (results['distances'][0][i] if results['distances'] else 0)
+                    "similarity": results['similarities'][0][i]
                 })
         
         return {
@@ -93,6 +93,8 @@ async def search_documents(query: str, top_k: int = 5):
             "count": len(formatted_results)
         }
         
+    except ExecutorBusy:
+        raise HTTPException(status_code=503, detail="Servidor ocupado, inténtalo de nuevo", headers={"Retry-After": "1"})
     except Exception as e:
         logger.error(f"Error buscando documentos: {e}")
         raise HTTPException(status_code=500, detail="Error buscando documentos")
\ No newline at end of file
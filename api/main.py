@@ -1,15 +1,17 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import Depends, FastAPI, Header, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse, FileResponse
 from fastapi.staticfiles import StaticFiles
 import logging
 import uuid
 from datetime import datetime
+from typing import Optional
 import os
 
 from config.settings import settings, print_config_summary
-from config.models import ChatRequest, ChatResponse, FeedbackRequest
+from config.models import ChatRequest, ChatResponse, FeedbackRequest, IntentRequest, PatternRequest
 from rag.core import RAGSystem
+from rag.executors import ExecutorBusy
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
@@ -56,6 +58,16 @@ async def startup_event():
     except Exception as e:
         logger.error(f"❌ Error inicializando RAG: {e}")
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Terminar las tareas en curso y detener los pools"""
+    rag_system.close()
+
+def server_busy(e: ExecutorBusy) -> HTTPException:
+    """503 con Retry-After cuando la cola de un pool está llena"""
+    logger.warning(f"⏳ {e}")
+    return HTTPException(status_code=503, detail="Servidor ocupado, inténtalo de nuevo", headers={"Retry-After": "1"})
+
 @app.get("/")
 async def root():
     """Servir la interfaz web principal"""
@@ -99,8 +111,8 @@ async def chat(request: ChatRequest):
         user_id = request.user_id or str(uuid.uuid4())
         conversation_id = request.conversation_id or str(uuid.uuid4())
         
-        # Procesar consulta
-        response_text, is_rag, confidence, sources = rag_system.process_query(
+        # Procesar consulta (en el pool de consultas: el event loop sigue atendiendo)
+        response_text, is_rag, confidence, sources = await rag_system.aprocess_query(
             request.message
         )
         
@@ -143,6 +155,8 @@ async def chat(request: ChatRequest):
             headers=headers
         )
         
+    except ExecutorBusy as e:
+        raise server_busy(e)
     except Exception as e:
         logger.error(f"❌ Error en chat endpoint: {e}")
         raise HTTPException(status_code=500, detail="Error procesando la consulta")
@@ -217,6 +231,70 @@ async def get_rag_stats():
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def require_admin(x_admin_key: Optional[str] = Header(None)):
+    """Exigir la clave de administración (ADMIN_API_KEY)"""
+    if not settings.ADMIN_API_KEY:
+        raise HTTPException(status_code=403, detail="Administración desactivada: define ADMIN_API_KEY")
+    if x_admin_key != settings.ADMIN_API_KEY:
+        raise HTTPException(status_code=401, detail="Clave de administración inválida")
+
+@app.post("/admin/intents/reload", dependencies=[Depends(require_admin)])
+async def reload_intents(force: bool = False):
+    """Recompilar los intents desde su archivo (las búsquedas siguen con los anteriores mientras tanto)"""
+    try:
+        reloaded = await rag_system.ingest_executor.run(rag_system.vector_store.reload_intents, force)
+        return {"status": "success", "reloaded": reloaded}
+    except ExecutorBusy as e:
+        raise server_busy(e)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.put("/admin/intents", dependencies=[Depends(require_admin)])
+async def upsert_intent(request: IntentRequest):
+    """Añadir un intent o sustituir el que tenga el mismo tag"""
+    try:
+        await rag_system.ingest_executor.run(rag_system.vector_store.upsert_intent, request.dict())
+        return {"status": "success", "tag": request.tag}
+    except ExecutorBusy as e:
+        raise server_busy(e)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.delete("/admin/intents/{tag}", dependencies=[Depends(require_admin)])
+async def delete_intent(tag: str):
+    """Eliminar un intent"""
+    try:
+        await rag_system.ingest_executor.run(rag_system.vector_store.remove_intent, tag)
+        return {"status": "success", "tag": tag}
+    except ExecutorBusy as e:
+        raise server_busy(e)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=e.args[0])
+
+@app.post("/admin/intents/{tag}/patterns", dependencies=[Depends(require_admin)])
+async def add_intent_pattern(tag: str, request: PatternRequest):
+    """Añadir un patrón a un intent"""
+    try:
+        await rag_system.ingest_executor.run(rag_system.vector_store.add_intent_pattern, tag, request.pattern)
+        return {"status": "success", "tag": tag, "pattern": request.pattern}
+    except ExecutorBusy as e:
+        raise server_busy(e)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=e.args[0])
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.delete("/admin/intents/{tag}/patterns", dependencies=[Depends(require_admin)])
+async def delete_intent_pattern(tag: str, pattern: str):
+    """Quitar un patrón de un intent"""
+    try:
+        await rag_system.ingest_executor.run(rag_system.vector_store.remove_intent_pattern, tag, pattern)
+        return {"status": "success", "tag": tag, "pattern": pattern}
+    except ExecutorBusy as e:
+        raise server_busy(e)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=e.args[0])
+
 if __name__ == "__main__":
     import uvicorn
     logger.info(f"🚀 Iniciando servidor en {settings.API_HOST}:{settings.API_PORT}")
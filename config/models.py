@@ -20,4 +20,13 @@ class FeedbackRequest(BaseModel):
 
 class Document(BaseModel):
     content: str
-    metadata: Dict[str, Any]
\ No newline at end of file
+    metadata: Dict[str, Any]
+
+class IntentRequest(BaseModel):
+    tag: str
+    patterns: List[str] = []
+    responses: List[str] = []
+    context: str = ""
+
+class PatternRequest(BaseModel):
+    pattern: str
@@ -18,6 +18,11 @@ class Settings(BaseSettings):
     API_PORT: int = 8000
     API_WORKERS: int = 4
     API_RELOAD: bool = True
+    ADMIN_API_KEY: Optional[str] = None  # Clave de los endpoints /admin (sin clave quedan desactivados)
+    QUERY_WORKERS: int = Field(default=4, ge=1)     # Hilos para consultas (embedding, búsqueda y QA)
+    QUERY_QUEUE_SIZE: int = Field(default=64, ge=0)  # Consultas en espera antes de responder 503
+    INGEST_WORKERS: int = Field(default=1, ge=1)     # Hilos para ingesta y cambios de intents
+    INGEST_QUEUE_SIZE: int = Field(default=8, ge=0)  # Ingestas en espera antes de responder 503
     
     # ===== RAG CORE CONFIGURATION =====
     # Pipeline principal
@@ -27,7 +32,17 @@ class Settings(BaseSettings):
     # Búsqueda y recuperación
     TOP_K_RESULTS: int = Field(default=5, ge=1, le=10)
     SIMILARITY_THRESHOLD: float = Field(default=0.75, ge=0.1, le=1.0)
+    RANGE_SEARCH_ENABLED: bool = False  # Solo devolver documentos con similitud >= SIMILARITY_THRESHOLD (desactivado = top-k)
     MAX_CONTEXT_LENGTH: int = 4000  # Tokens máximos para contexto
+    EXACT_MATCH_FIELDS: List[str] = ["folio", "codigo_respuesta"]  # Identificadores con respuesta directa
+    KEYWORD_FIELDS: List[str] = ["palabras_clave", "codigo_respuesta"]  # Índice invertido de palabras clave
+    KEYWORD_DIRECT_MIN_MATCHES: int = 2  # Palabras clave para responder sin embeddings (0 = nunca)
+    HYBRID_SEARCH_ENABLED: bool = True  # Combinar BM25 y FAISS con reciprocal rank fusion
+    RRF_K: int = 60                     # Constante k de RRF
+    BM25_PREFILTER_MIN_DOCS: int = 50000    # Documentos a partir de los que BM25 prefiltra candidatos
+    BM25_PREFILTER_CANDIDATES: int = 1000   # Candidatos BM25 puntuados con el embedding
+    DEDUP_MODE: str = "tag"  # Casi duplicados al ingerir: "tag" (se guardan marcados), "collapse" u "off"
+    DEDUP_THRESHOLD: float = Field(default=0.85, ge=0.5, le=1.0)  # Jaccard estimado (MinHash)
     
     # ===== EMBEDDING MODEL CONFIGURATION =====
     EMBEDDING_MODEL: str = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
@@ -40,12 +55,27 @@ class Settings(BaseSettings):
     VECTOR_STORE_TYPE: str = "faiss"  # "faiss", "chroma", "pinecone"
     
     # FAISS específico
-    FAISS_INDEX_TYPE: str = "FlatL2"  # "FlatL2", "IVFFlat", "IVFPQ"
+    FAISS_INDEX_TYPE: str = "FlatL2"  # "FlatL2", "IVFFlat", "IVFPQ", "HNSW"
     FAISS_METRIC: str = "cosine"      # "cosine", "l2", "inner_product"
     FAISS_NLIST: int = 100  # Para índices IVF (opcional)
     FAISS_NPROBE: int = 10  # Para búsquedas IVF (opcional)
+    FAISS_HNSW_M: int = 32  # Vecinos por nodo en HNSW
+    FAISS_PQ_M: int = 48    # Subcuantizadores para IVFPQ (debe dividir 384)
+    FAISS_SHARD_KEY: Optional[str] = None  # Campo de metadatos para particionar (p. ej. "categoria")
+    EMBEDDING_MATRIX_DTYPE: str = "float32"  # Copia de los vectores en embeddings.npy ("float32" o "float16")
+    QUERY_ROUTING_ENABLED: bool = True     # Dirigir consultas al shard de su centroide más cercano
+    ROUTING_MIN_MARGIN: float = 0.05       # Ventaja mínima del primer centroide sobre el segundo
+    ROUTING_AUDIT_RATE: float = Field(default=0.05, ge=0.0, le=1.0)  # Consultas enrutadas que también se buscan globalmente
+
+    # Índice delta (los documentos nuevos no reentrenan el índice principal)
+    DELTA_MAX_SIZE: int = 1000             # Vectores en el delta antes de volcar
+    DELTA_MAX_AGE_SECONDS: int = 300       # Antigüedad máxima del delta
+    DELTA_MERGE_CHECK_SECONDS: float = 5.0  # Intervalo del hilo de volcado (0 = desactivado)
 
     FAISS_PERSIST_DIR: str = "./data/vector_store"
+    STORE_LOCK_TIMEOUT_SECONDS: float = 30.0  # Espera máxima por el lock del directorio
+    STORE_REFRESH_SECONDS: float = 1.0        # Cada cuánto comprobar si otro proceso publicó cambios
+    STORE_CHECKPOINT_DOCS: int = 1000         # Documentos en journal.pkl antes de reescribir todos los archivos
     
     # Persistencia
     FAISS_INDEX_PATH: str = "./data/vector_store/faiss_index.bin"
@@ -71,6 +101,12 @@ class Settings(BaseSettings):
     # ===== DOCUMENT PROCESSING =====
     CHUNK_SIZE: int = Field(default=768, ge=128, le=2048)
     CHUNK_OVERLAP: int = Field(default=128, ge=0, le=512)
+    CHUNKING_ENABLED: bool = True  # Partir documentos largos en fragmentos de CHUNK_SIZE tokens
+    
+    # Almacenamiento de textos (comprimidos con diccionario entrenado)
+    DOC_COMPRESSION_LEVEL: int = Field(default=6, ge=1, le=9)
+    DOC_DICT_TRAIN_MIN_DOCS: int = 200  # Documentos para entrenar el diccionario
+    DOC_CACHE_SIZE: int = 256           # Documentos descomprimidos en caché LRU
     
     # Procesamiento de Excel
     EXCEL_SHEET_NAMES: List[str] = ["Sheet1", "Tickets", "Respuestas"]
@@ -80,6 +116,13 @@ class Settings(BaseSettings):
     INTENTS_FILE_PATH: str = "./data/vector_store/intents.json"
     INTENTS_MIN_CONFIDENCE: float = 0.95  # Confianza mínima para usar intents
     INTENTS_MAX_QUERY_LENGTH: int = 50    # Longitud máxima para considerar intents
+    INTENT_SEMANTIC_ENABLED: bool = True  # Codificar patrones y comparar con el embedding de la consulta
+    INTENT_SEMANTIC_MIN_SIMILARITY: float = 0.8  # Coseno mínimo para una coincidencia semántica (más bajo desvía preguntas de RAG a intents)
+    TYPO_CORRECTION_ENABLED: bool = True  # Corregir errores de tecleo antes del matching de intents
+    TYPO_MAX_EDIT_DISTANCE: int = 2  # Distancia de edición máxima de una corrección
+    TYPO_PREFIX_LENGTH: int = 7      # Caracteres por palabra usados en el índice de borrados
+    INTENTS_WATCH_SECONDS: float = 2.0  # Sondeo del archivo de intents para recargarlo (0 = desactivado)
+    INTENT_MAX_PENDING_CHANGES: int = 32  # Cambios sueltos antes de recompilar los intents en segundo plano
     
     # ===== MONITORING & LOGGING =====
     ENABLE_METRICS: bool = True
@@ -90,6 +133,10 @@ class Settings(BaseSettings):
     ENABLE_CACHE: bool = True
     CACHE_TTL_SECONDS: int = 300  # 5 minutos
     CACHE_MAX_SIZE: int = 1000
+    SEMANTIC_CACHE_ENABLED: bool = True  # Reutilizar la respuesta RAG de una pregunta casi igual
+    SEMANTIC_CACHE_MIN_SIMILARITY: float = Field(default=0.95, ge=0.0, le=1.0)  # Similitud coseno mínima con la pregunta guardada
+    SEMANTIC_CACHE_MAX_SIZE: int = 500   # Preguntas guardadas (expulsión LRU)
+    SEMANTIC_CACHE_AUDIT_RATE: float = Field(default=0.05, ge=0.0, le=1.0)  # Aciertos que se recalculan para medir falsos aciertos
     
     # ===== SECURITY =====
     ENABLE_RATE_LIMITING: bool = False
@@ -102,6 +149,11 @@ class Settings(BaseSettings):
     AWS_REGION: Optional[str] = "us-east-1"
     S3_BUCKET: Optional[str] = None
     S3_VECTOR_STORE_PATH: Optional[str] = None
+    OBJECT_STORE_DIR: Optional[str] = None  # Directorio usado como almacén de objetos si no hay S3
+    SNAPSHOT_SEGMENT_SIZE: int = 256        # Documentos por segmento de snapshot
+    SNAPSHOT_PULL_ON_START: bool = False    # Descargar el último snapshot si el almacén local está vacío
+    SNAPSHOT_PREFETCH: bool = True          # Descargar en segundo plano los segmentos pendientes
+    SNAPSHOT_SIGNING_KEY: Optional[str] = None  # Clave HMAC de los manifiestos (sin clave no se publica ni descarga)
     
     # ===== RENDER/DEPLOYMENT =====
     RENDER_DEPLOYMENT: bool = False
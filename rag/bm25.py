@@ -0,0 +1,192 @@
+"""
+Índice BM25 en memoria para términos literales (CURP, correos, números de módulo)
+"""
+import copy
+import math
+from array import array
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from .text import words
+
+# Palabras vacías frecuentes en español (ya sin acentos)
+SPANISH_STOPWORDS = frozenset("""
+a al algo algun alguna algunas alguno algunos ante antes como con contra cual cuando de del desde donde
+durante e el ella ellas ellos en entre era eres es esa esas ese eso esos esta estaba estan estar estas este
+esto estos fue fueron ha habia han hay la las le les lo los me mi mis mucho muy nada ni no nos o os otra
+otro para pero poco por porque que quien se sea ser si sin sobre son su sus tambien te tengo ti tiene
+todo todos tu tus un una uno unos y ya yo mas hola buen buenas buenos dias tardes
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    """Términos BM25 de un texto en español"""
+    return terms_from_words(words(text))
+
+
+def terms_from_words(text_words: Sequence[str]) -> List[str]:
+    """
+    Términos BM25 a partir de las palabras ya normalizadas (text.words).
+
+    Se quitan palabras vacías y el plural simple ("correos" → "correo").
+    Los términos compuestos (correos, dominios, folios) se conservan enteros
+    y además se indexan sus partes, de modo que "@prepaenlinea-sep.edu.mx"
+    encuentra "alumno@prepaenlinea-sep.edu.mx".
+    """
+    terms = []
+    for word in text_words:
+        if word in SPANISH_STOPWORDS:
+            continue
+        if word.isalpha():
+            if len(word) > 3 and word.endswith("s"):
+                word = word[:-1]
+            terms.append(word)
+            continue
+        terms.append(word)
+        if "@" in word:
+            terms.append(word.split("@", 1)[1])
+        for part in word.replace("@", " ").replace(".", " ").replace("-", " ").replace("_", " ").split():
+            if part != word and part not in SPANISH_STOPWORDS:
+                terms.append(part)
+    return terms
+
+
+class BM25Index:
+    """
+    Índice invertido BM25 con altas incrementales y bajas por tombstone.
+
+    Las listas de postings son arrays que solo crecen (posiciones en orden),
+    así que las búsquedas leen sin bloqueo mientras un escritor añade. Los
+    documentos borrados se excluyen del cálculo y del resultado.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, Tuple[array, array]] = {}  # término → (posiciones, frecuencias)
+        self._lengths = array('i')  # Términos por documento (por posición)
+        self._total_length = 0
+        self._removed: Set[int] = set()
+
+    def __len__(self) -> int:
+        """Documentos indexados (incluye borrados: coincide con las posiciones)"""
+        return len(self._lengths)
+
+    @property
+    def live_documents(self) -> int:
+        return len(self._lengths) - len(self._removed)
+
+    def vocabulary(self, start: int = 0) -> List[Tuple[str, int]]:
+        """Términos indexados con su frecuencia de documento, en orden de alta (desde 'start')"""
+        if start >= len(self._postings):
+            return []
+        return [(term, len(postings[0])) for term, postings in list(self._postings.items())[start:]]
+
+    def add(self, position: int, text: str):
+        """Indexar el documento de la posición siguiente"""
+        if position != len(self._lengths):
+            raise ValueError(f"BM25 espera la posición {len(self._lengths)}, no {position}")
+
+        counts = Counter(tokenize(text))
+        for term, tf in counts.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = (array('i'), array('i'))
+                self._postings[term] = postings
+            postings[0].append(position)
+            postings[1].append(tf)
+        length = sum(counts.values())
+        self._lengths.append(length)
+        self._total_length += length
+
+    def add_many(self, texts: Iterable[str]):
+        for text in texts:
+            self.add(len(self._lengths), text)
+
+    def remove(self, positions: Iterable[int]):
+        """Excluir documentos (sus postings se ignoran en adelante); un solo conjunto nuevo por lote"""
+        new = {p for p in positions if p < len(self._lengths)} - self._removed
+        if new:
+            self._removed = self._removed | new
+            self._total_length -= sum(self._lengths[p] for p in new)
+
+    def without(self, positions: Iterable[int]) -> "BM25Index":
+        """
+        Copia con esos documentos excluidos; esta instancia no cambia.
+
+        Los postings y longitudes se comparten: solo crecen, y cada
+        instantánea lee hasta su tamaño.
+        """
+        index = copy.copy(self)
+        index.remove(positions)
+        return index
+
+    def scores(self, query_text: str, size: Optional[int] = None,
+               query_words: Optional[Sequence[str]] = None) -> np.ndarray:
+        """
+        Puntuación BM25 de cada posición para la consulta.
+
+        Args:
+            query_text: Consulta
+            size: Posiciones visibles (por defecto todas las indexadas)
+            query_words: Palabras de la consulta ya normalizadas (evita volver a tokenizarla)
+
+        Returns:
+            Array float32 de longitud 'size' (0 = sin coincidencias)
+        """
+        size = len(self._lengths) if size is None else size
+        scores = np.zeros(size, dtype='float32')
+        n_docs = self.live_documents
+        if n_docs <= 0 or size == 0:
+            return scores
+
+        avg_length = max(self._total_length / n_docs, 1.0)
+        lengths = np.array(self._lengths[:size], dtype='float32')
+        query_terms = terms_from_words(query_words) if query_words is not None else tokenize(query_text)
+        for term, query_tf in Counter(query_terms).items():
+            postings = self._postings.get(term)
+            if postings is None:
+                continue
+            # Las frecuencias se añaden después de la posición: leerlas primero
+            tfs = np.array(postings[1], dtype='float32')
+            positions = np.array(postings[0][:len(tfs)], dtype=np.int64)
+            visible = positions < size
+            positions, tfs = positions[visible], tfs[visible]
+            if len(positions) == 0:
+                continue
+
+            idf = math.log(1.0 + (n_docs - len(positions) + 0.5) / (len(positions) + 0.5))
+            norm = self.k1 * (1.0 - self.b + self.b * lengths[positions] / avg_length)
+            np.add.at(scores, positions, query_tf * idf * tfs * (self.k1 + 1.0) / (tfs + norm))
+
+        if self._removed:
+            removed = [p for p in self._removed if p < size]
+            scores[removed] = 0.0
+        return scores
+
+    def search(self, query_text: str, top_k: int, size: Optional[int] = None,
+               query_words: Optional[Sequence[str]] = None,
+               positions: Optional[Sequence[int]] = None) -> List[Tuple[float, int]]:
+        """
+        Mejores documentos por BM25.
+
+        Args:
+            positions: Solo estas posiciones son candidatas (p. ej. las de un shard)
+
+        Returns:
+            Pares (puntuación, posición) de mayor a menor, solo puntuaciones > 0
+        """
+        scores = self.scores(query_text, size, query_words)
+        if positions is not None:
+            allowed = np.asarray(positions, dtype=np.int64)
+            allowed = allowed[allowed < len(scores)]
+            restricted = np.zeros_like(scores)
+            restricted[allowed] = scores[allowed]
+            scores = restricted
+        hits = np.flatnonzero(scores > 0)
+        if len(hits) > top_k:
+            hits = hits[np.argpartition(-scores[hits], top_k - 1)[:top_k]]
+        order = hits[np.argsort(-scores[hits], kind='stable')]
+        return [(float(scores[idx]), int(idx)) for idx in order]
@@ -0,0 +1,170 @@
+"""
+Paquete portable del almacén vectorial (sin pickles) para moverlo entre nodos
+"""
+import gzip
+import hashlib
+import json
+import logging
+import os
+from datetime import datetime
+from itertools import islice
+from typing import Any, Dict, Iterator, List
+
+import numpy as np
+
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+BUNDLE_FORMAT = 1
+MANIFEST_NAME = "manifest.json"
+VECTORS_NAME = "vectors.npy"
+METADATA_NAME = "metadata.jsonl"
+DOCUMENTS_NAME = "documents.jsonl.gz"
+INTENTS_NAME = "intents.json"
+
+_HASH_CHUNK = 1 << 20
+
+
+def file_checksum(path: str) -> str:
+    """sha256 de un archivo leído por bloques"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def export_bundle(store, directory: str, batch_size: int = 1000) -> Dict[str, Any]:
+    """
+    Escribir el almacén como paquete portable.
+
+    Formato: vectors.npy (matriz alineada con las líneas), metadata.jsonl,
+    documents.jsonl.gz (textos) e intents.json, más un manifiesto con el
+    modelo de embeddings y el sha256 de cada archivo. Los documentos
+    borrados no se exportan. Todo se escribe por lotes, así que la memoria
+    usada no depende del tamaño del almacén.
+
+    Args:
+        store: VectorStoreFAISS de origen
+        directory: Directorio destino (se crea si no existe)
+        batch_size: Documentos por lote
+
+    Returns:
+        Manifiesto escrito
+    """
+    store.refresh(force=True)
+    snapshot = store.snapshot()
+    embeddings = store.embeddings
+    if len(embeddings) < snapshot.size:
+        raise ValueError(f"Hay {snapshot.size} documentos y solo {len(embeddings)} vectores: "
+                         f"no se puede exportar sin volver a codificar")
+
+    os.makedirs(directory, exist_ok=True)
+    positions = [idx for idx in range(snapshot.size) if idx not in snapshot.deleted]
+
+    vectors = np.lib.format.open_memmap(os.path.join(directory, VECTORS_NAME), mode='w+',
+                                        dtype=embeddings.dtype, shape=(len(positions), store.embedding_dim))
+    with open(os.path.join(directory, METADATA_NAME), 'w', encoding='utf-8') as meta_file, \
+            gzip.open(os.path.join(directory, DOCUMENTS_NAME), 'wt', encoding='utf-8') as doc_file:
+        for start in range(0, len(positions), batch_size):
+            batch = positions[start:start + batch_size]
+            vectors[start:start + len(batch)] = embeddings.vectors(batch)
+            for idx in batch:
+                record = snapshot.metadata[idx]
+                record.pop("doc_index", None)
+                meta_file.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+                doc_file.write(json.dumps(snapshot.documents[idx], ensure_ascii=False) + "\n")
+    vectors.flush()
+    del vectors
+
+    with open(os.path.join(directory, INTENTS_NAME), 'w', encoding='utf-8') as f:
+        json.dump(store.intents or {"intents": []}, f, ensure_ascii=False, indent=2)
+
+    names = (VECTORS_NAME, METADATA_NAME, DOCUMENTS_NAME, INTENTS_NAME)
+    manifest = {
+        "format": BUNDLE_FORMAT,
+        "created_at": datetime.now().isoformat(),
+        "embedding_model": settings.EMBEDDING_MODEL,
+        "embedding_dim": store.embedding_dim,
+        "dtype": embeddings.dtype.name,
+        "documents": len(positions),
+        "files": {
+            name: {
+                "sha256": file_checksum(os.path.join(directory, name)),
+                "bytes": os.path.getsize(os.path.join(directory, name))
+            }
+            for name in names
+        }
+    }
+    with open(os.path.join(directory, MANIFEST_NAME), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+
+    logger.info(f"Paquete exportado en {directory}: {len(positions)} documentos")
+    return manifest
+
+
+def read_bundle_manifest(directory: str, verify: bool = True) -> Dict[str, Any]:
+    """
+    Leer y validar el manifiesto de un paquete.
+
+    Raises:
+        ValueError: Formato desconocido, checksum distinto o modelo incompatible
+    """
+    with open(os.path.join(directory, MANIFEST_NAME), 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    if manifest.get("format") != BUNDLE_FORMAT:
+        raise ValueError(f"Formato de paquete no soportado: {manifest.get('format')}")
+
+    if verify:
+        for name, info in manifest["files"].items():
+            if file_checksum(os.path.join(directory, name)) != info["sha256"]:
+                raise ValueError(f"Checksum distinto en {name}: paquete dañado o incompleto")
+
+    if manifest["embedding_model"] != settings.EMBEDDING_MODEL:
+        logger.warning(f"El paquete usa el modelo '{manifest['embedding_model']}' y la configuración "
+                       f"'{settings.EMBEDDING_MODEL}': las consultas no serán comparables")
+    return manifest
+
+
+def _batches(iterator: Iterator[str], size: int) -> Iterator[List[str]]:
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def iter_bundle(directory: str, manifest: Dict[str, Any], batch_size: int = 1000):
+    """
+    Recorrer el paquete por lotes.
+
+    Yields:
+        (documentos con 'content' y 'metadata', vectores float32 del lote)
+    """
+    vectors = np.load(os.path.join(directory, VECTORS_NAME), mmap_mode='r', allow_pickle=False)
+    if vectors.shape != (manifest["documents"], manifest["embedding_dim"]):
+        raise ValueError(f"vectors.npy tiene forma {vectors.shape}, el manifiesto indica "
+                         f"({manifest['documents']}, {manifest['embedding_dim']})")
+
+    start = 0
+    with open(os.path.join(directory, METADATA_NAME), 'r', encoding='utf-8') as meta_file, \
+            gzip.open(os.path.join(directory, DOCUMENTS_NAME), 'rt', encoding='utf-8') as doc_file:
+        for meta_lines in _batches(meta_file, batch_size):
+            doc_lines = list(islice(doc_file, len(meta_lines)))
+            if len(doc_lines) != len(meta_lines):
+                raise ValueError("documents.jsonl.gz y metadata.jsonl tienen distinto número de líneas")
+            documents = [
+                {"content": json.loads(doc_line), "metadata": json.loads(meta_line)}
+                for doc_line, meta_line in zip(doc_lines, meta_lines)
+            ]
+            yield documents, np.asarray(vectors[start:start + len(documents)], dtype='float32')
+            start += len(documents)
+
+    if start != manifest["documents"]:
+        raise ValueError(f"El paquete contiene {start} documentos, el manifiesto indica {manifest['documents']}")
+
+
+def read_bundle_intents(directory: str) -> Dict[str, Any]:
+    with open(os.path.join(directory, INTENTS_NAME), 'r', encoding='utf-8') as f:
+        return json.load(f)
@@ -0,0 +1,162 @@
+"""
+División de documentos en fragmentos por tokens del modelo de embeddings
+"""
+import hashlib
+import logging
+import re
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Metadatos que relacionan un fragmento con su documento
+CHUNK_FIELDS = ("parent_id", "chunk_index", "chunk_count", "chunk_start")
+
+# Encabezados de sección en mayúsculas al inicio de línea ("ASUNTO:", "RESPUESTA INSTITUCIONAL:")
+_SECTION_PATTERN = re.compile(r"^[A-ZÁÉÍÓÚÜÑ][A-ZÁÉÍÓÚÜÑ ]{2,}:", re.MULTILINE)
+# Fin de oración (con su espacio) o salto de línea
+_SENTENCE_END = re.compile(r"[.!?…]+[\"')\]]*\s+|\n+")
+_WORD = re.compile(r"\S+\s*")
+
+
+@dataclass(frozen=True)
+class Chunk:
+    """Fragmento de un texto: text == original[start:start + len(text)]"""
+    text: str
+    start: int
+    index: int
+
+
+class TokenChunker:
+    """
+    Fragmentos de hasta chunk_size tokens contados con el tokenizador del modelo.
+
+    Se corta entre oraciones y se prefiere empezar fragmento en un encabezado
+    de sección (ASUNTO/DESCRIPCIÓN/RESPUESTA); una oración más larga que el
+    fragmento se corta entre palabras. Cada fragmento repite las últimas
+    oraciones del anterior (hasta chunk_overlap tokens) salvo al empezar
+    sección. Los fragmentos son trozos contiguos del original, así que el
+    documento se puede recomponer a partir de sus posiciones.
+    """
+
+    def __init__(self, count_tokens: Callable[[List[str]], List[int]], chunk_size: int,
+                 chunk_overlap: int, max_tokens: Optional[int] = None):
+        """
+        Args:
+            count_tokens: Textos → número de tokens de cada uno (sin tokens especiales)
+            chunk_size: Tokens máximos por fragmento
+            chunk_overlap: Tokens repetidos del fragmento anterior
+            max_tokens: Tokens que lee el modelo; si chunk_size es mayor se reduce
+                (manteniendo la proporción de solapamiento), porque el resto se truncaría
+        """
+        if max_tokens is not None and chunk_size > max_tokens:
+            logger.info(f"CHUNK_SIZE {chunk_size} supera los {max_tokens} tokens del modelo: "
+                        f"se usan fragmentos de {max_tokens}")
+            chunk_overlap = chunk_overlap * max_tokens // chunk_size
+            chunk_size = max_tokens
+        if chunk_overlap >= chunk_size:
+            raise ValueError(f"chunk_overlap ({chunk_overlap}) debe ser menor que chunk_size ({chunk_size})")
+        self.count_tokens = count_tokens
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+
+    def split(self, text: str) -> List[Chunk]:
+        """Fragmentos del texto en orden (uno solo si cabe entero)"""
+        units = self._units(text)
+        if not units:
+            return []
+        counts = self.count_tokens([text[start:end] for start, end, _ in units])
+        units, counts = self._split_long(text, units, counts)
+
+        groups, current, tokens = [], [], 0
+        for i, (_, _, section) in enumerate(units):
+            size = counts[i]
+            if current and (tokens + size > self.chunk_size or (section and tokens >= self.chunk_size // 2)):
+                groups.append(current)
+                # Solapamiento: últimas unidades del fragmento anterior (no al cambiar de sección)
+                carry, carried = [], 0
+                if not section:
+                    for j in reversed(current):
+                        if carried + counts[j] > self.chunk_overlap or carried + counts[j] + size > self.chunk_size:
+                            break
+                        carry.insert(0, j)
+                        carried += counts[j]
+                current, tokens = carry, carried
+            current.append(i)
+            tokens += size
+        groups.append(current)
+
+        return [
+            Chunk(text=text[units[group[0]][0]:units[group[-1]][1]], start=units[group[0]][0], index=index)
+            for index, group in enumerate(groups)
+        ]
+
+    def split_document(self, content: str, metadata: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """
+        Documento listo para indexar: él mismo si cabe en un fragmento, o sus
+        fragmentos con los metadatos del documento más CHUNK_FIELDS.
+
+        Returns:
+            Lista de dicts con 'content' y 'metadata'
+        """
+        metadata = metadata or {}
+        chunks = self.split(content)
+        if len(chunks) <= 1:
+            return [{"content": content, "metadata": metadata}]
+
+        parent_id = hashlib.md5(content.encode()).hexdigest()[:12]
+        return [
+            {
+                "content": chunk.text,
+                "metadata": {
+                    **metadata,
+                    "parent_id": parent_id,
+                    "chunk_index": chunk.index,
+                    "chunk_count": len(chunks),
+                    "chunk_start": chunk.start
+                }
+            }
+            for chunk in chunks
+        ]
+
+    @staticmethod
+    def _units(text: str) -> List[Tuple[int, int, bool]]:
+        """Oraciones como (inicio, fin, empieza sección), cubriendo todo el texto"""
+        if not text.strip():
+            return []
+        sections = {match.start() for match in _SECTION_PATTERN.finditer(text)}
+        cuts = {0, len(text)} | sections
+        cuts.update(match.end() for match in _SENTENCE_END.finditer(text))
+        cuts = sorted(cuts)
+        units = []
+        for start, end in zip(cuts, cuts[1:]):
+            if text[start:end].strip():
+                units.append((start, end, start in sections))
+            elif units:
+                # Espacios sueltos: se quedan al final de la oración anterior
+                units[-1] = (units[-1][0], end, units[-1][2])
+        return units
+
+    def _split_long(self, text: str, units: List[Tuple[int, int, bool]],
+                    counts: List[int]) -> Tuple[List[Tuple[int, int, bool]], List[int]]:
+        """Cortar entre palabras las oraciones que no caben en un fragmento"""
+        if all(count <= self.chunk_size for count in counts):
+            return units, counts
+        new_units, new_counts = [], []
+        for (start, end, section), count in zip(units, counts):
+            if count <= self.chunk_size:
+                new_units.append((start, end, section))
+                new_counts.append(count)
+                continue
+            words = [(m.start(), m.end()) for m in _WORD.finditer(text, start, end)]
+            word_counts = self.count_tokens([text[a:b] for a, b in words])
+            piece_start, piece_tokens = words[0][0], 0
+            for (a, b), n in zip(words, word_counts):
+                if piece_tokens and piece_tokens + n > self.chunk_size:
+                    new_units.append((piece_start, a, section and piece_start == start))
+                    new_counts.append(piece_tokens)
+                    piece_start, piece_tokens = a, 0
+                piece_tokens += n
+            new_units.append((piece_start, end, section and piece_start == start))
+            new_counts.append(piece_tokens)
+        return new_units, new_counts
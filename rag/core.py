@@ -2,25 +2,57 @@
 Módulo principal del sistema RAG (Retrieval-Augmented Generation)
 """
 import logging
-from typing import Tuple, Dict, Any, List
+from typing import Tuple, Dict, Any, List, Optional
 import json
 import os
 import random
-import re
+import time
 
 from config.settings import settings
+from .chunking import TokenChunker
 from .embeddings import EmbeddingModel
+from .executors import BoundedExecutor
 from .retriever import VectorStoreFAISS
+from .exact_index import FOLIO_PATTERN
 from .generator import ResponseGenerator
+from .query_analysis import ALWAYS_INTENT_PRIORITIES, QueryAnalysis
+from .response_cache import ResponseCache, SemanticResponseCache
 
 logger = logging.getLogger(__name__)
 
+# Respuesta ante un error del camino RAG (no se guarda en caché)
+RAG_ERROR_RESPONSE = ("Lo siento, tuve un problema procesando tu pregunta. ¿Podrías intentarlo de nuevo?", False, 0.0, [])
+
 class RAGSystem:
     def __init__(self):
         self.embedder = EmbeddingModel()
         self.vector_store = VectorStoreFAISS()  # <-- CORREGIDO
+        # Fragmentos medidos con el tokenizador del modelo (lo que pase de max_tokens se truncaría)
+        self.chunker = TokenChunker(
+            self.embedder.count_tokens,
+            settings.CHUNK_SIZE,
+            settings.CHUNK_OVERLAP,
+            max_tokens=self.embedder.max_tokens
+        ) if settings.CHUNKING_ENABLED else None
         self.generator = ResponseGenerator()
         self.intents_loaded = False
+        # Respuestas completas por consulta limpia, invalidadas al cambiar documentos o intents
+        self.response_cache = ResponseCache(
+            settings.CACHE_MAX_SIZE, settings.CACHE_TTL_SECONDS
+        ) if settings.ENABLE_CACHE else None
+        # Respuestas RAG de preguntas casi iguales (mismo significado, otras palabras)
+        self.semantic_cache = SemanticResponseCache(
+            self.embedder.dimension,
+            min_similarity=settings.SEMANTIC_CACHE_MIN_SIMILARITY,
+            max_size=settings.SEMANTIC_CACHE_MAX_SIZE,
+            ttl_seconds=settings.CACHE_TTL_SECONDS
+        ) if settings.ENABLE_CACHE and settings.SEMANTIC_CACHE_ENABLED else None
+        # Consultas evaluadas contra intents y rescatadas del camino RAG por la corrección
+        self.intent_stats = {"queries": 0, "intent_answers": 0, "typo_rescued": 0}
+
+        # Trabajo con modelos fuera del event loop; la ingesta no quita hilos a las consultas
+        self.query_executor = BoundedExecutor("rag-query", settings.QUERY_WORKERS, settings.QUERY_QUEUE_SIZE)
+        self.ingest_executor = BoundedExecutor("rag-ingest", settings.INGEST_WORKERS, settings.INGEST_QUEUE_SIZE)
 
         self.top_k = settings.TOP_K_RESULTS
         self.similarity_threshold = settings.SIMILARITY_THRESHOLD
@@ -30,7 +62,10 @@ class RAGSystem:
     def load_intents(self, intents_file: str = "data/vector_store/intents.json"):
         """Carga intents al sistema"""
         try:
-            self.vector_store.store_intents(intents_file)
+            # Los patrones se codifican una vez para el matching semántico
+            embed_batch = self.embedder.embed_batch if settings.INTENT_SEMANTIC_ENABLED else None
+            self.vector_store.store_intents(intents_file, embed_batch=embed_batch)
+            self.vector_store.watch_intents(settings.INTENTS_WATCH_SECONDS)
             self.intents_loaded = True
             logger.info("Intents loaded into FAISS vector store")
         except Exception as e:
@@ -52,46 +87,18 @@ class RAGSystem:
                     json.dump(basic_intents, f, ensure_ascii=False, indent=2)
                 logger.info("Created basic intents file")
     
-    def _clean_query(self, query: str) -> str:
-        """
-        Limpiar consulta para mejor matching con intents.
-        """
-        # Quitar signos de puntuación y convertir a minúsculas
-        clean = re.sub(r'[^\w\sáéíóúüñÁÉÍÓÚÜÑ¿?]', '', query.lower())
-        return clean.strip()
-    
-    def _classify_query_type(self, query: str) -> str:
-        """
-        Clasificar el tipo de consulta para decidir prioridad.
-        """
-        query_lower = query.lower()
-        
-        # Palabras clave para intents (saludos, despedidas, etc.)
-        intent_keywords = {
-            'saludo': ['hola', 'buen día', 'buenas', 'saludos', 'qué tal', 'cómo estás'],
-            'despedida': ['adiós', 'hasta luego', 'chao', 'bye', 'nos vemos'],
-            'gracias': ['gracias', 'agradecido', 'agradezco'],
-            'ayuda_general': ['ayuda', 'ayúdame', 'asistencia', 'soporte']
-        }
-        
-        # Verificar si es un intent básico
-        for intent_type, keywords in intent_keywords.items():
-            if any(keyword in query_lower for keyword in keywords):
-                return intent_type
-        
-        # Preguntas técnicas/complejas van a RAG
-        question_words = ['cómo', 'dónde', 'cuándo', 'qué', 'por qué', 'cuál', 'cuánto']
-        if any(query_lower.startswith(word) for word in question_words):
-            return 'rag_preferido'
-        
-        return 'neutral'
+    def analyze_query(self, query: str) -> QueryAnalysis:
+        """Análisis de la consulta compartido por todas las etapas (embedding bajo demanda)"""
+        return QueryAnalysis(query, embed=self.embedder.embed_text)
     
-    def _should_use_intent(self, query: str, intent_results: Dict, intent_priority: str) -> bool:
+    def _should_use_intent(self, analysis: QueryAnalysis, intent_results: Dict) -> bool:
         """
         Decidir si usar intent basado en múltiples criterios.
         """
+        intent_priority = analysis.priority
+        
         # 1. Si es saludo/despedida, SIEMPRE usar intent
-        if intent_priority in ['saludo', 'despedida', 'gracias']:
+        if intent_priority in ALWAYS_INTENT_PRIORITIES:
             return True
         
         # 2. Si no hay resultados de intent, usar RAG
@@ -108,7 +115,7 @@ class RAGSystem:
             return best_distance < 0.3  # Match muy cercano
         
         # Caso general: balancear longitud y calidad
-        if len(query) < 100:  # No demasiado larga
+        if len(analysis.text) < 100:  # No demasiado larga
             # Distancia baja = buen match
             if best_distance < 0.5:  # Ajusta según necesidad
                 return True
@@ -134,26 +141,171 @@ class RAGSystem:
         
         return (response, False, confidence, [])
     
-    def _rag_process(self, query: str) -> Tuple[str, bool, float, list]:
+    def _exact_match_process(self, analysis: QueryAnalysis) -> Optional[Tuple[str, bool, float, list]]:
+        """
+        Responder sin modelos si la consulta contiene un folio o código conocido.
+        
+        Returns:
+            Respuesta completa, o None si no hay identificadores indexados en la consulta
+        """
+        exact_results = self.vector_store.lookup_exact(analysis.text, analysis.key_candidates)
+        if not exact_results['documents'][0]:
+            if any(FOLIO_PATTERN.fullmatch(candidate) for candidate in analysis.key_candidates):
+                logger.info("Folio en la consulta sin coincidencia exacta, se usa el pipeline normal")
+            return None
+        
+        key = exact_results['keys'][0]['value']
+        context = exact_results['documents'][0][0]
+        sources = [
+            {
+                "content_preview": doc[:100] + "..." if len(doc) > 100 else doc,
+                "metadata": metadata
+            }
+            for doc, metadata in zip(exact_results['documents'][0][:2], exact_results['metadatas'][0][:2])
+        ]
+        logger.info(f"Coincidencia exacta para '{key}'")
+        return self.generator.generate_exact_response(key, context), True, 1.0, sources
+    
+    def _is_keyword_answer(self, keyword_results: Dict) -> bool:
+        """
+        El mejor documento por palabras clave es concluyente si cubre al menos
+        KEYWORD_DIRECT_MIN_MATCHES palabras clave y más que el siguiente.
+        """
+        found = keyword_results['keywords'][0]
+        min_matches = settings.KEYWORD_DIRECT_MIN_MATCHES
+        if not found or min_matches <= 0 or len(found[0]) < min_matches:
+            return False
+        return len(found) == 1 or len(found[0]) > len(found[1])
+    
+    @staticmethod
+    def _merge_keyword_hits(doc_results: Dict, keyword_results: Dict, top_k: int) -> Dict:
+        """
+        Combinar resultados vectoriales con coincidencias de palabras clave.
+        
+        Los documentos encontrados por ambas vías pasan al frente; después
+        van el resto de resultados vectoriales y, si queda hueco, los que
+        solo coinciden por palabras clave.
+        """
+        if not keyword_results['documents'][0]:
+            return doc_results
+        
+        keyword_idx = [m.get('doc_index') for m in keyword_results['metadatas'][0]]
+        vector = list(zip(*(doc_results[k][0] for k in ('documents', 'distances', 'similarities', 'metadatas'))))
+        both = [hit for hit in vector if hit[3].get('doc_index') in keyword_idx]
+        vector_only = [hit for hit in vector if hit[3].get('doc_index') not in keyword_idx]
+        vector_idx = {hit[3].get('doc_index') for hit in vector}
+        keyword_only = [
+            hit for hit in zip(*(keyword_results[k][0] for k in ('documents', 'distances', 'similarities', 'metadatas')))
+            if hit[3].get('doc_index') not in vector_idx
+        ]
+        
+        merged = (both + vector_only + keyword_only)[:top_k]
+        return {
+            key: [[hit[i] for hit in merged]]
+            for i, key in enumerate(('documents', 'distances', 'similarities', 'metadatas'))
+        }
+    
+    def _search_documents(self, analysis: QueryAnalysis, query_embedding, shard: Optional[str] = None) -> Dict:
+        """
+        Búsqueda de documentos en un shard o en todos.
+        
+        Top-k por defecto; con RANGE_SEARCH_ENABLED solo vecinos sobre el
+        umbral de similitud. En modo híbrido BM25 aporta además los
+        términos literales.
+        """
+        min_similarity = self.similarity_threshold if settings.RANGE_SEARCH_ENABLED else None
+        if settings.HYBRID_SEARCH_ENABLED:
+            return self.vector_store.search_hybrid(
+                analysis.text,
+                query_embedding,
+                top_k=settings.TOP_K_RESULTS,
+                shard=shard,
+                min_similarity=min_similarity,
+                query_words=analysis.tokens
+            )
+        return self.vector_store.search_documents(
+            query_embedding,
+            top_k=settings.TOP_K_RESULTS,
+            shard=shard,
+            min_similarity=min_similarity
+        )
+    
+    def _routed_search(self, analysis: QueryAnalysis, query_embedding) -> Dict:
+        """
+        Buscar en la partición de la categoría predicha por los centroides.
+        
+        Si la predicción no es clara o la partición no devuelve nada se
+        busca en todos los shards. Una fracción de las consultas enrutadas
+        (ROUTING_AUDIT_RATE) repite la búsqueda vectorial en la partición y
+        en todos los shards para medir la precisión y el ahorro de latencia.
+        """
+        shard = self.vector_store.route_query(query_embedding)
+        if shard is None:
+            return self._search_documents(analysis, query_embedding)
+        
+        doc_results = self._search_documents(analysis, query_embedding, shard=shard)
+        if not doc_results['documents'][0]:
+            logger.info(f"Sin resultados en la categoría '{shard}', búsqueda global")
+            return self._search_documents(analysis, query_embedding)
+        
+        if random.random() < settings.ROUTING_AUDIT_RATE:
+            self._audit_routing(query_embedding, shard)
+        return doc_results
+    
+    def _audit_routing(self, query_embedding, shard: str):
+        """Comparar la búsqueda enrutada con la global (categoría del mejor vecino y latencia)"""
+        timings = {}
+        for target in (shard, None):
+            start = time.perf_counter()
+            results = self.vector_store.search_documents(query_embedding.copy(), top_k=settings.TOP_K_RESULTS,
+                                                         shard=target)
+            timings[target] = (time.perf_counter() - start) * 1000
+        
+        actual = None
+        if results['metadatas'][0]:
+            key = self.vector_store.shard_key
+            actual = self.vector_store.shards.shard_for({key: results['metadatas'][0][0].get(key)})
+        self.vector_store.snapshot().router.record_audit(shard, actual, timings[shard], timings[None])
+    
+    def _rag_process(self, analysis: QueryAnalysis) -> Tuple[str, bool, float, list]:
         """
         Procesar consulta usando RAG (para preguntas técnicas/complejas).
+        
+        Args:
+            analysis: Consulta analizada (su embedding se reutiliza si la etapa de intents ya lo calculó)
         """
+        query = analysis.text
+        cached = version = None
         try:
-            # 1. Generar embedding de la consulta
-            query_embedding = self.embedder.embed_text(query)
-            
-            # 2. Buscar documentos relevantes
-            doc_results = self.vector_store.search_documents(
-                query_embedding, 
-                top_k=settings.TOP_K_RESULTS
-            )
+            # 0. Palabras clave curadas: respuesta directa sin embeddings si son concluyentes
+            keyword_results = self.vector_store.search_keywords(query, top_k=settings.TOP_K_RESULTS,
+                                                                query_words=analysis.tokens)
+            if self._is_keyword_answer(keyword_results):
+                logger.info(f"Respuesta por palabras clave: {keyword_results['keywords'][0][0]}")
+                doc_results = keyword_results
+            else:
+                # 1. Embedding de la consulta (calculado aquí si la etapa de intents no lo hizo)
+                query_embedding = analysis.embedding
+                
+                # 1b. Respuesta de una pregunta casi igual: sin búsqueda ni generación
+                if self.semantic_cache is not None:
+                    version = self.vector_store.data_version()
+                    cached = self.semantic_cache.get(query_embedding, version)
+                    if cached is not None and random.random() >= settings.SEMANTIC_CACHE_AUDIT_RATE:
+                        logger.info(f"Respuesta de la caché semántica para: '{query[:50]}'")
+                        return cached
+                
+                # 2. Buscar documentos relevantes (en la categoría predicha si es clara)
+                doc_results = self._routed_search(analysis, query_embedding)
+                doc_results = self._merge_keyword_hits(doc_results, keyword_results, settings.TOP_K_RESULTS)
             
             # 3. Verificar si hay documentos relevantes
             if (not doc_results['documents'] or 
                 not doc_results['documents'][0] or
                 len(doc_results['documents'][0]) == 0):
                 
-                # No hay documentos relevantes
+                # No hay documentos relevantes: se omite el generador
+                logger.info(f"Sin documentos sobre el umbral {self.similarity_threshold}, respuesta de fallback")
                 fallback_responses = [
                     "No encontré información específica sobre eso en los materiales. ¿Podrías ser más específico?",
                     "Esa pregunta parece estar fuera del alcance del módulo actual. ¿Hay algo más sobre el módulo en lo que pueda ayudarte?",
@@ -177,18 +329,28 @@ class RAGSystem:
                     }
                     sources.append(source_info)
             
-            # 6. Calcular confianza basada en distancia (convertir a similitud)
+            # 6. Confianza = similitud coseno del mejor documento
             confidence = 0.0
-            if doc_results['distances'] and doc_results['distances'][0]:
-                # Convertir distancia L2 a similitud aproximada
-                distance = doc_results['distances'][0][0]
-                confidence = 1 / (1 + distance) if distance > 0 else 1.0
+            if doc_results['similarities'] and doc_results['similarities'][0]:
+                confidence = max(0.0, doc_results['similarities'][0][0])
             
-            return response, True, confidence, sources
+            result = (response, True, confidence, sources)
+            if version is not None:
+                if cached is None:
+                    self.semantic_cache.put(query_embedding, version, result)
+                else:
+                    # Acierto auditado: falso si las fuentes de la respuesta guardada son otras
+                    self.semantic_cache.record_audit(self._source_ids(cached[3]) != self._source_ids(sources))
+            return result
             
         except Exception as e:
             logger.error(f"Error en RAG process: {e}")
-            return "Lo siento, tuve un problema procesando tu pregunta. ¿Podrías intentarlo de nuevo?", False, 0.0, []
+            return RAG_ERROR_RESPONSE
+    
+    @staticmethod
+    def _source_ids(sources: list) -> List[Any]:
+        """Documentos de origen de una respuesta (los fragmentos cuentan como su documento)"""
+        return [s["metadata"].get("parent_id") or s["metadata"].get("doc_id") for s in sources]
     
     def process_query(self, query: str) -> Tuple[str, bool, float, list]:
         """
@@ -197,48 +359,158 @@ class RAGSystem:
         Returns:
             Tuple[str, bool, float, list]: (respuesta, es_rag, confianza, fuentes)
         """
-        query = query.strip()
+        analysis = self.analyze_query(query)
+        
+        # Folios y códigos conocidos se responden antes de cualquier modelo
+        exact_response = self._exact_match_process(analysis)
+        if exact_response is not None:
+            return exact_response
+        
+        # Respuesta ya calculada con los mismos documentos e intents
+        cache_key = version = None
+        if self.response_cache is not None:
+            cache_key = analysis.clean
+            version = (*self.vector_store.data_version(), self.intents_loaded)
+            cached = self.response_cache.get(cache_key, version)
+            if cached is not None:
+                response, responses = cached
+                if responses:
+                    # Los intents siguen alternando entre sus respuestas
+                    response = (random.choice(responses), *response[1:])
+                return response
+        
+        response, responses = self._answer(analysis)
+        if self.response_cache is not None and response is not RAG_ERROR_RESPONSE:
+            self.response_cache.put(cache_key, version, (response, responses))
+        return response
+    
+    async def aprocess_query(self, query: str) -> Tuple[str, bool, float, list]:
+        """
+        process_query sin bloquear el event loop: se ejecuta en el pool de consultas.
+        
+        Raises:
+            ExecutorBusy: Si hay QUERY_WORKERS consultas en curso y QUERY_QUEUE_SIZE en espera
+        """
+        return await self.query_executor.run(self.process_query, query)
+    
+    def _answer(self, analysis: QueryAnalysis) -> Tuple[Tuple[str, bool, float, list], Optional[List[str]]]:
+        """
+        Intents y, si no hay uno adecuado, RAG.
         
+        Returns:
+            (respuesta, respuestas posibles del intent usado o None)
+        """
         # SIEMPRE verifica intents primero para mantener funcionalidad de saludos/despedidas
         if self.intents_loaded:
-            # Mejorar la detección de intents
-            
-            # 1. Limpiar y analizar la consulta
-            clean_query = self._clean_query(query)
-            
-            # 2. Clasificar por tipo de pregunta
-            intent_priority = self._classify_query_type(query)
-            
-            # 3. Verificar intents con criterios mejorados
-            intent_results = self.vector_store.search_intents(
-                query_text=clean_query,  # Usar consulta limpia
-                top_k=3
-            )
-            
-            # 4. Evaluar resultados de intents
-            use_intent = self._should_use_intent(query, intent_results, intent_priority)
+            intent_results, use_intent = self._match_intent(analysis)
             
             if use_intent:
-                logger.info(f"Usando intent para: '{query[:50]}...' (tipo: {intent_priority})")
-                return self._format_intent_response(intent_results)
+                metadatas = intent_results.get('metadatas') or [[]]
+                responses = metadatas[0][0].get('responses') if metadatas[0] else None
+                return self._format_intent_response(intent_results), responses
         
         # Si no usamos intent, usar RAG
-        logger.info(f"Usando RAG para: '{query[:50]}...'")
-        return self._rag_process(query)
+        logger.info(f"Usando RAG para: '{analysis.text[:50]}...'")
+        return self._rag_process(analysis), None
+    
+    def _match_intent(self, analysis: QueryAnalysis) -> Tuple[Dict, bool]:
+        """
+        Buscar intents para la consulta y decidir si responder con uno.
+        
+        Si la consulta tal cual va a RAG, se corrigen los errores de tecleo
+        ("como me inscrivo") contra el vocabulario de patrones y del corpus.
+        La corrección solo se acepta si da una coincidencia de patrón que el
+        original no tenía y nunca si convierte la consulta en saludo,
+        despedida o agradecimiento ("me deja sola" → "me deja hola"). En ese
+        caso la consulta cuenta como rescatada del camino RAG.
+        
+        Returns:
+            (resultados de intents, usar intent)
+        """
+        intent_results, use_intent = self._intent_decision(analysis)
+        rescued = False
+        if not use_intent and settings.TYPO_CORRECTION_ENABLED:
+            corrected = analysis.with_text(self.vector_store.correct_spelling(analysis.text))
+            if corrected is not analysis and self._can_correct(analysis, corrected):
+                corrected_results, corrected_use = self._intent_decision(corrected)
+                if corrected_use and self._adds_pattern_match(intent_results, corrected_results):
+                    intent_results, use_intent, rescued = corrected_results, True, True
+                    logger.info(f"Consulta corregida: '{analysis.text[:50]}' → '{corrected.text[:50]}'")
+        if use_intent:
+            logger.info(f"Usando intent para: '{analysis.text[:50]}...' (tipo: {analysis.priority})")
+        
+        self.intent_stats["queries"] += 1
+        self.intent_stats["intent_answers"] += int(use_intent)
+        self.intent_stats["typo_rescued"] += int(rescued)
+        return intent_results, use_intent
+    
+    @staticmethod
+    def _can_correct(analysis: QueryAnalysis, corrected: QueryAnalysis) -> bool:
+        """Una corrección no puede convertir la consulta en saludo, despedida o agradecimiento"""
+        return (corrected.priority not in ALWAYS_INTENT_PRIORITIES
+                or analysis.priority in ALWAYS_INTENT_PRIORITIES)
+    
+    @staticmethod
+    def _adds_pattern_match(intent_results: Dict, corrected_results: Dict) -> bool:
+        """¿El mejor intent de la corrección coincide por patrón y el del original no?"""
+        best = corrected_results['metadatas'][0][:1]
+        if not best or best[0]['match_type'] != 'pattern':
+            return False
+        matched = {result['tag'] for result in intent_results['metadatas'][0] if result['match_type'] == 'pattern'}
+        return best[0]['tag'] not in matched
+    
+    def _intent_decision(self, analysis: QueryAnalysis) -> Tuple[Dict, bool]:
+        # 1. Verificar intents por texto (patrones, tags): sin embedding
+        intent_results = self.vector_store.search_intents(query_text=analysis.clean, top_k=3)
+        
+        # 2. Evaluar resultados de intents (con la prioridad ya clasificada)
+        use_intent = self._should_use_intent(analysis, intent_results)
+        if use_intent or not settings.INTENT_SEMANTIC_ENABLED:
+            return intent_results, use_intent
+        
+        # 3. Solo si el texto no basta se compara con el embedding (el mismo que usará RAG)
+        intent_results = self.vector_store.search_intents(
+            query_text=analysis.clean,
+            query_embedding=analysis.embedding,
+            top_k=3
+        )
+        return intent_results, self._should_use_intent(analysis, intent_results)
+    
+    def intent_routing_stats(self) -> Dict[str, Any]:
+        """Tasa de consultas que pasan al camino RAG, con y sin corrección de tecleo"""
+        queries = self.intent_stats["queries"]
+        answers = self.intent_stats["intent_answers"]
+        rescued = self.intent_stats["typo_rescued"]
+        return {
+            **self.intent_stats,
+            "fall_through_rate": round(1 - answers / queries, 4) if queries else None,
+            "fall_through_rate_without_correction": round(1 - (answers - rescued) / queries, 4) if queries else None
+        }
     
+    def _split(self, content: str, metadata: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Fragmentos de un documento (él mismo si no hay chunker o cabe entero)"""
+        if self.chunker is None:
+            return [{"content": content, "metadata": metadata}]
+        return self.chunker.split_document(content, metadata)
+
     def add_document(self, content: str, metadata: Dict[str, Any] = None):
         """Añade un documento al sistema"""
         if metadata is None:
             metadata = {}
         
         try:
-            # Generar embedding
-            embedding = self.embedder.embed_text(content)
-            
-            # Añadir al vector store
-            self.vector_store.add_document(content, metadata, embedding)
+            chunks = self._split(content, metadata)
+            if len(chunks) == 1:
+                # Generar embedding
+                embedding = self.embedder.embed_text(content)
+                
+                # Añadir al vector store
+                self.vector_store.add_document(content, metadata, embedding)
+            else:
+                embeddings = self.embedder.embed_batch([chunk["content"] for chunk in chunks])
+                self.vector_store.add_documents(chunks, embeddings)
             
-            logger.info(f"Document added: {metadata.get('title', 'No title')}")
+            logger.info(f"Document added: {metadata.get('title', 'No title')} ({len(chunks)} fragmentos)")
             
         except Exception as e:
             logger.error(f"Error adding document: {e}")
@@ -249,27 +521,49 @@ class RAGSystem:
             return
         
         try:
-            # Extraer textos
-            texts = [doc['content'] for doc in documents]
+            # Partir en fragmentos y extraer textos
+            chunks = [chunk for doc in documents for chunk in self._split(doc['content'], doc.get('metadata') or {})]
+            texts = [chunk['content'] for chunk in chunks]
             
             # Generar embeddings en batch
             embeddings = self.embedder.embed_batch(texts)
             
             # Añadir al vector store
-            self.vector_store.add_documents(documents, embeddings)
+            self.vector_store.add_documents(chunks, embeddings)
             
-            logger.info(f"Added {len(documents)} documents in batch")
+            logger.info(f"Added {len(documents)} documents in batch ({len(chunks)} fragmentos)")
             
         except Exception as e:
             logger.error(f"Error adding documents batch: {e}")
     
+    async def aadd_document(self, content: str, metadata: Dict[str, Any] = None):
+        """add_document en el pool de ingesta"""
+        await self.ingest_executor.run(self.add_document, content, metadata)
+    
+    async def aadd_documents_batch(self, documents: List[Dict[str, Any]]):
+        """add_documents_batch en el pool de ingesta"""
+        await self.ingest_executor.run(self.add_documents_batch, documents)
+    
+    def close(self):
+        """Esperar a las tareas en curso y detener los pools y los hilos del almacén"""
+        self.query_executor.shutdown()
+        self.ingest_executor.shutdown()
+        self.vector_store.close()
+    
     def get_stats(self):
         """Obtener estadísticas del sistema"""
         try:
             return {
                 "vector_store": self.vector_store.get_stats(),
                 "embedding_model": self.embedder.model_name,
-                "intents_loaded": self.intents_loaded
+                "intents_loaded": self.intents_loaded,
+                "intent_routing": self.intent_routing_stats(),
+                "response_cache": self.response_cache.get_stats() if self.response_cache is not None else None,
+                "semantic_cache": self.semantic_cache.get_stats() if self.semantic_cache is not None else None,
+                "executors": {
+                    "query": self.query_executor.get_stats(),
+                    "ingest": self.ingest_executor.get_stats()
+                }
             }
         except:
             return {"status": "unknown"}
\ No newline at end of file
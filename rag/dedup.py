@@ -0,0 +1,110 @@
+"""
+Detección de casi duplicados con MinHash + LSH
+"""
+import copy
+import zlib
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from .text import words
+
+_MAX_HASH = (1 << 32) - 1
+
+
+def shingles(text: str, size: int = 3) -> List[int]:
+    """Hashes (crc32, estables entre procesos) de los n-gramas de palabras"""
+    tokens = words(text)
+    if len(tokens) < size:
+        return [zlib.crc32(" ".join(tokens).encode("utf-8"))] if tokens else []
+    return list({
+        zlib.crc32(" ".join(tokens[i:i + size]).encode("utf-8"))
+        for i in range(len(tokens) - size + 1)
+    })
+
+
+def _bands_for(threshold: float, num_perm: int) -> Tuple[int, int]:
+    """Bandas y filas por banda cuyo umbral (1/b)^(1/r) se acerca más al pedido"""
+    options = [(b, num_perm // b) for b in range(1, num_perm + 1) if num_perm % b == 0]
+    return min(options, key=lambda br: abs((1.0 / br[0]) ** (1.0 / br[1]) - threshold))
+
+
+class NearDuplicateIndex:
+    """
+    Índice LSH de firmas MinHash para encontrar textos casi idénticos.
+
+    Cada documento se resume en num_perm mínimos de hash; la fracción de
+    mínimos iguales estima la similitud de Jaccard entre sus shingles. Las
+    firmas se agrupan por bandas, así que solo se comparan documentos que
+    coinciden en alguna banda completa.
+
+    Los documentos borrados quedan como tombstones: sus firmas siguen en las
+    bandas pero dejan de ser candidatos.
+    """
+
+    _removed: FrozenSet[int] = frozenset()  # Por defecto también en índices guardados sin tombstones
+
+    def __init__(self, threshold: float = 0.85, num_perm: int = 128, shingle_size: int = 3, seed: int = 1):
+        """
+        Args:
+            threshold: Jaccard estimado a partir del cual dos textos son duplicados
+            num_perm: Funciones hash de la firma
+            shingle_size: Palabras por shingle
+            seed: Semilla de las funciones hash (fija para poder persistir)
+        """
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.bands, self.rows = _bands_for(threshold, num_perm)
+
+        # Hashing multiply-shift: ((a·x + b) mod 2^64) >> 32 con 'a' impar
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(0, 2 ** 63, size=num_perm, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        self._b = rng.integers(0, 2 ** 63, size=num_perm, dtype=np.uint64)
+
+        self._signatures: Dict[int, np.ndarray] = {}
+        self._buckets: List[Dict[bytes, List[int]]] = [{} for _ in range(self.bands)]
+        self.size = 0  # Posiciones procesadas (añadidas o no)
+
+    def signature(self, text: str) -> np.ndarray:
+        """Firma MinHash (uint32, longitud num_perm)"""
+        hashes = np.array(shingles(text, self.shingle_size), dtype=np.uint64)
+        if len(hashes) == 0:
+            return np.full(self.num_perm, _MAX_HASH, dtype=np.uint32)
+        # La multiplicación de uint64 desborda módulo 2^64 a propósito
+        values = (self._a[:, None] * hashes[None, :] + self._b[:, None]) >> np.uint64(32)
+        return values.min(axis=1).astype(np.uint32)
+
+    def _band_keys(self, signature: np.ndarray) -> List[bytes]:
+        return [signature[i * self.rows:(i + 1) * self.rows].tobytes() for i in range(self.bands)]
+
+    def find(self, signature: np.ndarray) -> Optional[Tuple[float, int]]:
+        """
+        Documento indexado más parecido por encima del umbral.
+
+        Returns:
+            (Jaccard estimado, posición) o None
+        """
+        candidates = set()
+        for bucket, key in zip(self._buckets, self._band_keys(signature)):
+            candidates.update(bucket.get(key, ()))
+
+        best = None
+        for position in candidates - self._removed:
+            similarity = float(np.mean(self._signatures[position] == signature))
+            if similarity >= self.threshold and (best is None or similarity > best[0]):
+                best = (similarity, position)
+        return best
+
+    def add(self, position: int, signature: np.ndarray):
+        """Registrar la firma de un documento"""
+        self._signatures[position] = signature
+        for bucket, key in zip(self._buckets, self._band_keys(signature)):
+            bucket.setdefault(key, []).append(position)
+        self.size = max(self.size, position + 1)
+
+    def without(self, positions: Iterable[int]) -> "NearDuplicateIndex":
+        """Copia en la que esos documentos dejan de ser candidatos a canónico; esta instancia no cambia"""
+        index = copy.copy(self)
+        index._removed = self._removed | frozenset(p for p in positions if p in self._signatures)
+        return index
@@ -0,0 +1,281 @@
+"""
+Almacén de textos comprimidos con diccionario entrenado y caché LRU
+"""
+import logging
+import sys
+import threading
+import zlib
+from array import array
+from collections import Counter, OrderedDict
+from typing import Callable, Iterable, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# zlib solo aprovecha los últimos 32 KB del diccionario
+_MAX_DICT_SIZE = 32 * 1024
+# Segmentos de entrenamiento: líneas completas y n-gramas de palabras
+_NGRAM = 4
+
+
+def train_dictionary(samples: Iterable[str], size: int = _MAX_DICT_SIZE) -> bytes:
+    """
+    Construir un diccionario de compresión a partir del corpus.
+
+    Selecciona las líneas y n-gramas de palabras que aparecen en más
+    documentos (encabezados ASUNTO/DESCRIPCIÓN/RESPUESTA, respuestas
+    institucionales repetidas...) ponderados por su longitud.
+
+    Args:
+        samples: Textos de ejemplo
+        size: Tamaño máximo del diccionario en bytes
+
+    Returns:
+        Diccionario para zlib (lo más frecuente al final)
+    """
+    doc_freq = Counter()
+    for text in samples:
+        segments = set(line.strip() for line in text.split("\n") if len(line.strip()) > 3)
+        words = text.split()
+        segments.update(" ".join(words[i:i + _NGRAM]) for i in range(len(words) - _NGRAM + 1))
+        doc_freq.update(segments)
+
+    candidates = [(freq * len(seg), seg) for seg, freq in doc_freq.items() if freq > 1]
+    candidates.sort(reverse=True)
+
+    chosen, total = [], 0
+    for _, seg in candidates:
+        encoded = seg.encode("utf-8") + b"\n"
+        if total + len(encoded) > size:
+            continue
+        chosen.append(encoded)
+        total += len(encoded)
+
+    # zlib alcanza con distancias más cortas lo que está al final
+    return b"".join(reversed(chosen))
+
+
+def encode_segment(blobs: List[bytes]) -> bytes:
+    """Concatenar blobs con sus longitudes (formato de segmento remoto)"""
+    lengths = array('I', [len(blob) for blob in blobs])
+    return array('I', [len(blobs)]).tobytes() + lengths.tobytes() + b"".join(blobs)
+
+
+def decode_segment(data: bytes) -> List[bytes]:
+    """Inverso de encode_segment"""
+    count = array('I', data[:4])[0]
+    lengths = array('I', data[4:4 + 4 * count])
+    blobs, offset = [], 4 + 4 * count
+    for length in lengths:
+        blobs.append(data[offset:offset + length])
+        offset += length
+    return blobs
+
+
+class CompressedTextStore:
+    """
+    Lista de documentos guardados comprimidos con zlib.
+
+    Cada blob empieza con un byte que indica con qué diccionario se
+    comprimió (0 = sin diccionario), de modo que reentrenar no invalida los
+    blobs existentes. Solo se descomprimen los documentos que se leen y los
+    más recientes se conservan en una caché LRU.
+
+    Solo se añade al final: un único escritor puede añadir mientras otros
+    hilos leen posiciones ya existentes.
+
+    Un almacén creado con from_header() empieza sin blobs: cada segmento se
+    descarga la primera vez que se lee uno de sus documentos.
+    """
+
+    def __init__(self, cache_size: int = 256, level: int = 6, train_min_docs: int = 200):
+        """
+        Args:
+            cache_size: Documentos descomprimidos en caché
+            level: Nivel de compresión zlib
+            train_min_docs: Documentos necesarios para entrenar el diccionario
+        """
+        self.cache_size = cache_size
+        self.level = level
+        self.train_min_docs = train_min_docs
+
+        self._blobs: List[bytes] = []
+        self._raw_sizes = array('I')
+        self._dictionaries: List[bytes] = [b""]  # Índice 0 = sin diccionario
+        self._cache: "OrderedDict[int, str]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+        # Blobs remotos pendientes de descargar (None en _blobs)
+        self._remote: Optional[Callable[[int], List[bytes]]] = None
+        self._segment_size = 0
+        self._fetch_lock = threading.Lock()
+
+    @classmethod
+    def from_texts(cls, texts: List[str], **kwargs) -> "CompressedTextStore":
+        """Construir el almacén desde una lista de textos (formato antiguo de documents.pkl)"""
+        store = cls(**kwargs)
+        if len(texts) >= store.train_min_docs:
+            store._dictionaries.append(train_dictionary(texts))
+        for text in texts:
+            store.append(text)
+        return store
+
+    @classmethod
+    def from_header(cls, header: bytes, fetch_segment: Callable[[int], List[bytes]],
+                    segment_size: int, **kwargs) -> "CompressedTextStore":
+        """
+        Almacén cuyos blobs se descargan por segmentos bajo demanda.
+
+        Args:
+            header: Resultado de header() en el almacén original
+            fetch_segment: Función (serializable) segmento → lista de blobs
+            segment_size: Documentos por segmento
+        """
+        store = cls(**kwargs)
+        raw_sizes, *dictionaries = decode_segment(header)
+        store._raw_sizes = array('I', raw_sizes)
+        store._dictionaries = dictionaries
+        store._blobs = [None] * len(store._raw_sizes)
+        store._remote = fetch_segment
+        store._segment_size = segment_size
+        return store
+
+    def header(self) -> bytes:
+        """Tamaños y diccionarios: lo necesario para leer los segmentos"""
+        return encode_segment([self._raw_sizes.tobytes()] + self._dictionaries)
+
+    def segments(self, segment_size: int) -> Iterator[bytes]:
+        """Blobs agrupados en segmentos codificados (descarga los pendientes)"""
+        for start in range(0, len(self._blobs), segment_size):
+            end = min(start + segment_size, len(self._blobs))
+            yield encode_segment([self._blob(position) for position in range(start, end)])
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_cache"] = OrderedDict()
+        del state["_cache_lock"]
+        del state["_fetch_lock"]
+        return state
+
+    def __setstate__(self, state):
+        state.setdefault("_remote", None)
+        state.setdefault("_segment_size", 0)
+        self.__dict__.update(state)
+        self._cache_lock = threading.Lock()
+        self._fetch_lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._blobs)
+
+    def _compress(self, text: str) -> bytes:
+        dict_id = len(self._dictionaries) - 1
+        zdict = self._dictionaries[dict_id]
+        if zdict:
+            compressor = zlib.compressobj(self.level, zdict=zdict)
+        else:
+            compressor = zlib.compressobj(self.level)
+        return bytes([dict_id]) + compressor.compress(text.encode("utf-8")) + compressor.flush()
+
+    def _blob(self, position: int) -> bytes:
+        blob = self._blobs[position]
+        if blob is None:
+            self._fetch(position // self._segment_size)
+            blob = self._blobs[position]
+        return blob
+
+    def _fetch(self, segment: int):
+        """Descargar un segmento remoto y rellenar sus posiciones"""
+        with self._fetch_lock:
+            start = segment * self._segment_size
+            if self._blobs[start] is not None:
+                return  # Otro hilo ya lo descargó
+            blobs = self._remote(segment)
+            for offset, blob in enumerate(blobs):
+                self._blobs[start + offset] = blob
+        logger.debug(f"Segmento remoto {segment} descargado ({len(blobs)} documentos)")
+
+    def pending_segments(self) -> List[int]:
+        """Segmentos remotos que aún no se han descargado"""
+        if self._remote is None:
+            return []
+        return [
+            segment for segment, start in enumerate(range(0, len(self._blobs), self._segment_size))
+            if self._blobs[start] is None
+        ]
+
+    def prefetch(self, limit: Optional[int] = None) -> int:
+        """
+        Descargar segmentos pendientes (todos o como mucho 'limit').
+
+        Returns:
+            Segmentos descargados
+        """
+        pending = self.pending_segments()[:limit]
+        for segment in pending:
+            self._fetch(segment)
+        return len(pending)
+
+    def _decompress(self, blob: bytes) -> str:
+        zdict = self._dictionaries[blob[0]]
+        decompressor = zlib.decompressobj(zdict=zdict) if zdict else zlib.decompressobj()
+        return (decompressor.decompress(blob[1:]) + decompressor.flush()).decode("utf-8")
+
+    def append(self, text: str):
+        """Comprimir y añadir un documento al final"""
+        self._blobs.append(self._compress(text))
+        self._raw_sizes.append(len(text.encode("utf-8")))
+
+        if len(self._dictionaries) == 1 and len(self._blobs) >= self.train_min_docs:
+            self.retrain()
+
+    def retrain(self):
+        """
+        Entrenar un diccionario nuevo con el corpus y recomprimir todo.
+
+        Los diccionarios anteriores se conservan para que las lecturas en
+        curso sobre blobs antiguos sigan siendo válidas.
+        """
+        texts = list(self)
+        self._dictionaries = self._dictionaries + [train_dictionary(texts)]
+        self._blobs = [self._compress(text) for text in texts]
+        logger.info(f"Diccionario de compresión entrenado con {len(texts)} documentos")
+
+    def __getitem__(self, position: int) -> str:
+        with self._cache_lock:
+            text = self._cache.get(position)
+            if text is not None:
+                self._cache.move_to_end(position)
+                self.cache_hits += 1
+                return text
+
+        text = self._decompress(self._blob(position))
+
+        with self._cache_lock:
+            self.cache_misses += 1
+            self._cache[position] = text
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return text
+
+    def __iter__(self) -> Iterator[str]:
+        # Recorridos completos no pasan por la caché para no expulsar documentos calientes
+        for position in range(len(self._blobs)):
+            yield self._decompress(self._blob(position))
+
+    def memory_usage(self) -> dict:
+        """Memoria comprimida frente a la de los textos como str de Python"""
+        compressed = sum(sys.getsizeof(blob) for blob in self._blobs if blob is not None)
+        compressed += sum(len(d) for d in self._dictionaries)
+        # str de Python: ~49 bytes de cabecera + 1-2 bytes por carácter en español
+        raw = sum(self._raw_sizes) + 49 * len(self._blobs)
+        return {
+            "raw_bytes": raw,
+            "compressed_bytes": compressed,
+            "compression_ratio": round(raw / compressed, 2) if compressed else 0.0,
+            "dictionary_bytes": len(self._dictionaries[-1]),
+            "cache_size": len(self._cache),
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses,
+            "remote_pending": sum(1 for blob in self._blobs if blob is None)
+        }
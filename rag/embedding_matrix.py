@@ -0,0 +1,86 @@
+"""
+Matriz de embeddings alineada con las posiciones de los documentos
+"""
+import logging
+from typing import Optional, Sequence
+
+import numpy as np
+
+from .persistence import atomic_write
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingMatrix:
+    """
+    Copia de los vectores indexados, fila i = documento en la posición i.
+
+    Permite reconstruir cualquier tipo de índice FAISS y comprobar que el
+    índice no se desvió de los documentos sin volver a codificar textos.
+    Las filas solo se añaden al final; se guarda en disco como .npy
+    (float32, o float16 para ocupar la mitad).
+    """
+
+    def __init__(self, embedding_dim: int, dtype: str = "float32", data: Optional[np.ndarray] = None):
+        """
+        Args:
+            embedding_dim: Dimensión de los embeddings
+            dtype: "float32" o "float16" (tipo en memoria y en disco)
+            data: Filas existentes (p. ej. un .npy abierto con mmap)
+        """
+        if dtype not in ("float32", "float16"):
+            raise ValueError(f"Tipo de la matriz de embeddings no soportado: {dtype}")
+        self.embedding_dim = embedding_dim
+        self.dtype = np.dtype(dtype)
+        if data is None:
+            data = np.empty((0, embedding_dim), dtype=self.dtype)
+        self._data = data
+        self._size = len(data)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def append(self, vectors: np.ndarray):
+        """Añadir filas al final (la capacidad se duplica al agotarse)"""
+        vectors = np.asarray(vectors).reshape(-1, self.embedding_dim)
+        needed = self._size + len(vectors)
+        if needed > len(self._data) or not self._data.flags.writeable:
+            capacity = max(needed, 2 * len(self._data), 64)
+            data = np.empty((capacity, self.embedding_dim), dtype=self.dtype)
+            data[:self._size] = self._data[:self._size]
+            self._data = data
+        self._data[self._size:needed] = vectors
+        self._size = needed
+
+    def vectors(self, positions: Optional[Sequence[int]] = None) -> np.ndarray:
+        """Filas como float32 (todas, o las de las posiciones indicadas)"""
+        data = self._data[:self._size]
+        if positions is not None:
+            data = data[np.asarray(positions, dtype=np.int64)]
+        return np.ascontiguousarray(data, dtype='float32')
+
+    def save(self, path: str):
+        """Escribir el .npy de forma atómica"""
+        with atomic_write(path) as f:
+            np.save(f, self._data[:self._size], allow_pickle=False)
+
+    @classmethod
+    def load(cls, path: str, embedding_dim: int, dtype: str = "float32") -> "EmbeddingMatrix":
+        """
+        Abrir un .npy con mmap (las filas se copian a memoria al añadir).
+
+        Si el archivo tiene otro tipo que el pedido se convierte.
+        """
+        data = np.load(path, mmap_mode='r', allow_pickle=False)
+        if data.ndim != 2 or data.shape[1] != embedding_dim:
+            raise ValueError(f"Matriz de embeddings con forma {data.shape}, se esperaba (n, {embedding_dim})")
+        if data.dtype != np.dtype(dtype):
+            data = data.astype(dtype)
+        return cls(embedding_dim, dtype, data)
+
+    def memory_usage(self) -> dict:
+        return {
+            "rows": self._size,
+            "dtype": self.dtype.name,
+            "bytes": self._size * self.embedding_dim * self.dtype.itemsize
+        }
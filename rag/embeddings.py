@@ -21,6 +21,16 @@ class EmbeddingModel:
             self.dimension = 384
             
         logger.info(f"Embedding model loaded: {self.model_name}")
+
+    @property
+    def max_tokens(self) -> int:
+        """Tokens de texto que lee el modelo (sin [CLS]/[SEP]); lo demás se trunca"""
+        return self.model.max_seq_length - 2
+
+    def count_tokens(self, texts: List[str]) -> List[int]:
+        """Número de tokens de cada texto según el tokenizador del modelo"""
+        encoded = self.model.tokenizer(list(texts), add_special_tokens=False)["input_ids"]
+        return [len(ids) for ids in encoded]
     
     # Cambia TU embeddings.py (línea 23):
     def embed_text(self, text: str) -> np.ndarray:
@@ -0,0 +1,78 @@
+"""
+Índice hash de identificadores exactos (folio, código de respuesta)
+"""
+import re
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Folios de tickets, p. ej. "25-450805"
+FOLIO_PATTERN = re.compile(r"\b\d{2}-\d{6}\b")
+# Candidatos a identificador dentro de una consulta libre
+_TOKEN_PATTERN = re.compile(r"[A-Za-z0-9][A-Za-z0-9_\-/.]*[A-Za-z0-9]|[A-Za-z0-9]")
+
+
+def normalize_key(value: Any) -> str:
+    """Forma canónica de un identificador: sin espacios y en mayúsculas"""
+    return str(value).strip().upper()
+
+
+def key_candidates(text: str) -> List[str]:
+    """Tokens de una consulta que pueden ser un identificador, normalizados y sin repetir"""
+    candidates = {}
+    for token in FOLIO_PATTERN.findall(text) + _TOKEN_PATTERN.findall(text):
+        candidates.setdefault(normalize_key(token), None)
+    return list(candidates)
+
+
+class ExactKeyIndex:
+    """
+    Mapeo valor exacto → posiciones de documentos para campos de metadatos.
+
+    Las consultas se parten en tokens con una expresión compilada y cada
+    token se busca en el dict, así que encontrar un folio no pasa por el
+    modelo de embeddings ni por FAISS. Solo se añade al final (un escritor,
+    lecturas sin bloqueo).
+    """
+
+    def __init__(self, fields: Iterable[str]):
+        """
+        Args:
+            fields: Campos de metadatos indexados (p. ej. "folio", "codigo_respuesta")
+        """
+        self.fields = list(fields)
+        self._keys: Dict[str, List[Tuple[str, int]]] = {}
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def add(self, position: int, metadata: Dict[str, Any]):
+        """Indexar los campos exactos de un documento"""
+        for field in self.fields:
+            value = metadata.get(field)
+            if value is None or value == "":
+                continue
+            key = normalize_key(value)
+            self._keys[key] = self._keys.get(key, []) + [(field, position)]
+
+    def lookup(self, value: Any) -> List[Tuple[str, int]]:
+        """Pares (campo, posición) para un identificador"""
+        return self._keys.get(normalize_key(value), [])
+
+    def find_in_text(self, text: str, candidates: Optional[Sequence[str]] = None) -> List[Tuple[str, str, int]]:
+        """
+        Buscar identificadores conocidos dentro de una consulta.
+
+        Args:
+            candidates: key_candidates(text) ya calculados (evita volver a tokenizarla)
+
+        Returns:
+            Lista de (identificador, campo, posición) en orden de aparición
+        """
+        if not self._keys:
+            return []
+        if candidates is None:
+            candidates = key_candidates(text)
+        return [
+            (key, field, position)
+            for key in candidates
+            for field, position in self._keys.get(key, [])
+        ]
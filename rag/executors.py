@@ -0,0 +1,81 @@
+"""
+Pools de hilos con cola acotada para ejecutar trabajo bloqueante desde asyncio
+"""
+import asyncio
+import functools
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+logger = logging.getLogger(__name__)
+
+
+class ExecutorBusy(RuntimeError):
+    """La cola del pool está llena: la petición se rechaza en lugar de esperar sin límite"""
+
+
+class BoundedExecutor:
+    """
+    ThreadPoolExecutor con un máximo de tareas en curso más en espera.
+
+    La cola de ThreadPoolExecutor no tiene límite: bajo carga las
+    peticiones se acumulan y todas acaban tarde. Aquí cada tarea ocupa un
+    hueco (max_workers + max_queue en total) y, sin huecos libres, run()
+    falla enseguida con ExecutorBusy para que la API responda 503. El
+    event loop solo espera el resultado; la inferencia de los modelos
+    (que libera el GIL) corre en los hilos del pool.
+    """
+
+    def __init__(self, name: str, max_workers: int, max_queue: int):
+        """
+        Args:
+            name: Prefijo de los hilos (aparece en logs y trazas)
+            max_workers: Hilos del pool
+            max_queue: Tareas que pueden esperar a un hilo libre
+        """
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._slots = threading.BoundedSemaphore(max_workers + max_queue)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+
+    async def run(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """Ejecutar fn en el pool sin bloquear el event loop"""
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            logger.warning(f"Pool '{self.name}' lleno ({self.max_workers} hilos + {self.max_queue} en cola)")
+            raise ExecutorBusy(f"Pool '{self.name}' lleno")
+        with self._lock:
+            self.in_flight += 1
+        try:
+            future = self._executor.submit(functools.partial(fn, *args, **kwargs))
+        except Exception:
+            self._release(None)
+            raise
+        # El hueco se libera al terminar la tarea, aunque se cancele la petición que la espera
+        future.add_done_callback(self._release)
+        return await asyncio.wrap_future(future)
+
+    def _release(self, _future):
+        with self._lock:
+            self.in_flight -= 1
+            self.completed += 1
+        self._slots.release()
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "completed": self.completed,
+            "rejected": self.rejected
+        }
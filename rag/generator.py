@@ -187,6 +187,10 @@ class ResponseGenerator:
         
         return response
     
+    def generate_exact_response(self, key: str, context: str) -> str:
+        """Responder con el registro encontrado por un identificador exacto"""
+        return f"Encontré el registro {key}:\n\n{context.strip()}"
+    
     def generate_fallback_response(self, query: str) -> str:
         """Generar respuesta de fallback cuando no hay información relevante"""
         fallbacks = [
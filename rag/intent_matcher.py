@@ -0,0 +1,575 @@
+"""
+Matching de intents compilado (Aho-Corasick + autómata de sufijos) y por embeddings
+"""
+import copy
+import json
+import mmap
+import os
+import pickle
+import struct
+from collections import deque
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from .persistence import atomic_write
+
+# Palabras clave comunes: si aparece alguna, todos los intents son candidatos
+COMMON_KEYWORDS = {
+    "saludo": ["hola", "buenos", "buenas", "saludos", "qué tal", "cómo estás"],
+    "despedida": ["adiós", "hasta luego", "chao", "bye", "nos vemos"],
+    "ayuda": ["ayuda", "ayúdame", "asistencia", "soporte"],
+    "gracias": ["gracias", "agradecido", "agradezco"],
+}
+
+# Distancias por tipo de coincidencia (0 = perfect match, 1 = no match)
+PATTERN_DISTANCE = 0.1
+TAG_DISTANCE = 0.3
+KEYWORD_DISTANCE = 0.5
+
+_SEPARATOR = "\x00"  # Separa patrones en el autómata de sufijos
+
+# Artefacto compilado: magic + longitud de cabecera + cabecera JSON + tablas
+# (pickle) + embeddings de patrones float32 alineados para abrirlos con mmap
+ARTIFACT_MAGIC = b"RAGINTS1"
+ARTIFACT_FORMAT = 2
+_PREFIX = struct.Struct("<8sQ")
+_ALIGN = 64
+
+
+def _bits(mask: int) -> Iterator[int]:
+    """Posiciones de los bits activos, de menor a mayor"""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+def _intent_result(intent: Dict[str, Any], match_type: str) -> Dict[str, Any]:
+    return {
+        "tag": intent.get("tag", ""),
+        "responses": intent.get("responses", []),
+        "patterns": intent.get("patterns", []),
+        "context": intent.get("context", ""),
+        "match_type": match_type
+    }
+
+
+def scan_intents(intents_data: Dict[str, Any], query_text: str, top_k: int = 1) -> Tuple[List[Dict], List[float]]:
+    """
+    Recorrido original intent por intent (referencia para pruebas y benchmark).
+
+    Returns:
+        (resultados, distancias) ordenados por distancia
+    """
+    query_lower = query_text.lower().strip()
+    keywords_match = any(keyword in query_lower for keywords in COMMON_KEYWORDS.values() for keyword in keywords)
+    scored = []
+    for intent in intents_data.get("intents", []):
+        tag = intent.get("tag", "").lower()
+        tag_match = tag in query_lower if tag else False
+        pattern_match = any(pattern in query_lower or query_lower in pattern
+                            for pattern in (p.lower() for p in intent.get("patterns", [])))
+        if pattern_match:
+            scored.append((_intent_result(intent, "pattern"), PATTERN_DISTANCE))
+        elif tag_match:
+            scored.append((_intent_result(intent, "tag"), TAG_DISTANCE))
+        elif keywords_match:
+            scored.append((_intent_result(intent, "keyword"), KEYWORD_DISTANCE))
+    scored.sort(key=lambda item: item[1])
+    return [r for r, _ in scored[:top_k]], [d for _, d in scored[:top_k]]
+
+
+class _AhoCorasick:
+    """Autómata de Aho-Corasick con salidas como máscaras de bits"""
+
+    def __init__(self):
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.out: List[int] = [0]
+
+    def add(self, word: str, bit: int):
+        node = 0
+        for char in word:
+            nxt = self.goto[node].get(char)
+            if nxt is None:
+                nxt = len(self.goto)
+                self.goto[node][char] = nxt
+                self.goto.append({})
+                self.fail.append(0)
+                self.out.append(0)
+            node = nxt
+        self.out[node] |= bit
+
+    def build(self):
+        """Enlaces de fallo por BFS; cada nodo hereda las salidas de su enlace"""
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self.goto[node].items():
+                queue.append(child)
+                state = self.fail[node]
+                while state and char not in self.goto[state]:
+                    state = self.fail[state]
+                target = self.goto[state].get(char, 0)
+                self.fail[child] = target if target != child else 0
+                self.out[child] |= self.out[self.fail[child]]
+
+    def scan(self, text: str) -> int:
+        """OR de las salidas de todas las palabras contenidas en el texto (una pasada)"""
+        goto, fail, out = self.goto, self.fail, self.out
+        node, found = 0, 0
+        for char in text:
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            found |= out[node]
+        return found
+
+
+class _SuffixAutomaton:
+    """
+    Autómata de sufijos generalizado sobre todos los patrones.
+
+    Cada estado guarda la máscara de intents cuyos patrones contienen las
+    subcadenas que reconoce, así que "consulta in patrón" para todos los
+    intents es recorrer la consulta una vez.
+    """
+
+    def __init__(self):
+        self.next: List[Dict[str, int]] = [{}]
+        self.link: List[int] = [-1]
+        self.length: List[int] = [0]
+        self.mask: List[int] = [0]
+        self._last = 0
+
+    def _extend(self, char: str, bit: int):
+        cur = len(self.next)
+        self.next.append({})
+        self.length.append(self.length[self._last] + 1)
+        self.link.append(0)
+        self.mask.append(bit)
+
+        state = self._last
+        while state != -1 and char not in self.next[state]:
+            self.next[state][char] = cur
+            state = self.link[state]
+        if state != -1:
+            nxt = self.next[state][char]
+            if self.length[state] + 1 == self.length[nxt]:
+                self.link[cur] = nxt
+            else:
+                clone = len(self.next)
+                self.next.append(dict(self.next[nxt]))
+                self.length.append(self.length[state] + 1)
+                self.link.append(self.link[nxt])
+                self.mask.append(0)
+                while state != -1 and self.next[state].get(char) == nxt:
+                    self.next[state][char] = clone
+                    state = self.link[state]
+                self.link[nxt] = clone
+                self.link[cur] = clone
+        self._last = cur
+
+    def add(self, word: str, bit: int):
+        for char in word:
+            self._extend(char, bit)
+        self._extend(_SEPARATOR, 0)
+
+    def build(self):
+        """Propagar las máscaras por los enlaces de sufijo (de más largo a más corto)"""
+        for state in sorted(range(1, len(self.next)), key=self.length.__getitem__, reverse=True):
+            self.mask[self.link[state]] |= self.mask[state]
+
+    def containing(self, text: str) -> int:
+        """Máscara de intents con algún patrón que contiene el texto"""
+        if _SEPARATOR in text:
+            return 0
+        state = 0
+        for char in text:
+            state = self.next[state].get(char)
+            if state is None:
+                return 0
+        return self.mask[state]
+
+
+class IntentMatcher:
+    """
+    Intents compilados para responder search_intents en una pasada.
+
+    Se construye una vez por conjunto de intents: tags y patrones entran
+    en un Aho-Corasick ("patrón in consulta") y los patrones en un autómata
+    de sufijos ("consulta in patrón"). Sin embedding de consulta da las
+    mismas distancias y el mismo orden que scan_intents.
+
+    Con embed_patterns() los patrones se codifican una vez en una matriz
+    normalizada; el embedding de la consulta se puntúa entonces con un solo
+    producto matriz-vector (distancia = 1 - coseno del mejor patrón), lo que
+    encuentra paráfrasis que no comparten texto con ningún patrón.
+
+    Los cambios sueltos (with_intent, without_pattern, ...) devuelven un
+    matcher nuevo que comparte los autómatas: los intents modificados se
+    marcan como pendientes y se evalúan aparte patrón por patrón, hasta que
+    compacted() vuelve a compilar todo. El matcher original no cambia, así
+    que las búsquedas en curso no ven estados a medias.
+    """
+
+    def __init__(self, intents_data: Dict[str, Any], source_hash: str = ""):
+        """
+        Args:
+            intents_data: Intents con el formato de intents.json
+            source_hash: sha256 del archivo de origen (identifica el artefacto)
+        """
+        self.source = intents_data
+        self.source_hash = source_hash
+        self.embedding_model: Optional[str] = None
+        # Intents por posición (bit de las máscaras); None = intent eliminado
+        self.intents: List[Optional[Dict[str, Any]]] = list(intents_data.get("intents", []))
+        self._live = (1 << len(self.intents)) - 1
+        # Intents cambiados desde la compilación (posición → intent actual o None)
+        self._pending: Dict[int, Optional[Dict[str, Any]]] = {}
+
+        # Embeddings de patrones (fila → intent); vacíos hasta embed_patterns()
+        self.pattern_embeddings: Optional[np.ndarray] = None
+        rows = [(i, pattern) for i, intent in enumerate(self.intents)
+                for pattern in intent.get("patterns", []) if pattern.strip()]
+        self.pattern_owners = np.array([i for i, _ in rows], dtype=np.int64)
+        self.pattern_texts: List[str] = [pattern for _, pattern in rows]
+
+        self._patterns = _AhoCorasick()
+        self._tags = _AhoCorasick()
+        self._keywords = _AhoCorasick()
+        self._suffixes = _SuffixAutomaton()
+        self._empty_pattern = 0   # Intents con un patrón vacío: coinciden siempre
+        self._with_patterns = 0   # Intents con algún patrón (la consulta vacía está en todos)
+
+        for i, intent in enumerate(self.intents):
+            bit = 1 << i
+            tag = intent.get("tag", "").lower()
+            if tag:
+                self._tags.add(tag, bit)
+            for pattern in intent.get("patterns", []):
+                pattern = pattern.lower()
+                self._with_patterns |= bit
+                if not pattern:
+                    self._empty_pattern |= bit
+                    continue
+                self._patterns.add(pattern, bit)
+                self._suffixes.add(pattern, bit)
+        for keywords in COMMON_KEYWORDS.values():
+            for keyword in keywords:
+                self._keywords.add(keyword, 1)
+
+        self._patterns.build()
+        self._tags.build()
+        self._keywords.build()
+        self._suffixes.build()
+
+    def __len__(self) -> int:
+        return sum(1 for intent in self.intents if intent is not None)
+
+    @property
+    def pending_changes(self) -> int:
+        """Intents cambiados que se evalúan fuera de los autómatas"""
+        return len(self._pending)
+
+    def embed_patterns(self, embed_batch: Optional[Callable[[List[str]], np.ndarray]],
+                       model_name: Optional[str] = None, previous: Optional["IntentMatcher"] = None):
+        """
+        Codificar los patrones (una vez, al compilar los intents).
+
+        Args:
+            embed_batch: Función textos → embeddings
+            model_name: Modelo de embeddings (se guarda en el artefacto)
+            previous: Matcher anterior del mismo modelo: sus patrones no se
+                vuelven a codificar
+
+        Raises:
+            ValueError: Hay patrones nuevos y no se pasó embed_batch
+        """
+        if not self.pattern_texts:
+            self.pattern_embeddings = None
+            return
+        known = {}
+        if previous is not None and previous.pattern_embeddings is not None \
+                and previous.embedding_model == model_name:
+            known = dict(zip(previous.pattern_texts, previous.pattern_embeddings))
+        missing = [pattern for pattern in dict.fromkeys(self.pattern_texts) if pattern not in known]
+        if missing:
+            if embed_batch is None:
+                raise ValueError(f"Hay {len(missing)} patrones sin embedding y no hay función para codificarlos")
+            matrix = np.asarray(embed_batch(missing), dtype='float32').reshape(len(missing), -1)
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            known.update(zip(missing, matrix / np.maximum(norms, 1e-12)))
+        self.pattern_embeddings = np.vstack([known[pattern] for pattern in self.pattern_texts]).astype('float32')
+        self.embedding_model = model_name
+
+    def find(self, tag: str) -> Optional[int]:
+        """Posición del intent con ese tag (None si no existe)"""
+        for position, intent in enumerate(self.intents):
+            if intent is not None and intent.get("tag") == tag:
+                return position
+        return None
+
+    def with_intent(self, intent: Dict[str, Any],
+                    embed_batch: Optional[Callable[[List[str]], np.ndarray]] = None) -> "IntentMatcher":
+        """Matcher con el intent añadido (o sustituido si ya hay uno con su tag)"""
+        position = self.find(intent.get("tag"))
+        return self._replaced(len(self.intents) if position is None else position, dict(intent), embed_batch)
+
+    def without_intent(self, tag: str) -> "IntentMatcher":
+        """Matcher sin el intent del tag"""
+        return self._replaced(self._position(tag), None, None)
+
+    def with_pattern(self, tag: str, pattern: str,
+                     embed_batch: Optional[Callable[[List[str]], np.ndarray]] = None) -> "IntentMatcher":
+        """Matcher con un patrón más en el intent del tag"""
+        position = self._position(tag)
+        intent = dict(self.intents[position])
+        if pattern in intent.get("patterns", []):
+            return self
+        intent["patterns"] = list(intent.get("patterns", [])) + [pattern]
+        return self._replaced(position, intent, embed_batch)
+
+    def without_pattern(self, tag: str, pattern: str) -> "IntentMatcher":
+        """Matcher sin ese patrón en el intent del tag"""
+        position = self._position(tag)
+        intent = dict(self.intents[position])
+        if pattern not in intent.get("patterns", []):
+            raise KeyError(f"El intent '{tag}' no tiene el patrón '{pattern}'")
+        intent["patterns"] = [p for p in intent["patterns"] if p != pattern]
+        return self._replaced(position, intent, None)
+
+    def compacted(self) -> "IntentMatcher":
+        """Matcher recompilado con los cambios pendientes (sin volver a codificar patrones)"""
+        matcher = IntentMatcher(self.source, self.source_hash)
+        if self.pattern_embeddings is not None:
+            matcher.embed_patterns(None, self.embedding_model, previous=self)
+        return matcher
+
+    def _position(self, tag: str) -> int:
+        position = self.find(tag)
+        if position is None:
+            raise KeyError(f"No existe el intent '{tag}'")
+        return position
+
+    def _replaced(self, position: int, intent: Optional[Dict[str, Any]],
+                  embed_batch: Optional[Callable[[List[str]], np.ndarray]]) -> "IntentMatcher":
+        """Copia con el intent de una posición cambiado; los autómatas se comparten"""
+        matcher = copy.copy(self)
+        matcher.intents = list(self.intents)
+        bit = 1 << position
+        if position == len(matcher.intents):
+            matcher.intents.append(intent)
+        else:
+            matcher.intents[position] = intent
+        matcher._live = self._live | bit if intent is not None else self._live & ~bit
+        matcher._pending = {**self._pending, position: intent}
+        matcher.source = {**self.source, "intents": [i for i in matcher.intents if i is not None]}
+        matcher.source_hash = ""
+
+        keep = self.pattern_owners != position
+        patterns = [p for p in intent.get("patterns", []) if p.strip()] if intent is not None else []
+        matcher.pattern_owners = np.concatenate([self.pattern_owners[keep],
+                                                 np.full(len(patterns), position, dtype=np.int64)])
+        matcher.pattern_texts = [t for t, k in zip(self.pattern_texts, keep) if k] + patterns
+        if self.pattern_embeddings is not None:
+            matcher.embed_patterns(embed_batch, self.embedding_model, previous=self)
+        return matcher
+    
+    def save(self, path: str):
+        """
+        Escribir el artefacto compilado de forma atómica.
+        
+        Contiene los intents, las tablas de los autómatas y la matriz de
+        embeddings de patrones, así que cargarlo no vuelve a leer el JSON,
+        ni a compilar, ni a codificar.
+        """
+        tables = pickle.dumps({
+            "intents": self.source,
+            "positions": self.intents,
+            "pattern_owners": self.pattern_owners,
+            "patterns": self._patterns,
+            "tags": self._tags,
+            "keywords": self._keywords,
+            "suffixes": self._suffixes,
+            "empty_pattern": self._empty_pattern,
+            "with_patterns": self._with_patterns,
+            "pattern_texts": self.pattern_texts,
+            "live": self._live,
+            "pending": self._pending,
+        }, protocol=pickle.HIGHEST_PROTOCOL)
+        embeddings = self.pattern_embeddings
+        header = json.dumps({
+            "format": ARTIFACT_FORMAT,
+            "source_hash": self.source_hash,
+            "intents": len(self),
+            "tables_bytes": len(tables),
+            "embedding_model": self.embedding_model,
+            "embedding_shape": list(embeddings.shape) if embeddings is not None else None,
+        }).encode('utf-8')
+        
+        with atomic_write(path) as f:
+            f.write(_PREFIX.pack(ARTIFACT_MAGIC, len(header)))
+            f.write(header)
+            f.write(tables)
+            if embeddings is not None:
+                offset = _PREFIX.size + len(header) + len(tables)
+                f.write(b"\x00" * (-offset % _ALIGN))
+                f.write(np.ascontiguousarray(embeddings, dtype='<f4').tobytes())
+    
+    @classmethod
+    def load(cls, path: str) -> "IntentMatcher":
+        """
+        Abrir un artefacto compilado.
+        
+        El archivo se proyecta con mmap: la matriz de embeddings de patrones
+        se usa directamente desde el mapa, sin copiarla.
+        
+        Raises:
+            ValueError: Archivo que no es un artefacto de intents válido
+        """
+        with open(path, 'rb') as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        header = _read_header(data)
+        start = _PREFIX.size + header["header_bytes"]
+        tables = pickle.loads(data[start:start + header["tables_bytes"]])
+        
+        matcher = cls.__new__(cls)
+        matcher.source = tables["intents"]
+        matcher.source_hash = header["source_hash"]
+        matcher.embedding_model = header["embedding_model"]
+        matcher.intents = tables["positions"]
+        matcher.pattern_owners = tables["pattern_owners"]
+        matcher.pattern_texts = tables["pattern_texts"]
+        matcher._live = tables["live"]
+        matcher._pending = tables["pending"]
+        matcher._patterns = tables["patterns"]
+        matcher._tags = tables["tags"]
+        matcher._keywords = tables["keywords"]
+        matcher._suffixes = tables["suffixes"]
+        matcher._empty_pattern = tables["empty_pattern"]
+        matcher._with_patterns = tables["with_patterns"]
+        
+        matcher.pattern_embeddings = None
+        if header["embedding_shape"] is not None:
+            offset = start + header["tables_bytes"]
+            offset += -offset % _ALIGN
+            rows, dim = header["embedding_shape"]
+            matcher.pattern_embeddings = np.frombuffer(data, dtype='<f4', count=rows * dim,
+                                                       offset=offset).reshape(rows, dim)
+        return matcher
+
+    def semantic_scores(self, query_embedding: np.ndarray) -> np.ndarray:
+        """Mejor similitud coseno por intent (-inf si no tiene patrones)"""
+        scores = np.full(len(self.intents), -np.inf, dtype='float32')
+        if self.pattern_embeddings is None:
+            return scores
+        query = np.asarray(query_embedding, dtype='float32').reshape(-1)
+        sims = self.pattern_embeddings @ (query / max(float(np.linalg.norm(query)), 1e-12))
+        np.maximum.at(scores, self.pattern_owners, sims)
+        return scores
+
+    def match(self, query_text: str, top_k: int = 1, query_embedding: Optional[np.ndarray] = None,
+              min_similarity: float = 0.65) -> Tuple[List[Dict], List[float]]:
+        """
+        Intents que coinciden con la consulta.
+
+        Args:
+            query_text: Texto de la consulta
+            top_k: Número de resultados
+            query_embedding: Embedding de la consulta (activa el matching semántico
+                si los patrones están codificados)
+            min_similarity: Similitud mínima para una coincidencia semántica
+
+        Returns:
+            (resultados, distancias) de mejor a peor, como mucho top_k
+        """
+        groups = self._lexical_groups(query_text)
+        if query_embedding is None or self.pattern_embeddings is None:
+            results, distances = [], []
+            for mask, match_type, distance in groups:
+                for i in _bits(mask):
+                    if len(results) >= top_k:
+                        return results, distances
+                    results.append(_intent_result(self.intents[i], match_type))
+                    distances.append(distance)
+            return results, distances
+
+        # Distancia final = la menor entre la léxica y 1 - coseno
+        distances = np.full(len(self.intents), np.inf)
+        match_types = [None] * len(self.intents)
+        for mask, match_type, distance in groups:
+            for i in _bits(mask):
+                distances[i] = distance
+                match_types[i] = match_type
+        scores = self.semantic_scores(query_embedding)
+        semantic = np.flatnonzero((scores >= min_similarity) & (1.0 - scores < distances))
+        distances[semantic] = 1.0 - scores[semantic]
+        for i in semantic:
+            match_types[i] = "semantic"
+
+        order = np.argsort(distances, kind='stable')[:top_k]
+        order = order[np.isfinite(distances[order])]
+        return ([_intent_result(self.intents[i], match_types[i]) for i in order],
+                [round(float(distances[i]), 4) for i in order])
+
+    def _lexical_groups(self, query_text: str) -> List[Tuple[int, str, float]]:
+        """Máscaras de intents por tipo de coincidencia textual, de mejor a peor"""
+        query_lower = query_text.lower().strip()
+        if query_lower:
+            pattern_mask = (self._patterns.scan(query_lower) | self._suffixes.containing(query_lower)
+                            | self._empty_pattern)
+        else:
+            pattern_mask = self._with_patterns
+        tag_mask = self._tags.scan(query_lower)
+
+        if self._pending:
+            # Intents cambiados: los autómatas no los reflejan, se evalúan uno a uno
+            pending_mask, pending_patterns, pending_tags = 0, 0, 0
+            for position, intent in self._pending.items():
+                bit = 1 << position
+                pending_mask |= bit
+                if intent is None:
+                    continue
+                if any(p in query_lower or query_lower in p for p in (p.lower() for p in intent.get("patterns", []))):
+                    pending_patterns |= bit
+                tag = intent.get("tag", "").lower()
+                if tag and tag in query_lower:
+                    pending_tags |= bit
+            pattern_mask = (pattern_mask & ~pending_mask) | pending_patterns
+            tag_mask = (tag_mask & ~pending_mask) | pending_tags
+        tag_mask &= ~pattern_mask
+
+        groups = [(pattern_mask, "pattern", PATTERN_DISTANCE), (tag_mask, "tag", TAG_DISTANCE)]
+        if self._keywords.scan(query_lower):
+            groups.append((self._live & ~(pattern_mask | tag_mask), "keyword", KEYWORD_DISTANCE))
+        return groups
+
+
+def _read_header(data) -> Dict[str, Any]:
+    if len(data) < _PREFIX.size:
+        raise ValueError("Artefacto de intents truncado")
+    magic, header_bytes = _PREFIX.unpack_from(data, 0)
+    if magic != ARTIFACT_MAGIC:
+        raise ValueError("El archivo no es un artefacto de intents compilados")
+    header = json.loads(bytes(data[_PREFIX.size:_PREFIX.size + header_bytes]).decode('utf-8'))
+    if header.get("format") != ARTIFACT_FORMAT:
+        raise ValueError(f"Formato de artefacto de intents no soportado: {header.get('format')}")
+    header["header_bytes"] = header_bytes
+    return header
+
+
+def read_artifact_header(path: str) -> Optional[Dict[str, Any]]:
+    """Cabecera de un artefacto compilado (None si no existe o no es válido)"""
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'rb') as f:
+            prefix = f.read(_PREFIX.size)
+            if len(prefix) < _PREFIX.size:
+                return None
+            header_bytes = _PREFIX.unpack(prefix)[1]
+            return _read_header(prefix + f.read(header_bytes))
+    except (ValueError, struct.error, OSError):
+        return None
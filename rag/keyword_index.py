@@ -0,0 +1,92 @@
+"""
+Índice invertido de palabras clave curadas (palabras_clave, códigos de respuesta)
+"""
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Sequence, Tuple
+
+from .text import as_keywords, words
+
+
+class KeywordIndex:
+    """
+    Frase clave normalizada → documentos que la declaran.
+
+    Las frases pueden tener varias palabras ("correo institucional"): la
+    consulta se recorre con n-gramas hasta la longitud de la frase más
+    larga, así que el coste depende de la consulta y no del corpus.
+
+    Las listas de documentos se reemplazan en lugar de modificarse, de modo
+    que las lecturas no necesitan bloqueo mientras un escritor añade o borra.
+    """
+
+    def __init__(self, fields: Iterable[str]):
+        """
+        Args:
+            fields: Campos de metadatos con palabras clave
+        """
+        self.fields = list(fields)
+        self._postings: Dict[str, FrozenSet[int]] = {}
+        self._by_position: Dict[int, Tuple[str, ...]] = {}
+        self._max_words = 1
+
+    def __len__(self) -> int:
+        return len(self._postings)
+
+    def add(self, position: int, metadata: Dict[str, Any]):
+        """Indexar las palabras clave de un documento"""
+        keywords = []
+        for field in self.fields:
+            for keyword in as_keywords(metadata.get(field)):
+                if keyword not in keywords:
+                    keywords.append(keyword)
+        if not keywords:
+            return
+
+        for keyword in keywords:
+            self._postings[keyword] = self._postings.get(keyword, frozenset()) | {position}
+            self._max_words = max(self._max_words, keyword.count(" ") + 1)
+        self._by_position[position] = tuple(keywords)
+
+    def remove(self, position: int):
+        """Quitar un documento de todas sus palabras clave"""
+        for keyword in self._by_position.pop(position, ()):
+            remaining = self._postings.get(keyword, frozenset()) - {position}
+            if remaining:
+                self._postings[keyword] = remaining
+            else:
+                self._postings.pop(keyword, None)
+
+    def without(self, positions: Iterable[int]) -> "KeywordIndex":
+        """Copia sin esos documentos (esta instancia no cambia: la siguen leyendo las búsquedas)"""
+        index = KeywordIndex(self.fields)
+        index._postings = dict(self._postings)
+        index._by_position = dict(self._by_position)
+        index._max_words = self._max_words
+        for position in positions:
+            index.remove(position)
+        return index
+
+    def keywords_for(self, position: int) -> Tuple[str, ...]:
+        return self._by_position.get(position, ())
+
+    def match(self, query_text: str, query_words: Optional[Sequence[str]] = None) -> Dict[int, List[str]]:
+        """
+        Documentos cuyas palabras clave aparecen en la consulta.
+
+        Args:
+            query_words: Palabras de la consulta ya normalizadas (evita volver a tokenizarla)
+
+        Returns:
+            posición → palabras clave encontradas
+        """
+        if not self._postings:
+            return {}
+        tokens = list(query_words) if query_words is not None else words(query_text)
+        hits: Dict[int, List[str]] = {}
+        for size in range(1, min(self._max_words, len(tokens)) + 1):
+            for start in range(len(tokens) - size + 1):
+                phrase = " ".join(tokens[start:start + size])
+                for position in self._postings.get(phrase, ()):
+                    matched = hits.setdefault(position, [])
+                    if phrase not in matched:
+                        matched.append(phrase)
+        return hits
@@ -0,0 +1,296 @@
+"""
+Metadatos en columnas (struct-of-arrays) con strings categóricos internados
+"""
+import operator
+import sys
+from array import array
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+# Valores centinela para "campo ausente" en columnas numéricas
+_MISSING_INT = -(2 ** 63)
+
+
+class _Missing:
+    """Centinela de "campo ausente" que conserva su identidad al hacer pickle"""
+
+    def __reduce__(self):
+        return "_MISSING"
+
+
+_MISSING = _Missing()
+
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+
+# Campos candidatos a columna de timestamp (ISO 8601 → entero en microsegundos)
+_TIMESTAMP_SUFFIXES = ("_at", "timestamp", "fecha")
+
+
+def _parse_timestamp(value: str) -> Optional[int]:
+    """ISO 8601 sin zona horaria → microsegundos, solo si la conversión es exacta"""
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    if parsed.tzinfo is not None:
+        return None
+    micros = (parsed - _EPOCH) // _MICROSECOND
+    return micros if _format_timestamp(micros) == value else None
+
+
+def _format_timestamp(micros: int) -> str:
+    return (_EPOCH + timedelta(microseconds=micros)).isoformat()
+
+
+class _Column:
+    """Columna tipada; 'kind' se decide con el primer valor recibido"""
+
+    def __init__(self, key: str, first_value: Any, length: int):
+        self.kind = self._infer_kind(key, first_value)
+        if self.kind == "category":
+            self.codes = array('i', [-1]) * length
+            self.values: List[Any] = []
+            self.lookup: Dict[Any, int] = {}
+        elif self.kind in ("int", "timestamp"):
+            self.data = array('q', [_MISSING_INT]) * length
+        elif self.kind == "float":
+            self.data = array('d', [float('nan')]) * length
+            self.present = bytearray(length)
+        else:
+            self.data = [_MISSING] * length
+
+    @staticmethod
+    def _infer_kind(key: str, value: Any) -> str:
+        if isinstance(value, bool):
+            return "category"
+        if isinstance(value, int):
+            return "int"
+        if isinstance(value, float):
+            return "float"
+        if isinstance(value, str) and key.endswith(_TIMESTAMP_SUFFIXES) and _parse_timestamp(value) is not None:
+            return "timestamp"
+        try:
+            hash(value)
+            return "category"
+        except TypeError:
+            return "object"
+
+    def __len__(self) -> int:
+        return len(self.codes) if self.kind == "category" else len(self.data)
+
+    def encode(self, value: Any) -> bool:
+        """Añadir un valor al final; False si no encaja (queda como ausente)"""
+        self.append_missing()
+        return self.assign(len(self) - 1, value)
+
+    def assign(self, position: int, value: Any) -> bool:
+        """Sustituir el valor de una posición; False si no encaja en el tipo"""
+        kind = self.kind
+        if kind == "category":
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                return False
+            try:
+                code = self.lookup.get(value)
+            except TypeError:
+                return False
+            if code is None:
+                code = len(self.values)
+                self.values.append(value)
+                self.lookup[value] = code
+            self.codes[position] = code
+        elif kind == "int":
+            if not isinstance(value, int) or isinstance(value, bool) or not _MISSING_INT < value < 2 ** 63:
+                return False
+            self.data[position] = value
+        elif kind == "float":
+            if not isinstance(value, float):
+                return False
+            self.data[position] = value
+            self.present[position] = 1
+        elif kind == "timestamp":
+            micros = _parse_timestamp(value) if isinstance(value, str) else None
+            if micros is None:
+                return False
+            self.data[position] = micros
+        else:
+            self.data[position] = value
+        return True
+
+    def append_missing(self):
+        if self.kind == "category":
+            self.codes.append(-1)
+        elif self.kind in ("int", "timestamp"):
+            self.data.append(_MISSING_INT)
+        elif self.kind == "float":
+            self.data.append(float('nan'))
+            self.present.append(0)
+        else:
+            self.data.append(_MISSING)
+
+    def get(self, position: int) -> Any:
+        """Valor decodificado o _MISSING"""
+        kind = self.kind
+        if kind == "category":
+            code = self.codes[position]
+            return self.values[code] if code >= 0 else _MISSING
+        if kind == "int":
+            value = self.data[position]
+            return value if value != _MISSING_INT else _MISSING
+        if kind == "timestamp":
+            value = self.data[position]
+            return _format_timestamp(value) if value != _MISSING_INT else _MISSING
+        if kind == "float":
+            return self.data[position] if self.present[position] else _MISSING
+        return self.data[position]
+
+    def nbytes(self) -> int:
+        if self.kind == "category":
+            return (self.codes.itemsize * len(self.codes) + sys.getsizeof(self.values)
+                    + sys.getsizeof(self.lookup) + sum(sys.getsizeof(v) for v in self.values))
+        if self.kind == "object":
+            return sys.getsizeof(self.data) + sum(sys.getsizeof(v) for v in self.data if v is not _MISSING)
+        size = self.data.itemsize * len(self.data)
+        if self.kind == "float":
+            size += len(self.present)
+        return size
+
+
+class ColumnarMetadata:
+    """
+    Almacén de metadatos como arrays tipados por campo.
+
+    Los strings se codifican con diccionario (cada valor distinto se guarda
+    una sola vez), los timestamps ISO como enteros de 64 bits y 'doc_index'
+    no se guarda: es la propia posición. Los dicts solo se materializan al
+    acceder a una posición concreta, es decir, para los resultados devueltos.
+
+    Solo se añade al final y las columnas nuevas se publican sustituyendo el
+    dict completo, así que un único escritor puede añadir mientras otros
+    hilos leen posiciones ya existentes sin bloqueo.
+    """
+
+    def __init__(self):
+        self._length = 0
+        self._columns: Dict[str, _Column] = {}
+        self._extras: Dict[int, Dict[str, Any]] = {}  # Valores que no encajan en su columna
+
+    @classmethod
+    def from_records(cls, records: Iterable[Dict[str, Any]]) -> "ColumnarMetadata":
+        """Convertir una lista de dicts (formato antiguo de metadata.pkl)"""
+        store = cls()
+        for record in records:
+            store.append(record)
+        return store
+
+    def __len__(self) -> int:
+        return self._length
+
+    def append(self, metadata: Dict[str, Any]):
+        """Añadir los metadatos de un documento al final"""
+        position = self._length
+        for key, value in metadata.items():
+            if key == "doc_index":
+                continue
+            column = self._columns.get(key)
+            if column is None:
+                column = _Column(key, value, position)
+                self._columns = {**self._columns, key: column}
+            if not column.encode(value):
+                self._extras.setdefault(position, {})[key] = value
+
+        for key, column in self._columns.items():
+            if key not in metadata:
+                column.append_missing()
+        self._length += 1
+
+    def set(self, position: int, key: str, value: Any):
+        """
+        Actualizar un campo de un documento existente.
+
+        Cada escritura es una asignación de un elemento, así que los lectores
+        ven el valor anterior o el nuevo.
+        """
+        if not 0 <= position < self._length:
+            raise IndexError("posición de metadatos fuera de rango")
+        if key == "doc_index":
+            raise ValueError("'doc_index' es la posición y no se puede modificar")
+
+        column = self._columns.get(key)
+        if column is None:
+            column = _Column(key, value, self._length)
+            self._columns = {**self._columns, key: column}
+
+        extras = self._extras.get(position)
+        if column.assign(position, value):
+            if extras and key in extras:
+                self._extras[position] = {k: v for k, v in extras.items() if k != key}
+        else:
+            self._extras[position] = {**(extras or {}), key: value}
+
+    def get(self, position: int, key: str, default: Any = None) -> Any:
+        """Leer un solo campo sin materializar el dict"""
+        extras = self._extras.get(position)
+        if extras and key in extras:
+            return extras[key]
+        if key == "doc_index":
+            return position
+        column = self._columns.get(key)
+        if column is None:
+            return default
+        value = column.get(position)
+        return default if value is _MISSING else value
+
+    def column(self, key: str) -> Iterator[Any]:
+        """Recorrer un campo en todas las posiciones (None si falta)"""
+        for position in range(self._length):
+            yield self.get(position, key)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return [self[i] for i in range(*item.indices(self._length))]
+        item = operator.index(item)
+        if item < 0:
+            item += self._length
+        if not 0 <= item < self._length:
+            raise IndexError("posición de metadatos fuera de rango")
+
+        record = {}
+        for key, column in self._columns.items():
+            value = column.get(item)
+            if value is not _MISSING:
+                record[key] = value
+        record.update(self._extras.get(item, {}))
+        record["doc_index"] = item
+        return record
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for position in range(self._length):
+            yield self[position]
+
+    def memory_usage(self, sample_size: int = 1000) -> Dict[str, Any]:
+        """
+        Comparar la memoria de las columnas con la de una lista de dicts.
+
+        El tamaño como dicts se estima materializando una muestra.
+        """
+        columnar = sum(column.nbytes() for column in self._columns.values())
+        columnar += sum(sys.getsizeof(e) + sum(sys.getsizeof(v) for v in e.values())
+                        for e in self._extras.values())
+
+        as_dicts = 0
+        if self._length:
+            step = max(1, self._length // sample_size)
+            sample = range(0, self._length, step)
+            sampled = sum(
+                sys.getsizeof(record) + sum(sys.getsizeof(v) for v in record.values())
+                for record in (self[i] for i in sample)
+            )
+            as_dicts = sampled * self._length // len(sample) + sys.getsizeof([None] * self._length)
+
+        return {
+            "columns": len(self._columns),
+            "columnar_bytes": columnar,
+            "dict_bytes_estimate": as_dicts,
+            "saving_ratio": round(as_dicts / columnar, 2) if columnar else 0.0
+        }
@@ -0,0 +1,167 @@
+"""
+Almacenamiento de objetos intercambiable (S3 o un directorio local)
+"""
+import logging
+import os
+import threading
+from abc import ABC, abstractmethod
+from typing import List, Optional
+
+from config.settings import settings
+from .persistence import atomic_write
+
+logger = logging.getLogger(__name__)
+
+
+class ObjectStore(ABC):
+    """Interfaz mínima clave → bytes para publicar snapshots"""
+
+    @abstractmethod
+    def put(self, key: str, data: bytes):
+        """Guardar un objeto (sobrescribe si existe)"""
+
+    @abstractmethod
+    def put_if_absent(self, key: str, data: bytes) -> bool:
+        """Guardar un objeto solo si no existe (atómico); False si ya existía"""
+
+    @abstractmethod
+    def get(self, key: str) -> bytes:
+        """Leer un objeto; KeyError si no existe"""
+
+    @abstractmethod
+    def exists(self, key: str) -> bool:
+        """Comprobar si existe un objeto"""
+
+    @abstractmethod
+    def list(self, prefix: str = "") -> List[str]:
+        """Claves que empiezan por el prefijo"""
+
+
+class LocalDirectoryObjectStore(ObjectStore):
+    """
+    Objetos como archivos dentro de un directorio.
+
+    Sirve como sustituto local de S3 en pruebas y en despliegues con un
+    disco compartido. Las escrituras son atómicas.
+    """
+
+    def __init__(self, root: str):
+        self.root = os.path.abspath(root)
+        os.makedirs(self.root, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        path = os.path.abspath(os.path.join(self.root, key))
+        if os.path.commonpath([self.root, path]) != self.root:
+            raise ValueError(f"Clave fuera del almacén: {key}")
+        return path
+
+    def put(self, key: str, data: bytes):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with atomic_write(path) as f:
+            f.write(data)
+
+    def put_if_absent(self, key: str, data: bytes) -> bool:
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            # link falla si el destino existe: se publica completo o no se publica
+            os.link(tmp_path, path)
+            return True
+        except FileExistsError:
+            return False
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def get(self, key: str) -> bytes:
+        try:
+            with open(self._path(key), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            raise KeyError(key)
+
+    def exists(self, key: str) -> bool:
+        return os.path.isfile(self._path(key))
+
+    def list(self, prefix: str = "") -> List[str]:
+        keys = []
+        for directory, _, files in os.walk(self.root):
+            for name in files:
+                key = os.path.relpath(os.path.join(directory, name), self.root).replace(os.sep, "/")
+                if key.startswith(prefix) and ".tmp-" not in name:
+                    keys.append(key)
+        return sorted(keys)
+
+
+class S3ObjectStore(ObjectStore):
+    """Objetos en un bucket de S3 (requiere boto3)"""
+
+    def __init__(self, bucket: str, region: Optional[str] = None):
+        self.bucket = bucket
+        self.region = region
+        self._client = None
+
+    def __getstate__(self):
+        # El cliente de boto3 no se puede serializar; se recrea al usarlo
+        state = self.__dict__.copy()
+        state["_client"] = None
+        return state
+
+    @property
+    def client(self):
+        if self._client is None:
+            try:
+                import boto3
+            except ImportError:
+                raise ImportError("S3ObjectStore requiere boto3: pip install boto3")
+            self._client = boto3.client(
+                "s3",
+                region_name=self.region,
+                aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+                aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY
+            )
+        return self._client
+
+    def put(self, key: str, data: bytes):
+        self.client.put_object(Bucket=self.bucket, Key=key, Body=data)
+
+    def put_if_absent(self, key: str, data: bytes) -> bool:
+        try:
+            self.client.put_object(Bucket=self.bucket, Key=key, Body=data, IfNoneMatch="*")
+        except self.client.exceptions.ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("PreconditionFailed", "ConditionalRequestConflict"):
+                return False
+            raise
+        return True
+
+    def get(self, key: str) -> bytes:
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=key)["Body"].read()
+        except self.client.exceptions.NoSuchKey:
+            raise KeyError(key)
+
+    def exists(self, key: str) -> bool:
+        response = self.client.list_objects_v2(Bucket=self.bucket, Prefix=key, MaxKeys=1)
+        return any(item["Key"] == key for item in response.get("Contents", []))
+
+    def list(self, prefix: str = "") -> List[str]:
+        keys = []
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix):
+            keys.extend(item["Key"] for item in page.get("Contents", []))
+        return keys
+
+
+def object_store_from_settings() -> Optional[ObjectStore]:
+    """S3 si hay bucket configurado, si no el directorio local (o None)"""
+    if settings.S3_BUCKET:
+        return S3ObjectStore(settings.S3_BUCKET, settings.AWS_REGION)
+    if settings.OBJECT_STORE_DIR:
+        return LocalDirectoryObjectStore(settings.OBJECT_STORE_DIR)
+    return None
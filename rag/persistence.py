@@ -0,0 +1,151 @@
+"""
+Escritura segura entre procesos en el directorio del almacén vectorial
+"""
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, Iterator
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin flock
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = "manifest.json"
+LOCK_NAME = ".lock"
+
+
+class DirectoryLock:
+    """
+    Lock de archivo sobre el directorio de persistencia.
+
+    Con fcntl se usa flock: exclusivo para escribir y compartido para leer,
+    de modo que varios lectores pueden cargar a la vez pero nunca mientras
+    un escritor reemplaza archivos. El lock pertenece al descriptor abierto,
+    así que también separa instancias distintas dentro del mismo proceso.
+    Sin fcntl se recurre a un archivo creado con O_EXCL (siempre exclusivo).
+    """
+
+    def __init__(self, directory: str, timeout: float = 30.0, poll_interval: float = 0.05):
+        """
+        Args:
+            directory: Directorio a proteger
+            timeout: Segundos máximos de espera por el lock
+            poll_interval: Espera entre intentos
+        """
+        self.path = os.path.join(directory, LOCK_NAME)
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+
+    def _wait(self, try_acquire):
+        deadline = time.monotonic() + self.timeout
+        while not try_acquire():
+            if time.monotonic() >= deadline:
+                raise TimeoutError(f"No se pudo obtener el lock {self.path} en {self.timeout}s")
+            time.sleep(self.poll_interval)
+
+    @contextmanager
+    def _flock(self, operation: int) -> Iterator[None]:
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            def try_acquire():
+                try:
+                    fcntl.flock(fd, operation | fcntl.LOCK_NB)
+                    return True
+                except BlockingIOError:
+                    return False
+
+            self._wait(try_acquire)
+            try:
+                yield
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
+
+    @contextmanager
+    def _exclusive_file(self) -> Iterator[None]:
+        path = self.path + ".excl"
+
+        def try_acquire():
+            try:
+                os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                return True
+            except FileExistsError:
+                return False
+
+        self._wait(try_acquire)
+        try:
+            yield
+        finally:
+            os.remove(path)
+
+    def exclusive(self):
+        """Lock para escribir (un solo proceso)"""
+        if fcntl is None:
+            return self._exclusive_file()
+        return self._flock(fcntl.LOCK_EX)
+
+    def shared(self):
+        """Lock para leer (varios procesos a la vez)"""
+        if fcntl is None:
+            return self._exclusive_file()
+        return self._flock(fcntl.LOCK_SH)
+
+
+@contextmanager
+def atomic_path(path: str) -> Iterator[str]:
+    """
+    Ruta temporal que reemplaza a 'path' con os.replace al terminar.
+
+    Los lectores ven el archivo anterior o el nuevo completo, nunca uno a
+    medio escribir. Si la escritura falla el archivo original no se toca.
+    """
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    try:
+        yield tmp_path
+        with open(tmp_path, 'rb') as f:
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+@contextmanager
+def atomic_write(path: str, mode: str = 'wb', **kwargs):
+    """Abrir un archivo temporal que se publica de forma atómica al cerrarse"""
+    with atomic_path(path) as tmp_path:
+        with open(tmp_path, mode, **kwargs) as f:
+            yield f
+
+
+def read_manifest(directory: str) -> Dict[str, Any]:
+    """Leer el manifiesto del directorio (generación 0 si aún no existe)"""
+    path = os.path.join(directory, MANIFEST_NAME)
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"generation": 0}
+    except (OSError, ValueError) as e:
+        logger.warning(f"Manifiesto ilegible en {path}: {e}")
+        return {"generation": 0}
+
+
+def write_manifest(directory: str, generation: int, **fields) -> Dict[str, Any]:
+    """Publicar una generación nueva; se escribe al final, después de los datos"""
+    manifest = {
+        "generation": generation,
+        "updated_at": datetime.now().isoformat(),
+        "pid": os.getpid(),
+        **fields
+    }
+    with atomic_write(os.path.join(directory, MANIFEST_NAME), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    return manifest
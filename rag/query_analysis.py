@@ -0,0 +1,95 @@
+"""
+Análisis de una consulta hecho una sola vez y compartido por todas las etapas
+"""
+import re
+import threading
+from typing import Callable, Optional, Tuple
+
+import numpy as np
+
+from .exact_index import key_candidates
+from .text import words
+
+# Palabras clave de intents básicos, en orden de prioridad (saludos, despedidas, etc.)
+INTENT_KEYWORDS = {
+    'saludo': ['hola', 'buen día', 'buenas', 'saludos', 'qué tal', 'cómo estás'],
+    'despedida': ['adiós', 'hasta luego', 'chao', 'bye', 'nos vemos'],
+    'gracias': ['gracias', 'agradecido', 'agradezco'],
+    'ayuda_general': ['ayuda', 'ayúdame', 'asistencia', 'soporte']
+}
+# Tipos que se responden siempre con un intent
+ALWAYS_INTENT_PRIORITIES = ('saludo', 'despedida', 'gracias')
+# Preguntas técnicas/complejas: van a RAG
+QUESTION_WORDS = ['cómo', 'dónde', 'cuándo', 'qué', 'por qué', 'cuál', 'cuánto']
+
+# Compiladas una vez: una expresión por tipo (coincidencia como subcadena, igual que 'in')
+_KEYWORD_PATTERNS = [
+    (intent_type, re.compile("|".join(re.escape(keyword) for keyword in keywords)))
+    for intent_type, keywords in INTENT_KEYWORDS.items()
+]
+_QUESTION_PATTERN = re.compile("|".join(re.escape(word) for word in QUESTION_WORDS))
+_CLEAN_PATTERN = re.compile(r'[^\w\sáéíóúüñÁÉÍÓÚÜÑ¿?]')
+
+
+class QueryAnalysis:
+    """
+    Consulta normalizada una vez por petición.
+
+    Guarda el texto original, en minúsculas y limpio (sin puntuación), sus
+    palabras normalizadas (palabras clave y BM25) y sus candidatos a folio
+    o código (búsqueda exacta), los tipos de intent básico cuyas palabras
+    clave aparecen y la prioridad resultante. El embedding se calcula la primera vez que una
+    etapa lo pide y lo reutilizan las demás (intents semánticos, caché
+    semántica, búsqueda).
+    """
+
+    def __init__(self, text: str, embed: Optional[Callable[[str], np.ndarray]] = None,
+                 embedding: Optional[np.ndarray] = None):
+        """
+        Args:
+            text: Consulta del usuario
+            embed: Función texto → embedding (se llama como mucho una vez)
+            embedding: Embedding ya calculado (opcional)
+        """
+        self.text = text.strip()
+        self.normalized = self.text.lower()
+        self.clean = _CLEAN_PATTERN.sub('', self.normalized).strip()
+        self.tokens: Tuple[str, ...] = tuple(words(self.text))
+        self.key_candidates: Tuple[str, ...] = tuple(key_candidates(self.text))
+        self.keyword_hits: Tuple[str, ...] = tuple(
+            intent_type for intent_type, pattern in _KEYWORD_PATTERNS if pattern.search(self.normalized)
+        )
+        self._embed = embed
+        self._embedding = embedding
+        self._embedding_lock = threading.Lock()
+        self._source: Optional["QueryAnalysis"] = None  # Consulta original de with_text()
+
+    @property
+    def priority(self) -> str:
+        """Tipo de consulta para decidir entre intent y RAG"""
+        if self.keyword_hits:
+            return self.keyword_hits[0]
+        if _QUESTION_PATTERN.match(self.normalized):
+            return 'rag_preferido'
+        return 'neutral'
+
+    @property
+    def embedding(self) -> np.ndarray:
+        """Embedding de la consulta original (calculado una sola vez)"""
+        if self._source is not None:
+            return self._source.embedding
+        if self._embedding is None:
+            with self._embedding_lock:
+                if self._embedding is None:
+                    if self._embed is None:
+                        raise ValueError("QueryAnalysis sin función de embedding")
+                    self._embedding = self._embed(self.text)
+        return self._embedding
+
+    def with_text(self, text: str) -> "QueryAnalysis":
+        """Análisis de otro texto (p. ej. la consulta corregida) que comparte el embedding de esta"""
+        if text.strip() == self.text:
+            return self
+        analysis = QueryAnalysis(text)
+        analysis._source = self._source or self
+        return analysis
@@ -0,0 +1,207 @@
+"""
+Cachés de respuestas del sistema RAG: por consulta exacta y por similitud semántica
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+import faiss
+import numpy as np
+
+# Vecinos revisados por consulta: si el más parecido caducó, puede servir el siguiente
+_SEMANTIC_NEIGHBORS = 8
+
+
+class ResponseCache:
+    """
+    Respuestas por consulta, válidas para una versión del almacén.
+
+    Cada entrada guarda la versión (documentos e intents) con la que se
+    calculó: si la versión actual es otra, la entrada se descarta al
+    leerla, así que una ingesta o una recarga de intents invalida la caché
+    sin recorrerla. Las entradas caducan además a los ttl_seconds y, llena
+    la caché, se expulsa la usada hace más tiempo.
+    """
+
+    def __init__(self, max_size: int = 1000, ttl_seconds: float = 300):
+        """
+        Args:
+            max_size: Entradas como máximo
+            ttl_seconds: Segundos de validez de cada entrada
+        """
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        # consulta → (versión, caducidad, valor)
+        self._entries: "OrderedDict[str, Tuple[Hashable, float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidated = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str, version: Hashable) -> Optional[Any]:
+        """Valor guardado para la consulta, o None si no hay, caducó o es de otra versión"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry_version, expires_at, value = entry
+                if entry_version == version and expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+                self.invalidated += 1
+            self.misses += 1
+            return None
+
+    def put(self, key: str, version: Hashable, value: Any):
+        """Guardar el valor de una consulta calculado con una versión"""
+        with self._lock:
+            self._entries[key] = (version, time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidated": self.invalidated,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None
+        }
+
+
+class SemanticResponseCache:
+    """
+    Respuestas de preguntas recientes, encontradas por similitud de embeddings.
+
+    Los embeddings de las preguntas respondidas se guardan en un índice
+    FAISS plano de producto interno (pocos cientos de vectores), así que
+    "¿cómo cambio mi correo?" y "quiero modificar mi email" comparten
+    respuesta si su similitud coseno llega a min_similarity. Al cambiar la
+    versión del almacén se vacía entera: todas sus respuestas son de la
+    versión anterior. Llena, se expulsa la pregunta usada hace más tiempo;
+    las caducadas se quitan al encontrarlas en una búsqueda.
+
+    Una fracción de los aciertos se recalcula (record_audit) para estimar
+    cuántos devolverían una respuesta distinta (falsos aciertos).
+    """
+
+    def __init__(self, dimension: int, min_similarity: float = 0.95, max_size: int = 500,
+                 ttl_seconds: float = 300):
+        """
+        Args:
+            dimension: Dimensión de los embeddings
+            min_similarity: Similitud coseno mínima para reutilizar una respuesta
+            max_size: Preguntas guardadas como máximo
+            ttl_seconds: Segundos de validez de cada respuesta
+        """
+        self.min_similarity = min_similarity
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._index = faiss.IndexIDMap2(faiss.IndexFlatIP(dimension))
+        # id → (caducidad, valor), en orden de uso
+        self._entries: "OrderedDict[int, Tuple[float, Any]]" = OrderedDict()
+        self._version: Optional[Hashable] = None
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.audited = 0
+        self.false_hits = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def _normalized(embedding: np.ndarray) -> np.ndarray:
+        vector = np.asarray(embedding, dtype='float32').reshape(1, -1)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def _check_version(self, version: Hashable):
+        """Vaciar la caché si los datos cambiaron (con el lock tomado)"""
+        if version != self._version:
+            self._index.reset()
+            self._entries.clear()
+            self._version = version
+
+    def _remove(self, *entry_ids: int):
+        for entry_id in entry_ids:
+            del self._entries[entry_id]
+        self._index.remove_ids(np.array(entry_ids, dtype='int64'))
+
+    def get(self, embedding: np.ndarray, version: Hashable) -> Optional[Any]:
+        """Respuesta de la pregunta vigente más parecida, o None si ninguna llega al umbral"""
+        with self._lock:
+            self._check_version(version)
+            found = None
+            if self._entries:
+                now = time.monotonic()
+                k = min(len(self._entries), _SEMANTIC_NEIGHBORS)
+                similarities, ids = self._index.search(self._normalized(embedding), k)
+                expired = []
+                for similarity, entry_id in zip(similarities[0], ids[0]):
+                    entry_id = int(entry_id)
+                    if entry_id < 0:
+                        break
+                    expires_at, value = self._entries[entry_id]
+                    if expires_at <= now:
+                        expired.append(entry_id)
+                    elif found is None and similarity >= self.min_similarity:
+                        found = (entry_id, value)
+                if expired:
+                    self._remove(*expired)
+            if found is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(found[0])
+            self.hits += 1
+            return found[1]
+
+    def put(self, embedding: np.ndarray, version: Hashable, value: Any):
+        """Guardar la respuesta de una pregunta calculada con una versión"""
+        with self._lock:
+            self._check_version(version)
+            entry_id = self._next_id
+            self._next_id += 1
+            self._index.add_with_ids(self._normalized(embedding), np.array([entry_id], dtype='int64'))
+            self._entries[entry_id] = (time.monotonic() + self.ttl_seconds, value)
+            while len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+
+    def record_audit(self, false_hit: bool):
+        """Resultado de recalcular un acierto: False si la respuesta guardada era la correcta"""
+        with self._lock:
+            self.audited += 1
+            self.false_hits += int(false_hit)
+
+    def clear(self):
+        with self._lock:
+            self._index.reset()
+            self._entries.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "min_similarity": self.min_similarity,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            "audited": self.audited,
+            "false_hits": self.false_hits,
+            "false_hit_rate": round(self.false_hits / self.audited, 4) if self.audited else None
+        }
@@ -7,29 +7,85 @@ import pickle
 import json
 import os
 import hashlib
-from typing import List, Dict, Any, Optional, Tuple
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, FrozenSet, List, Optional, Sequence, Tuple
 import logging
 from datetime import datetime
 
 from config.settings import settings  # <-- SE AÑADIO ESTA LINEA
+from .document_store import CompressedTextStore
+from .chunking import CHUNK_FIELDS
+from .bundle import (INTENTS_NAME, export_bundle, file_checksum, iter_bundle, read_bundle_intents,
+                     read_bundle_manifest)
+from .embedding_matrix import EmbeddingMatrix
+from .exact_index import ExactKeyIndex, normalize_key
+from .intent_matcher import COMMON_KEYWORDS, IntentMatcher, read_artifact_header
+from .bm25 import SPANISH_STOPWORDS, BM25Index
+from .dedup import NearDuplicateIndex
+from .keyword_index import KeywordIndex
+from .text import as_keywords
+from .metadata_store import ColumnarMetadata
+from .object_store import ObjectStore, object_store_from_settings
+from .persistence import DirectoryLock, atomic_write, read_manifest, write_manifest
+from .snapshot_sync import publish_snapshot, pull_snapshot
+from .spelling import SymSpellIndex
+from .routing import CentroidRouter
+from .sharding import ShardedIndex, shard_executor
+from .tiered_index import TieredIndex, build_index, from_similarity, similarity_radius, to_similarity
 
 logger = logging.getLogger(__name__)
 
+
+@dataclass(frozen=True)
+class StoreSnapshot:
+    """
+    Vista inmutable del almacén con la que se sirven las búsquedas.
+    
+    Los documentos y metadatos solo crecen por el final, así que basta con
+    recordar cuántos son visibles ('size'); los índices FAISS de una
+    instantánea nunca se modifican. Los borrados no tocan las estructuras
+    publicadas: construyen copias y las publican con la instantánea nueva.
+    """
+    version: int
+    index: TieredIndex
+    shards: Optional[ShardedIndex]
+    documents: CompressedTextStore
+    metadata: ColumnarMetadata
+    exact_keys: ExactKeyIndex
+    keywords: KeywordIndex
+    bm25: BM25Index
+    router: Optional[CentroidRouter]
+    deleted: FrozenSet[int]
+    doc_id_to_idx: Dict[str, int]
+    parent_to_chunks: Dict[str, List[int]]
+    size: int
+
+
 class VectorStoreFAISS:
     """
     Almacén vectorial optimizado para CPU usando FAISS.
     Compatible con AWS Lambda + S3 para futura migración.
+    
+    Un único escritor (protegido por un lock) construye índices nuevos y
+    publica una StoreSnapshot de forma atómica; las búsquedas leen la
+    instantánea vigente y nunca toman el lock.
     """
     
-    def __init__(self, persist_directory: str = None):
+    def __init__(self, persist_directory: str = None, shard_key: Optional[str] = None):
         """
         Inicializar almacén vectorial FAISS.
         
         Args:
             persist_directory: Directorio para persistir índices
+            shard_key: Campo de metadatos para particionar el índice (None = sin shards)
         """
         if persist_directory is None:
             persist_directory = settings.FAISS_PERSIST_DIR
+        if shard_key is None:
+            shard_key = settings.FAISS_SHARD_KEY
         
         
         self.persist_directory = persist_directory
@@ -37,19 +93,60 @@ class VectorStoreFAISS:
         
         # Rutas de archivos
         self.index_path = os.path.join(persist_directory, "faiss_index.bin")
+        self.delta_path = os.path.join(persist_directory, "faiss_delta.bin")
         self.documents_path = os.path.join(persist_directory, "documents.pkl")
         self.metadata_path = os.path.join(persist_directory, "metadata.pkl")
-        self.intents_path = os.path.join(persist_directory, "intents.json")
+        self.intents_path = os.path.join(persist_directory, "intents.json")  # Solo lectura (versiones anteriores)
+        self.intents_artifact_path = os.path.join(persist_directory, "intents.bin")
+        self.intents_overlay_path = os.path.join(persist_directory, "intents_overlay.json")  # Cambios sueltos
+        self.deleted_path = os.path.join(persist_directory, "deleted.json")
+        self.bm25_path = os.path.join(persist_directory, "bm25.pkl")
+        self.dedup_path = os.path.join(persist_directory, "dedup.pkl")
+        self.embeddings_path = os.path.join(persist_directory, "embeddings.npy")
+        self.journal_path = os.path.join(persist_directory, "journal.pkl")  # Cambios desde la última consolidación
         
         # Configuración
         self.embedding_dim = 384  # Dimensión de MiniLM
         
         # Datos en memoria
-        self.index = None
-        self.documents = []      # Lista de textos completos
-        self.metadata = []       # Lista de metadatos
+        self.documents = self._new_document_store()  # Textos completos comprimidos
+        self.metadata = ColumnarMetadata()  # Metadatos en columnas
+        self.exact_keys = self._new_exact_keys()  # Folio / código → documento
+        self.keywords = self._new_keyword_index()  # Palabras clave curadas → documentos
+        self.bm25 = BM25Index()  # Índice léxico para búsqueda híbrida
+        self.dedup = self._new_dedup_index()  # Firmas MinHash para casi duplicados
+        self.embeddings = self._new_embedding_matrix()  # Vectores indexados, por posición
+        self.deleted = frozenset()  # Posiciones borradas (tombstones)
         self.intents = {}        # Datos de intents
+        self._compiled_intents = None  # IntentMatcher de self.intents
+        self._intent_embedder = None   # Codifica los patrones de intents (opcional)
+        self._intents_source = None    # Archivo de origen de los intents (recarga y cambios sueltos)
+        self._intents_watcher = None   # Hilo que vigila el archivo de origen
+        self._spelling = None  # SymSpellIndex de patrones de intents y términos del corpus
+        self._spelling_source = (None, None, 0)  # (IntentMatcher, BM25Index, términos ya añadidos)
+        self._spelling_lock = threading.Lock()
         self.doc_id_to_idx = {}  # Mapeo ID → índice
+        self.parent_to_chunks = {}  # parent_id → posiciones de sus fragmentos, en orden
+        self.shard_key = shard_key  # Índices por shard (opcional)
+        # Un solo pool para todas las versiones de los shards (recargas incluidas)
+        self._shard_executor = shard_executor() if shard_key else None
+        self.router = self._new_router()  # Centroides por shard para enrutar consultas
+        
+        # Escritura entre procesos: lock de directorio + generación publicada
+        self.lock = DirectoryLock(persist_directory, timeout=settings.STORE_LOCK_TIMEOUT_SECONDS)
+        self.generation = 0
+        self._last_refresh_check = time.monotonic()
+        
+        # Instantánea publicada para lectura (índice principal + delta, shards)
+        self._write_lock = threading.RLock()
+        self._stop_merger = threading.Event()
+        self._snapshot = None
+        self._empty_snapshot()
+        
+        # Consolidación: los archivos completos se reescriben cada STORE_CHECKPOINT_DOCS documentos
+        self._checkpoint = (0, 0)  # (documentos, vectores) en los archivos completos
+        self._journal_updates: Dict[int, Dict[str, Any]] = {}  # Metadatos cambiados de documentos consolidados
+        self._saved_main = None  # Índice principal que ya está en disco
         
         # Estadísticas
         self.stats = {
@@ -59,86 +156,497 @@ class VectorStoreFAISS:
         
         # Cargar datos existentes
         self._load_existing()
+        if settings.SNAPSHOT_PULL_ON_START and len(self.documents) == 0:
+            try:
+                self.pull_snapshot()
+            except Exception as e:
+                logger.warning(f"No se pudo descargar el snapshot inicial: {e}")
+        self._start_merger(settings.DELTA_MERGE_CHECK_SECONDS)
         logger.info(f"VectorStoreFAISS inicializado. Documentos: {len(self.documents)}")
     
     def _load_existing(self):
         """Cargar datos existentes desde disco"""
         try:
-            # Cargar índice FAISS
-            if os.path.exists(self.index_path) and os.path.getsize(self.index_path) > 0:
-                self.index = faiss.read_index(self.index_path)
-                logger.info(f"Índice FAISS cargado: {self.index.ntotal} vectores")
-            
-            # Cargar documentos
-            if os.path.exists(self.documents_path) and os.path.getsize(self.documents_path) > 0:
-                with open(self.documents_path, 'rb') as f:
-                    self.documents = pickle.load(f)
-            
-            # Cargar metadatos
-            if os.path.exists(self.metadata_path) and os.path.getsize(self.metadata_path) > 0:
-                with open(self.metadata_path, 'rb') as f:
-                    self.metadata = pickle.load(f)
-            
-            # Cargar intents
-            if os.path.exists(self.intents_path) and os.path.getsize(self.intents_path) > 0:
-                with open(self.intents_path, 'r', encoding='utf-8') as f:
-                    self.intents = json.load(f)
-            
-            # Reconstruir mapeo ID → índice
-            for idx, meta in enumerate(self.metadata):
-                if "doc_id" in meta:
-                    self.doc_id_to_idx[meta["doc_id"]] = idx
-            
-            self.stats["total_documents"] = len(self.documents)
+            with self.lock.shared():
+                self._adopt(*self._read_from_disk())
+            
             self.stats["last_updated"] = datetime.now().isoformat()
             
         except Exception as e:
             logger.warning(f"No se pudieron cargar datos existentes: {e}")
             # Inicializar vacío
-            self.index = None
-            self.documents = []
-            self.metadata = []
+            self.documents = self._new_document_store()
+            self.metadata = ColumnarMetadata()
+            self.exact_keys = self._new_exact_keys()
+            self.keywords = self._new_keyword_index()
+            self.bm25 = BM25Index()
+            self.dedup = self._new_dedup_index()
+            self.embeddings = self._new_embedding_matrix()
+            self.router = self._new_router()
+            self.deleted = frozenset()
             self.intents = {"intents": []}
+            self._empty_snapshot()
+    
+    def _read_from_disk(self):
+        """Leer la generación publicada en disco (llamar con el lock del directorio)"""
+        generation = read_manifest(self.persist_directory)["generation"]
+        
+        # Cargar índice FAISS (principal + delta pendiente de volcar)
+        main, delta = None, None
+        if os.path.exists(self.index_path) and os.path.getsize(self.index_path) > 0:
+            main = faiss.read_index(self.index_path)
+        if os.path.exists(self.delta_path) and os.path.getsize(self.delta_path) > 0:
+            delta = faiss.read_index(self.delta_path)
+        index = TieredIndex(self.embedding_dim, main=main, delta=delta)
+        if index.ntotal:
+            logger.info(f"Índice FAISS cargado: {index.ntotal} vectores")
+        
+        # Cargar documentos (lista de textos sin comprimir en versiones anteriores)
+        documents = self._new_document_store()
+        if os.path.exists(self.documents_path) and os.path.getsize(self.documents_path) > 0:
+            with open(self.documents_path, 'rb') as f:
+                documents = pickle.load(f)
+            if isinstance(documents, list):
+                documents = self._new_document_store(documents)
+            documents.cache_size = settings.DOC_CACHE_SIZE
+        
+        # Cargar metadatos (lista de dicts en versiones anteriores)
+        metadata = ColumnarMetadata()
+        if os.path.exists(self.metadata_path) and os.path.getsize(self.metadata_path) > 0:
+            with open(self.metadata_path, 'rb') as f:
+                metadata = pickle.load(f)
+            if isinstance(metadata, list):
+                metadata = ColumnarMetadata.from_records(metadata)
+        
+        # Cargar intents: artefacto compilado (o intents.json de versiones anteriores)
+        intents, compiled_intents = self.intents, self._compiled_intents
+        header = read_artifact_header(self.intents_artifact_path)
+        if header is not None:
+            if compiled_intents is None or compiled_intents.source_hash != header["source_hash"]:
+                compiled_intents = IntentMatcher.load(self.intents_artifact_path)
+            intents = compiled_intents.source
+        elif os.path.exists(self.intents_path) and os.path.getsize(self.intents_path) > 0:
+            with open(self.intents_path, 'r', encoding='utf-8') as f:
+                intents = json.load(f)
+        
+        # Cargar documentos borrados
+        deleted = frozenset()
+        if os.path.exists(self.deleted_path):
+            with open(self.deleted_path, 'r', encoding='utf-8') as f:
+                deleted = frozenset(json.load(f))
+        
+        # Cargar índice BM25 (se reconstruye si falta o no corresponde)
+        bm25 = None
+        if os.path.exists(self.bm25_path) and os.path.getsize(self.bm25_path) > 0:
+            with open(self.bm25_path, 'rb') as f:
+                bm25 = pickle.load(f)
+        
+        # Cargar firmas de casi duplicados
+        dedup = None
+        if os.path.exists(self.dedup_path) and os.path.getsize(self.dedup_path) > 0:
+            with open(self.dedup_path, 'rb') as f:
+                dedup = pickle.load(f)
+        
+        # Cargar matriz de embeddings (con mmap)
+        embeddings = None
+        if os.path.exists(self.embeddings_path):
+            try:
+                embeddings = EmbeddingMatrix.load(self.embeddings_path, self.embedding_dim,
+                                                  settings.EMBEDDING_MATRIX_DTYPE)
+            except ValueError as e:
+                logger.warning(f"Matriz de embeddings ilegible, se regenera desde el índice: {e}")
+        
+        # Aplicar los cambios posteriores a la última consolidación
+        checkpoint = (len(documents), len(embeddings) if embeddings is not None else 0)
+        journal = None
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, 'rb') as f:
+                journal = pickle.load(f)
+            if tuple(journal["base"]) != checkpoint:
+                # Consolidación interrumpida: los archivos completos ya incluyen estos cambios
+                logger.warning(f"journal.pkl parte de {journal['base']} y los archivos de {checkpoint}: se ignora")
+                journal = None
+        if journal is not None:
+            for text, record in zip(journal["texts"], journal["metadata"]):
+                documents.append(text)
+                metadata.append(record)
+            for position, fields in journal["updates"].items():
+                for key, value in fields.items():
+                    metadata.set(position, key, value)
+            if len(journal["vectors"]):
+                if embeddings is None:
+                    embeddings = self._new_embedding_matrix()
+                embeddings.append(journal["vectors"])
+        
+        return (generation, index, documents, metadata, intents, deleted, bm25, dedup, embeddings, compiled_intents,
+                checkpoint, journal["updates"] if journal is not None else None)
+    
+    def _adopt(self, generation: int, index: TieredIndex, documents: CompressedTextStore,
+               metadata: ColumnarMetadata, intents: Dict, deleted: FrozenSet[int],
+               bm25: Optional[BM25Index] = None, dedup: Optional[NearDuplicateIndex] = None,
+               embeddings: Optional[EmbeddingMatrix] = None, compiled_intents: Optional[IntentMatcher] = None,
+               checkpoint: Tuple[int, int] = (0, 0), journal_updates: Optional[Dict[int, Dict[str, Any]]] = None):
+        """Sustituir el estado en memoria por el leído de disco y publicarlo"""
+        with self._write_lock:
+            self._checkpoint = checkpoint
+            self._journal_updates = dict(journal_updates or {})
+            self._saved_main = index.main
+
+            if embeddings is None:
+                embeddings = self._new_embedding_matrix()
+            if len(embeddings) < index.ntotal:
+                # Almacenes anteriores a la matriz: se completa con los vectores del índice
+                missing = np.arange(len(embeddings), index.ntotal)
+                embeddings.append(index.reconstruct_batch(missing))
+                logger.info(f"Matriz de embeddings completada desde el índice: {len(missing)} vectores"
+                            + (" (aproximados por PQ)" if index.index_type == "IVFPQ" else ""))
+            elif len(embeddings) > index.ntotal:
+                logger.warning(f"El índice tiene {index.ntotal} vectores y la matriz {len(embeddings)}: "
+                               f"ejecuta scripts/store_maintenance.py rebuild")
+            self.embeddings = embeddings
+            
+            self.documents = documents
+            self.metadata = metadata
+            self.intents = intents
+            if compiled_intents is not None:
+                self._compiled_intents = compiled_intents
+            self.deleted = deleted
+            self.generation = generation
+            
+            # Reconstruir mapeo ID → índice y los índices léxicos
+            self.doc_id_to_idx = {}
+            self.parent_to_chunks = {}
+            self.exact_keys = self._new_exact_keys()
+            self.keywords = self._new_keyword_index()
+            for idx in range(len(self.metadata)):
+                if idx not in deleted:
+                    self._index_metadata(idx)
+            
+            # BM25 y firmas se guardan al consolidar: se completan con los documentos posteriores
+            if bm25 is None or len(bm25) > len(self.documents):
+                bm25 = BM25Index()
+                logger.info(f"Índice BM25 reconstruido: {len(self.documents)} documentos")
+            for idx in range(len(bm25), len(self.documents)):
+                bm25.add(idx, self.documents[idx])
+            self.bm25 = bm25.without(deleted)
+            
+            if (dedup is None or dedup.size > len(self.documents)
+                    or dedup.threshold != settings.DEDUP_THRESHOLD):
+                dedup = self._new_dedup_index()
+                logger.info(f"Firmas de casi duplicados reconstruidas: {len(self.documents)} documentos")
+            for idx in range(dedup.size, len(self.documents)):
+                if idx not in deleted and self.metadata.get(idx, "duplicate_of") is None:
+                    dedup.add(idx, dedup.signature(self.documents[idx]))
+            dedup.size = len(self.documents)
+            self.dedup = dedup.without(deleted)
+            
+            self.stats["total_documents"] = len(self.documents) - len(self.deleted)
+            self._publish_rebuilt(index)
+    
+    def _publish_rebuilt(self, index: TieredIndex):
+        """Publicar un índice completo con sus shards y centroides derivados de él"""
+        self.router = self._new_router()
+        self._publish(index, self._new_shards(index.metric))
+        if self.shards is None or not index.ntotal:
+            return
+        
+        groups = self._shard_positions()
+        for shard in groups:
+            self.rebuild_shard(shard)
+        if self.router is not None:
+            self.router = self.router.with_added({
+                shard: index.reconstruct_batch([idx for idx in positions if idx not in self.deleted])
+                for shard, positions in groups.items()
+            })
+            self._publish(index, self.shards)
     
-    def _save(self):
-        """Guardar todos los datos a disco"""
+    def _sync_from_disk(self) -> bool:
+        """
+        Recargar si otro proceso publicó una generación más reciente.
+        
+        Llamar con el lock del directorio tomado. Los escritores lo hacen
+        antes de aplicar sus cambios para no pisar los de otros procesos.
+        """
+        if read_manifest(self.persist_directory)["generation"] == self.generation:
+            return False
+        
+        self._adopt(*self._read_from_disk())
+        logger.info(f"Almacén recargado desde disco: generación {self.generation}, "
+                    f"{len(self.documents)} documentos")
+        return True
+    
+    def refresh(self, force: bool = False) -> bool:
+        """
+        Detectar generaciones nuevas escritas por otros procesos y recargar.
+        
+        Solo se lee el manifiesto (como mucho cada STORE_REFRESH_SECONDS);
+        la recarga completa ocurre únicamente si cambió la generación.
+        
+        Returns:
+            True si se recargó el almacén
+        """
+        now = time.monotonic()
+        if not force and now - self._last_refresh_check < settings.STORE_REFRESH_SECONDS:
+            return False
+        self._last_refresh_check = now
+        
+        if read_manifest(self.persist_directory)["generation"] == self.generation:
+            return False
+        
+        # Si hay una escritura local en curso, ella misma sincroniza
+        if not self._write_lock.acquire(blocking=False):
+            return False
         try:
-            # Guardar índice FAISS
-            if self.index is not None:
-                faiss.write_index(self.index, self.index_path)
+            with self.lock.shared():
+                return self._sync_from_disk()
+        except Exception as e:
+            logger.warning(f"No se pudo recargar el almacén: {e}")
+            return False
+        finally:
+            self._write_lock.release()
+    
+    @property
+    def index(self) -> TieredIndex:
+        """Índice FAISS de la instantánea vigente"""
+        return self._snapshot.index
+    
+    @property
+    def shards(self) -> Optional[ShardedIndex]:
+        """Shards de la instantánea vigente (None si no hay partición)"""
+        return self._snapshot.shards
+    
+    def snapshot(self) -> StoreSnapshot:
+        """Instantánea inmutable para lecturas consistentes"""
+        return self._snapshot
+    
+    def data_version(self) -> Tuple[int, IntentMatcher]:
+        """
+        Versión de los datos con que se responde: instantánea publicada e
+        intents compilados (se comparan por identidad). Cambia con cada
+        ingesta, borrado, recarga desde disco o cambio de intents.
+        """
+        self.refresh()
+        return self._snapshot.version, self._intent_matcher()
+    
+    def _publish(self, index: TieredIndex, shards: Optional[ShardedIndex]):
+        """Publicar una instantánea nueva (una sola asignación atómica)"""
+        version = self._snapshot.version + 1 if self._snapshot is not None else 0
+        self._snapshot = StoreSnapshot(
+            version=version,
+            index=index,
+            shards=shards,
+            documents=self.documents,
+            metadata=self.metadata,
+            exact_keys=self.exact_keys,
+            keywords=self.keywords,
+            bm25=self.bm25,
+            router=self.router,
+            deleted=self.deleted,
+            doc_id_to_idx=self.doc_id_to_idx,
+            parent_to_chunks=self.parent_to_chunks,
+            size=len(self.documents)
+        )
+    
+    def _empty_snapshot(self):
+        """Publicar índices vacíos (al crear el almacén o al limpiarlo)"""
+        index = TieredIndex(self.embedding_dim)
+        self._publish(index, self._new_shards(index.metric))
+    
+    def _new_shards(self, metric: int) -> Optional[ShardedIndex]:
+        if not self.shard_key:
+            return None
+        return ShardedIndex(self.shard_key, self.embedding_dim, metric=metric, executor=self._shard_executor)
+    
+    def _new_embedding_matrix(self) -> EmbeddingMatrix:
+        return EmbeddingMatrix(self.embedding_dim, settings.EMBEDDING_MATRIX_DTYPE)
+    
+    def _new_router(self) -> Optional[CentroidRouter]:
+        if not self.shard_key or not settings.QUERY_ROUTING_ENABLED:
+            return None
+        # Las estadísticas de enrutado sobreviven a recargas y limpiezas
+        stats = self.router.stats if getattr(self, "router", None) is not None else None
+        return CentroidRouter(self.embedding_dim, settings.ROUTING_MIN_MARGIN, stats=stats)
+    
+    def _index_metadata(self, position: int, metadata: Optional[Dict] = None):
+        """Registrar un documento en el mapeo de IDs y en los índices léxicos"""
+        if metadata is None:
+            metadata = {
+                key: self.metadata.get(position, key)
+                for key in ["doc_id", "parent_id", "chunk_index", *self.exact_keys.fields, *self.keywords.fields]
+            }
+        if metadata.get("doc_id") is not None:
+            self.doc_id_to_idx[metadata["doc_id"]] = position
+        if metadata.get("parent_id") is not None:
+            self.parent_to_chunks.setdefault(metadata["parent_id"], []).append(position)
+            if metadata.get("chunk_index"):
+                return  # Folio y palabras clave se indexan una vez por documento (primer fragmento)
+        self.exact_keys.add(position, metadata)
+        self.keywords.add(position, metadata)
+    
+    @staticmethod
+    def _new_dedup_index() -> NearDuplicateIndex:
+        return NearDuplicateIndex(settings.DEDUP_THRESHOLD)
+    
+    @staticmethod
+    def _new_keyword_index() -> KeywordIndex:
+        return KeywordIndex(settings.KEYWORD_FIELDS)
+    
+    @staticmethod
+    def _new_exact_keys() -> ExactKeyIndex:
+        return ExactKeyIndex(settings.EXACT_MATCH_FIELDS)
+    
+    @staticmethod
+    def _new_document_store(texts: Optional[List[str]] = None) -> CompressedTextStore:
+        """Crear el almacén de textos comprimidos (opcionalmente desde una lista)"""
+        return CompressedTextStore.from_texts(
+            texts or [],
+            cache_size=settings.DOC_CACHE_SIZE,
+            level=settings.DOC_COMPRESSION_LEVEL,
+            train_min_docs=settings.DOC_DICT_TRAIN_MIN_DOCS
+        )
+    
+    def _save(self, checkpoint: bool = False):
+        """
+        Guardar los cambios a disco y publicar una generación nueva.
+        
+        Llamar con el lock de escritura y el del directorio tomados. Cada
+        archivo se reemplaza de forma atómica y el manifiesto se escribe al
+        final, así que los demás procesos solo ven la generación completa.
+        
+        Los documentos, metadatos y vectores añadidos desde la última
+        consolidación van a journal.pkl, que crece con el lote y no con el
+        almacén; documentos, metadatos, BM25, firmas y matriz de embeddings
+        se reescriben enteros solo al consolidar (volcado del delta,
+        reconstrucciones o STORE_CHECKPOINT_DOCS documentos en el journal).
+        
+        Args:
+            checkpoint: Consolidar aunque el journal no haya llegado al límite
+        """
+        try:
+            checkpoint = checkpoint or len(self.documents) - self._checkpoint[0] >= settings.STORE_CHECKPOINT_DOCS
             
-            # Guardar documentos
-            with open(self.documents_path, 'wb') as f:
-                pickle.dump(self.documents, f)
+            # Guardar índice FAISS (el principal solo si cambió)
+            index = self._snapshot.index
+            index.write(self.index_path, self.delta_path, write_main=index.main is not self._saved_main)
+            self._saved_main = index.main
             
-            # Guardar metadatos
-            with open(self.metadata_path, 'wb') as f:
-                pickle.dump(self.metadata, f)
+            if checkpoint:
+                # Guardar documentos
+                with atomic_write(self.documents_path) as f:
+                    pickle.dump(self.documents, f)
+                
+                # Guardar metadatos
+                with atomic_write(self.metadata_path) as f:
+                    pickle.dump(self.metadata, f)
+                
+                # Guardar índice BM25
+                with atomic_write(self.bm25_path) as f:
+                    pickle.dump(self.bm25, f)
+                
+                # Guardar firmas de casi duplicados
+                with atomic_write(self.dedup_path) as f:
+                    pickle.dump(self.dedup, f)
+                
+                # Guardar matriz de embeddings
+                self.embeddings.save(self.embeddings_path)
+                
+                if os.path.exists(self.journal_path):
+                    os.remove(self.journal_path)
+                self._checkpoint = (len(self.documents), len(self.embeddings))
+                self._journal_updates = {}
+            else:
+                self._write_journal()
             
-            # Guardar intents
-            with open(self.intents_path, 'w', encoding='utf-8') as f:
-                json.dump(self.intents, f, ensure_ascii=False, indent=2)
+            # Guardar documentos borrados
+            if self.deleted or os.path.exists(self.deleted_path):
+                with atomic_write(self.deleted_path, 'w', encoding='utf-8') as f:
+                    json.dump(sorted(self.deleted), f)
+            
+            self.generation += 1
+            write_manifest(self.persist_directory, self.generation, documents=len(self.documents))
             
             self.stats["last_updated"] = datetime.now().isoformat()
-            logger.debug("Datos guardados en disco")
+            logger.debug(f"Datos guardados en disco (generación {self.generation}"
+                         + (", consolidada)" if checkpoint else ")"))
             
         except Exception as e:
             logger.error(f"Error guardando datos: {e}")
     
-    def store_intents(self, intents_file: str):
+    def _write_journal(self):
+        """Escribir journal.pkl: lo añadido y cambiado desde la última consolidación"""
+        documents, vectors = self._checkpoint
+        with atomic_write(self.journal_path) as f:
+            pickle.dump({
+                "base": self._checkpoint,
+                "texts": [self.documents[idx] for idx in range(documents, len(self.documents))],
+                "metadata": [self.metadata[idx] for idx in range(documents, len(self.metadata))],
+                "updates": self._journal_updates,
+                "vectors": self.embeddings.vectors(range(vectors, len(self.embeddings)))
+            }, f)
+    
+    def _set_metadata(self, position: int, key: str, value: Any):
+        """Cambiar un metadato (con el lock tomado); si ya está consolidado, el cambio va al journal"""
+        self.metadata.set(position, key, value)
+        if position < self._checkpoint[0]:
+            self._journal_updates.setdefault(position, {})[key] = value
+    
+    def checkpoint(self) -> bool:
+        """
+        Consolidar: reescribir todos los archivos y vaciar journal.pkl.
+        
+        Returns:
+            True si había cambios sin consolidar
+        """
+        with self._writing():
+            if not os.path.exists(self.journal_path):
+                return False
+            self._save(checkpoint=True)
+        return True
+    
+    @contextmanager
+    def _writing(self):
         """
-        Cargar y almacenar intents desde archivo JSON.
+        Sección de escritura: lock local + lock del directorio + datos al día.
+        
+        Produce True si antes hubo que recargar cambios de otro proceso.
+        """
+        with self._write_lock, self.lock.exclusive():
+            yield self._sync_from_disk()
+    
+    def store_intents(self, intents_file: str, embed_batch: Optional[Callable[[List[str]], np.ndarray]] = None):
+        """
+        Cargar intents desde archivo JSON.
+        
+        Los intents se compilan (tablas de matching y embeddings de patrones)
+        en intents.bin, identificado por el sha256 del archivo de origen y de
+        los cambios sueltos guardados en el almacén (intents_overlay.json).
+        Si el artefacto ya corresponde a ellos se abre con mmap, sin volver
+        a parsear, compilar ni codificar.
         
         Args:
             intents_file: Ruta al archivo intents.json
+            embed_batch: Función textos → embeddings para codificar los patrones
+                (activa el matching semántico de intents)
         """
         try:
-            with open(intents_file, 'r', encoding='utf-8') as f:
-                self.intents = json.load(f)
+            if embed_batch is not None:
+                self._intent_embedder = embed_batch
+            self._intents_source = intents_file
+            source_hash = self._intents_hash()
+            model = settings.EMBEDDING_MODEL if self._intent_embedder is not None else None
             
-            # Guardar copia local
-            with open(self.intents_path, 'w', encoding='utf-8') as f:
-                json.dump(self.intents, f, ensure_ascii=False, indent=2)
+            header = read_artifact_header(self.intents_artifact_path)
+            if (header is not None and header["source_hash"] == source_hash
+                    and (model is None or header["embedding_model"] == model)):
+                matcher = IntentMatcher.load(self.intents_artifact_path)
+                with self._write_lock:
+                    self._compiled_intents = matcher
+                    self.intents = matcher.source
+                logger.info(f"Intents compilados cargados desde {self.intents_artifact_path}")
+            else:
+                intents = self._read_intents()
+                with self._write_lock, self.lock.exclusive():
+                    self._compile_intents(intents, source_hash)
             
             logger.info(f"Cargados {len(self.intents.get('intents', []))} intents")
             
@@ -160,39 +668,141 @@ class VectorStoreFAISS:
         if embeddings.shape[1] != self.embedding_dim:
             raise ValueError(f"Dimensión de embeddings ({embeddings.shape[1]}) no coincide con {self.embedding_dim}")
         
-        # Inicializar índice si no existe
-        if self.index is None:
-            # Índice FlatL2 para similitud coseno (normalizamos embeddings)
-            self.index = faiss.IndexFlatL2(self.embedding_dim)
-        
-        # Añadir embeddings al índice
-        self.index.add(embeddings.astype('float32'))
+        with self._writing():
+            added = self._add_documents_locked(documents, embeddings.astype('float32'))
+        collapsed = len(documents) - added
+        logger.info(f"Añadidos {added} documentos"
+                    + (f" ({collapsed} casi duplicados agrupados)" if collapsed else "")
+                    + f". Total: {len(self.documents)}")
+    
+    def _add_documents_locked(self, documents: List[Dict[str, Any]], embeddings: np.ndarray) -> int:
+        """Añadir documentos y publicar una instantánea nueva (con el lock tomado)"""
+        snapshot = self._snapshot
         
-        # Almacenar documentos y metadatos
+        # Almacenar documentos y metadatos (invisibles hasta publicar)
+        rows, positions = [], []
+        shard_rows = {}
         for i, doc in enumerate(documents):
-            doc_id = hashlib.md5(doc['content'].encode()).hexdigest()[:12]
-            
-            # Guardar documento
-            self.documents.append(doc['content'])
-            
-            # Guardar metadata con ID único
             metadata = doc.get('metadata', {})
-            metadata.update({
-                "doc_id": doc_id,
-                "added_at": datetime.now().isoformat(),
-                "doc_index": len(self.documents) - 1
-            })
-            self.metadata.append(metadata)
+            # Los fragmentos no se agrupan: el documento no se podría recomponer
+            position = self._append_document(doc['content'], metadata, deduplicate="parent_id" not in metadata)
+            if position is None:
+                continue  # Casi duplicado agrupado en su canónico
+            rows.append(i)
+            positions.append(position)
             
-            # Actualizar mapeo
-            self.doc_id_to_idx[doc_id] = len(self.documents) - 1
+            if snapshot.shards is not None:
+                shard_rows.setdefault(snapshot.shards.shard_for(metadata), []).append(i)
+        
+        # Añadir embeddings al delta (copy-on-write); el principal no se reentrena
+        index, shards = snapshot.index, snapshot.shards
+        if rows:
+            index = index.with_vectors(embeddings[rows])
+            self.embeddings.append(embeddings[rows])
+            
+            # Repartir vectores entre shards y actualizar sus centroides
+            if shards is not None:
+                position_of = dict(zip(rows, positions))
+                shards = shards.with_added({
+                    shard: (embeddings[shard_docs], [position_of[r] for r in shard_docs])
+                    for shard, shard_docs in shard_rows.items()
+                })
+            if self.router is not None:
+                self.router = self.router.with_added({
+                    shard: embeddings[shard_docs] for shard, shard_docs in shard_rows.items()
+                })
+        
+        self._publish(index, shards)
         
         # Actualizar estadísticas
-        self.stats["total_documents"] = len(self.documents)
+        self.stats["total_documents"] = len(self.documents) - len(self.deleted)
         
         # Guardar
         self._save()
-        logger.info(f"Añadidos {len(documents)} documentos. Total: {len(self.documents)}")
+        return len(rows)
+    
+    def _append_document(self, content: str, metadata: Dict[str, Any], deduplicate: bool = True) -> Optional[int]:
+        """
+        Añadir texto y metadatos al final (con el lock tomado).
+        
+        Los casi duplicados se agrupan en su documento canónico (DEDUP_MODE
+        "collapse", se incrementa 'duplicate_count' y se le suman las
+        palabras clave) o se añaden marcados con 'duplicate_of' ("tag").
+        Un casi duplicado con otro folio o código de respuesta nunca se
+        agrupa: es otro ticket y su identificador tiene que seguir
+        encontrándose; se añade marcado.
+        
+        Args:
+            deduplicate: False para añadirlo siempre (solo se registra su firma)
+        
+        Returns:
+            Posición del documento, o None si se agrupó en otro
+        """
+        signature = None
+        if settings.DEDUP_MODE != "off":
+            signature = self.dedup.signature(content)
+            match = self.dedup.find(signature) if deduplicate else None
+            if match is not None:
+                similarity, canonical = match
+                if settings.DEDUP_MODE == "collapse" and self._can_collapse(canonical, metadata):
+                    self._merge_keywords(canonical, metadata)
+                    count = self.metadata.get(canonical, "duplicate_count", 0)
+                    self._set_metadata(canonical, "duplicate_count", count + 1)
+                    return None
+                metadata["duplicate_of"] = self.metadata.get(canonical, "doc_id")
+                metadata["duplicate_similarity"] = round(similarity, 3)
+        
+        position = len(self.documents)
+        if metadata.get("parent_id") is not None:
+            # Fragmentos: documento y orden, así dos fragmentos con el mismo texto no comparten ID
+            doc_id = f"{metadata['parent_id']}-{metadata['chunk_index']}"
+        else:
+            doc_id = hashlib.md5(content.encode()).hexdigest()[:12]
+        
+        # Guardar documento
+        self.documents.append(content)
+        
+        # Guardar metadata con ID único
+        metadata["doc_id"] = doc_id
+        metadata.setdefault("added_at", datetime.now().isoformat())
+        self.metadata.append(metadata)
+        
+        # Actualizar mapeos e índices léxicos
+        self._index_metadata(position, metadata)
+        self.bm25.add(position, content)
+        if signature is not None and "duplicate_of" not in metadata:
+            self.dedup.add(position, signature)
+        self.dedup.size = len(self.documents)
+        return position
+    
+    def _can_collapse(self, canonical: int, metadata: Dict[str, Any]) -> bool:
+        """El documento no aporta identificadores exactos distintos de los del canónico"""
+        if self.metadata.get(canonical, "parent_id") is not None:
+            return False  # Los fragmentos no absorben documentos: se recomponen a partir de sus trozos
+        for field in self.exact_keys.fields:
+            value = metadata.get(field)
+            if value is None or value == "":
+                continue
+            existing = self.metadata.get(canonical, field)
+            if existing is None or normalize_key(existing) != normalize_key(value):
+                return False
+        return True
+    
+    def _merge_keywords(self, canonical: int, metadata: Dict[str, Any]):
+        """Sumar al canónico las palabras clave del casi duplicado agrupado (con el lock tomado)"""
+        changed = {}
+        for field in self.keywords.fields:
+            current = as_keywords(self.metadata.get(canonical, field))
+            extra = [k for k in as_keywords(metadata.get(field)) if k not in current]
+            if extra:
+                changed[field] = ", ".join(current + extra)
+        if not changed:
+            return
+        for field, value in changed.items():
+            self._set_metadata(canonical, field, value)
+        # Copia: la instantánea publicada sigue leyendo las palabras clave anteriores
+        self.keywords = self.keywords.without([canonical])
+        self.keywords.add(canonical, {field: self.metadata.get(canonical, field) for field in self.keywords.fields})
     
     def add_document(self, content: str, metadata: Optional[Dict] = None, embedding: Optional[np.ndarray] = None):
         """
@@ -206,44 +816,49 @@ class VectorStoreFAISS:
         if metadata is None:
             metadata = {}
         
-        doc_id = hashlib.md5(content.encode()).hexdigest()[:12]
+        if embedding is not None and embedding.shape[0] != self.embedding_dim:
+            raise ValueError(f"Embedding debe tener dimensión {self.embedding_dim}")
         
-        # Si tenemos embedding, añadirlo al índice
-        if embedding is not None:
-            if embedding.shape[0] != self.embedding_dim:
-                raise ValueError(f"Embedding debe tener dimensión {self.embedding_dim}")
+        with self._writing():
+            snapshot = self._snapshot
+            position = self._append_document(content, metadata)
             
-            if self.index is None:
-                self.index = faiss.IndexFlatL2(self.embedding_dim)
+            # Si tenemos embedding, añadirlo al índice
+            index, shards = snapshot.index, snapshot.shards
+            if embedding is not None and position is not None:
+                vector = embedding.reshape(1, -1).astype('float32')
+                index = index.with_vectors(vector)
+                self.embeddings.append(vector)
+                if shards is not None:
+                    shards = shards.with_added({shards.shard_for(metadata): (vector, [position])})
+                if self.router is not None:
+                    self.router = self.router.with_added({shards.shard_for(metadata): vector})
             
-            self.index.add(embedding.reshape(1, -1).astype('float32'))
-        
-        # Almacenar documento
-        self.documents.append(content)
-        
-        # Guardar metadata
-        metadata.update({
-            "doc_id": doc_id,
-            "added_at": datetime.now().isoformat(),
-            "doc_index": len(self.documents) - 1
-        })
-        self.metadata.append(metadata)
-        self.doc_id_to_idx[doc_id] = len(self.documents) - 1
-        
-        # Actualizar estadísticas
-        self.stats["total_documents"] = len(self.documents)
+            self._publish(index, shards)
+            
+            # Actualizar estadísticas
+            self.stats["total_documents"] = len(self.documents) - len(self.deleted)
+            
+            # Guardar
+            self._save()
         
-        # Guardar
-        self._save()
-        logger.info(f"Documento añadido: {metadata.get('title', 'Sin título')} (ID: {doc_id})")
+        if position is None:
+            logger.info(f"Documento agrupado como casi duplicado: {metadata.get('title', 'Sin título')}")
+        else:
+            logger.info(f"Documento añadido: {metadata.get('title', 'Sin título')} (ID: {metadata['doc_id']})")
     
     def search_intents(self, query_text: str = None, query_embedding: np.ndarray = None, top_k: int = 1) -> Dict:
         """
         Buscar intents similares usando matching por texto.
         
+        Los patrones se compilan una vez (ver IntentMatcher) y la consulta
+        se recorre en una sola pasada. Si los patrones están codificados y
+        se pasa el embedding de la consulta, también cuentan las paráfrasis
+        (similitud coseno sobre INTENT_SEMANTIC_MIN_SIMILARITY).
+        
         Args:
             query_text: Texto de la consulta (obligatorio para matching)
-            query_embedding: Embedding de la consulta (no usado en esta implementación)
+            query_embedding: Embedding de la consulta (opcional, matching semántico)
             top_k: Número de resultados a retornar
         
         Returns:
@@ -256,112 +871,594 @@ class VectorStoreFAISS:
             # Sin texto, no podemos hacer matching
             return {'distances': [[]], 'metadatas': [[]]}
         
-        query_lower = query_text.lower().strip()
-        results = []
-        distances = []
-        
-        # Buscar en todos los intents
-        for intent in self.intents["intents"]:
-            tag = intent.get("tag", "").lower()
-            patterns = [p.lower() for p in intent.get("patterns", [])]
-            
-            # 1. Verificar si la query contiene el tag
-            tag_match = tag in query_lower if tag else False
-            
-            # 2. Verificar si coincide con algún patrón
-            pattern_match = False
-            for pattern in patterns:
-                if pattern in query_lower or query_lower in pattern:
-                    pattern_match = True
-                    break
-            
-            # 3. Verificar palabras clave comunes
-            keywords_match = False
-            common_keywords = {
-                "saludo": ["hola", "buenos", "buenas", "saludos", "qué tal", "cómo estás"],
-                "despedida": ["adiós", "hasta luego", "chao", "bye", "nos vemos"],
-                "ayuda": ["ayuda", "ayúdame", "asistencia", "soporte"],
-                "gracias": ["gracias", "agradecido", "agradezco"],
-            }
-            
-            for keyword_list in common_keywords.values():
-                if any(keyword in query_lower for keyword in keyword_list):
-                    keywords_match = True
-                    break
-            
-            # Si hay algún match
-            if tag_match or pattern_match or keywords_match:
-                # Calcular "distancia" (0 = perfect match, 1 = no match)
-                if pattern_match:  # Coincidencia exacta con patrón
-                    distance = 0.1
-                elif tag_match:    # Coincidencia con tag
-                    distance = 0.3
-                else:              # Coincidencia con keywords
-                    distance = 0.5
-                
-                results.append({
-                    "tag": intent.get("tag", ""),
-                    "responses": intent.get("responses", []),
-                    "patterns": intent.get("patterns", []),
-                    "context": intent.get("context", ""),
-                    "match_type": "pattern" if pattern_match else "tag" if tag_match else "keyword"
-                })
-                distances.append(distance)
-        
-        # Ordenar por distancia (menor = mejor match)
-        if results:
-            sorted_results = sorted(zip(results, distances), key=lambda x: x[1])
-            results = [r for r, _ in sorted_results[:top_k]]
-            distances = [d for _, d in sorted_results[:top_k]]
+        results, distances = self._intent_matcher().match(
+            query_text, top_k,
+            query_embedding=query_embedding,
+            min_similarity=settings.INTENT_SEMANTIC_MIN_SIMILARITY
+        )
         
         return {
             'distances': [distances],
             'metadatas': [results]
         }
-    def search_documents(self, query_embedding: np.ndarray, top_k: int = 3) -> Dict:
+    
+    def _intent_matcher(self) -> IntentMatcher:
+        """Intents compilados; si self.intents cambió sin artefacto se compilan en memoria"""
+        matcher = self._compiled_intents
+        if matcher is None or matcher.source is not self.intents:
+            with self._write_lock:
+                # Los intents se publican bajo el lock: volver a mirar antes de compilar
+                matcher = self._compiled_intents
+                if matcher is None or matcher.source is not self.intents:
+                    matcher = self._new_intent_matcher(self.intents)
+                    self._compiled_intents = matcher
+        return matcher
+    
+    def reload_intents(self, force: bool = False) -> bool:
+        """
+        Volver a compilar los intents si cambió su archivo de origen (o los
+        cambios sueltos, escritos por otro proceso).
+        
+        Se compila sin bloquear las búsquedas, que usan los intents
+        anteriores hasta que los nuevos se publican de una vez. Los patrones
+        que ya estaban codificados no se vuelven a codificar.
+        
+        Args:
+            force: Recompilar aunque el archivo no haya cambiado
+        
+        Returns:
+            True si se publicaron intents nuevos
+        """
+        path = self._intents_source
+        if path is None:
+            raise ValueError("No hay archivo de intents: llama antes a store_intents")
+        source_hash = self._intents_hash()
+        current = self._compiled_intents
+        if not force and current is not None and current.source_hash == source_hash:
+            return False
+        
+        start = time.perf_counter()
+        intents = self._read_intents()
+        matcher = self._new_intent_matcher(intents, source_hash)
+        with self._write_lock, self.lock.exclusive():
+            self._install_intents(matcher)
+        logger.info(f"Intents recargados desde {path}: {len(matcher)} intents "
+                    f"en {time.perf_counter() - start:.2f} s")
+        return True
+    
+    def watch_intents(self, interval: float):
+        """
+        Vigilar el archivo de intents (y los cambios sueltos) y recargarlos cuando cambien.
+        
+        Sondea la fecha de modificación y el tamaño cada 'interval'
+        segundos; un cambio solo recompila si el contenido es distinto.
+        """
+        if interval <= 0 or self._intents_source is None or self._intents_watcher is not None:
+            return
+        
+        def _stamp():
+            stamps = []
+            for path in (self._intents_source, self.intents_overlay_path):
+                try:
+                    stat = os.stat(path)
+                    stamps.append((stat.st_mtime_ns, stat.st_size))
+                except OSError:
+                    stamps.append(None)
+            return tuple(stamps)
+        
+        # Antes de arrancar el hilo: un cambio escrito justo después no se pierde
+        initial = _stamp()
+        
+        def _run():
+            last = initial
+            while not self._stop_merger.wait(interval):
+                stamp = _stamp()
+                if stamp[0] is None or stamp == last:
+                    continue
+                last = stamp
+                try:
+                    self.reload_intents()
+                except Exception as e:
+                    logger.error(f"Error recargando intents: {e}")
+        
+        self._intents_watcher = threading.Thread(target=_run, name="intents-watcher", daemon=True)
+        self._intents_watcher.start()
+    
+    def upsert_intent(self, intent: Dict[str, Any]):
+        """Añadir un intent (o sustituir el que tenga su tag) sin recompilar los demás"""
+        if not intent.get("tag"):
+            raise ValueError("El intent necesita un tag")
+        self._update_intents(intent["tag"], lambda matcher: matcher.with_intent(intent, self._intent_embedder))
+    
+    def remove_intent(self, tag: str):
+        """Eliminar un intent (KeyError si no existe)"""
+        self._update_intents(tag, lambda matcher: matcher.without_intent(tag))
+    
+    def add_intent_pattern(self, tag: str, pattern: str):
+        """Añadir un patrón a un intent (KeyError si no existe)"""
+        if not pattern.strip():
+            raise ValueError("El patrón está vacío")
+        self._update_intents(tag, lambda matcher: matcher.with_pattern(tag, pattern, self._intent_embedder))
+    
+    def remove_intent_pattern(self, tag: str, pattern: str):
+        """Quitar un patrón de un intent (KeyError si no existe)"""
+        self._update_intents(tag, lambda matcher: matcher.without_pattern(tag, pattern))
+    
+    def _update_intents(self, tag: str, change: Callable[[IntentMatcher], IntentMatcher]):
+        """
+        Aplicar un cambio suelto a los intents compilados y publicarlo.
+        
+        El cambio (que puede codificar patrones con el modelo) se calcula sin
+        locks; bajo ellos solo se publica, y si entretanto se publicó otro se
+        vuelve a calcular sobre él. El intent resultante se guarda en
+        intents_overlay.json dentro del almacén, no en el archivo de origen
+        (versionado con el código): sobrevive a reinicios y a despliegues
+        que traigan otro archivo. Con demasiados cambios pendientes se
+        recompila todo en segundo plano.
+        """
+        while True:
+            current = self._intent_matcher()
+            matcher = change(current)
+            if matcher is current:
+                return
+            with self._write_lock, self.lock.exclusive():
+                if self._compiled_intents is not current:
+                    continue
+                if self._intents_source is not None:
+                    overlay = self._read_intents_overlay()
+                    position = matcher.find(tag)
+                    overlay[tag] = matcher.intents[position] if position is not None else None
+                    with atomic_write(self.intents_overlay_path, 'w', encoding='utf-8') as f:
+                        json.dump(overlay, f, ensure_ascii=False, indent=2)
+                    matcher.source_hash = self._intents_hash()
+                self._install_intents(matcher)
+            break
+        
+        if matcher.pending_changes > settings.INTENT_MAX_PENDING_CHANGES:
+            threading.Thread(target=self._compact_intents, name="intents-compact", daemon=True).start()
+    
+    def _read_intents_overlay(self) -> Dict[str, Optional[Dict[str, Any]]]:
+        """Cambios sueltos guardados: tag → intent actual (None = eliminado)"""
+        if not os.path.exists(self.intents_overlay_path):
+            return {}
+        with open(self.intents_overlay_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    
+    def _read_intents(self) -> Dict[str, Any]:
+        """Intents del archivo de origen con los cambios sueltos aplicados encima"""
+        with open(self._intents_source, 'r', encoding='utf-8') as f:
+            intents = json.load(f)
+        overlay = self._read_intents_overlay()
+        if not overlay:
+            return intents
+        merged = [overlay.get(intent.get("tag"), intent) for intent in intents.get("intents", [])]
+        tags = {intent.get("tag") for intent in intents.get("intents", [])}
+        merged += [intent for tag, intent in overlay.items() if tag not in tags]
+        return {**intents, "intents": [intent for intent in merged if intent is not None]}
+    
+    def _intents_hash(self) -> str:
+        """sha256 del archivo de origen, combinado con el de los cambios sueltos si los hay"""
+        source_hash = file_checksum(self._intents_source)
+        if not os.path.exists(self.intents_overlay_path):
+            return source_hash
+        overlay_hash = file_checksum(self.intents_overlay_path)
+        return hashlib.sha256(f"{source_hash}:{overlay_hash}".encode()).hexdigest()
+    
+    def _compact_intents(self):
+        """Recompilar los cambios pendientes y publicarlos si nadie cambió los intents entretanto"""
+        try:
+            current = self._compiled_intents
+            compacted = current.compacted()
+            with self._write_lock, self.lock.exclusive():
+                if self._compiled_intents is current:
+                    self._install_intents(compacted)
+                    logger.info(f"Intents recompilados: {current.pending_changes} cambios pendientes aplicados")
+        except Exception as e:
+            logger.error(f"Error recompilando intents: {e}")
+    
+    def correct_spelling(self, text: str) -> str:
+        """
+        Corregir errores de tecleo ("ola", "grasias", "ayudaa") palabra por palabra.
+        
+        El vocabulario son las palabras de los patrones y tags de intents
+        más los términos del corpus con su frecuencia; las palabras conocidas
+        y las que no tienen una corrección cercana se dejan igual. Es solo
+        una propuesta: RAGSystem._match_intent decide si se usa.
+        """
+        return self._spelling_index().correct(text)
+    
+    def _spelling_index(self) -> SymSpellIndex:
+        """Índice de corrección: se reconstruye si cambian los intents y crece con el corpus"""
+        matcher = self._intent_matcher()
+        bm25 = self.bm25
+        with self._spelling_lock:
+            index = self._spelling
+            source, corpus, seen = self._spelling_source
+            if index is None or source is not matcher or corpus is not bm25:
+                start = time.perf_counter()
+                index = SymSpellIndex(settings.TYPO_MAX_EDIT_DISTANCE, settings.TYPO_PREFIX_LENGTH)
+                index.add_many(SPANISH_STOPWORDS)
+                for intent in matcher.source.get("intents", []):
+                    index.add_text(intent.get("tag", ""))
+                    for pattern in intent.get("patterns", []):
+                        index.add_text(pattern)
+                for keywords in COMMON_KEYWORDS.values():
+                    for keyword in keywords:
+                        index.add_text(keyword)
+                seen = 0
+                logger.info(f"Índice de corrección construido en {time.perf_counter() - start:.2f} s")
+            
+            # Términos nuevos del corpus (el vocabulario BM25 solo crece)
+            new_terms = bm25.vocabulary(seen)
+            for term, document_frequency in new_terms:
+                index.add(term, document_frequency)
+            self._spelling = index
+            self._spelling_source = (matcher, bm25, seen + len(new_terms))
+        return index
+    
+    def _new_intent_matcher(self, intents: Dict, source_hash: str = "") -> IntentMatcher:
+        matcher = IntentMatcher(intents, source_hash)
+        if self._intent_embedder is not None:
+            start = time.perf_counter()
+            matcher.embed_patterns(self._intent_embedder, settings.EMBEDDING_MODEL, previous=self._compiled_intents)
+            logger.info(f"Patrones de intents codificados: {len(matcher.pattern_owners)} "
+                        f"en {time.perf_counter() - start:.2f} s")
+        return matcher
+    
+    def _compile_intents(self, intents: Dict, source_hash: str):
+        """Compilar intents y escribir el artefacto (llamar con el lock del directorio)"""
+        matcher = self._new_intent_matcher(intents, source_hash)
+        self._install_intents(matcher)
+        logger.info(f"Intents compilados en {self.intents_artifact_path}: {len(matcher)} intents")
+    
+    def _install_intents(self, matcher: IntentMatcher):
+        """Guardar el artefacto y publicar los intents compilados (con el lock del directorio)"""
+        with self._write_lock:
+            matcher.save(self.intents_artifact_path)
+            self._compiled_intents = matcher
+            self.intents = matcher.source
+    
+    def search_documents(self, query_embedding: np.ndarray, top_k: int = 3, shard: Optional[str] = None,
+                         min_similarity: Optional[float] = None) -> Dict:
         """
         Buscar documentos similares al embedding de consulta.
         
         Args:
             query_embedding: Embedding de la consulta
             top_k: Número de resultados a retornar
+            shard: Shard al que dirigir la búsqueda (None = todos los shards)
+            min_similarity: Umbral de similitud coseno; si se indica se usa
+                range_search y solo se devuelven vecinos por encima del umbral
         
         Returns:
-            Diccionario con formato compatible con ChromaDB
+            Diccionario con formato compatible con ChromaDB, más 'similarities'
+            con la similitud coseno real de cada resultado
         """
-        if self.index is None or self.index.ntotal == 0:
+        self.refresh()
+        snapshot = self._snapshot
+        if snapshot.index.ntotal == 0:
             return {
                 'documents': [[]],
                 'distances': [[]],
+                'similarities': [[]],
                 'metadatas': [[]]
             }
         
+        hits = self._dense_hits(snapshot, query_embedding, top_k, shard, min_similarity)
+        return self._format_hits(snapshot, hits)
+    
+    def route_query(self, query_embedding: np.ndarray) -> Optional[str]:
+        """
+        Predecir el shard de una consulta comparándola con los centroides.
+        
+        Returns:
+            Shard al que dirigir la búsqueda, o None para buscar en todos
+            (sin partición, enrutado desactivado o predicción poco clara)
+        """
+        router = self._snapshot.router
+        if router is None:
+            return None
+        return router.route(query_embedding)
+    
+    @staticmethod
+    def _normalized_query(query_embedding: np.ndarray) -> np.ndarray:
         # Normalizar embedding para búsqueda L2 (equivalente a cosine)
         faiss.normalize_L2(query_embedding.reshape(1, -1))
+        return query_embedding.reshape(1, -1).astype('float32')
+    
+    def _dense_hits(self, snapshot: StoreSnapshot, query_embedding: np.ndarray, top_k: int,
+                    shard: Optional[str] = None, min_similarity: Optional[float] = None) -> List[Tuple[float, int]]:
+        """
+        Vecinos FAISS visibles en la instantánea.
         
-        # Buscar en FAISS
-        distances, indices = self.index.search(
-            query_embedding.reshape(1, -1).astype('float32'), 
-            min(top_k, self.index.ntotal)
-        )
+        Returns:
+            Pares (similitud coseno, posición) de mejor a peor, como mucho top_k
+        """
+        query = self._normalized_query(query_embedding)
+        
+        # Buscar en FAISS (por shards si están habilitados); los borrados
+        # siguen en el índice, así que se piden de más y se filtran
+        index, shards = snapshot.index, snapshot.shards
+        k = min(top_k + len(snapshot.deleted), index.ntotal)
+        while True:
+            if min_similarity is not None:
+                radius = similarity_radius(min_similarity, index.metric)
+                if shards is not None:
+                    hits = shards.range_search(query, radius, shard=shard)
+                else:
+                    distances, indices = index.range_search(query, radius)
+                    hits = list(zip(distances, indices))
+            elif shards is not None:
+                hits = shards.search(query, k, shard=shard)
+            else:
+                distances, indices = index.search(query, k)
+                hits = list(zip(distances[0], indices[0]))
+            
+            # Solo documentos visibles en la instantánea
+            visible = self._diversify(snapshot, [
+                (dist, int(idx)) for dist, idx in hits
+                if 0 <= idx < snapshot.size and idx not in snapshot.deleted
+            ])
+            # Los duplicados omitidos dejan huecos: ampliar k hasta llenar top_k
+            if len(visible) >= top_k or min_similarity is not None or k >= index.ntotal:
+                break
+            k = min(k * 2, index.ntotal)
+        visible = visible[:top_k]
+        similarities = to_similarity(np.array([d for d, _ in visible], dtype='float32'), index.metric)
+        return [(float(sim), idx) for sim, (_, idx) in zip(similarities, visible)]
+    
+    @staticmethod
+    def _diversify(snapshot: StoreSnapshot, hits: List[Tuple[Any, int]]) -> List[Tuple[Any, int]]:
+        """Quitar casi duplicados marcados ('duplicate_of') y fragmentos de un documento ya presente"""
+        seen, diverse = set(), []
+        for hit in hits:
+            idx = hit[1]
+            group = (snapshot.metadata.get(idx, "duplicate_of") or snapshot.metadata.get(idx, "parent_id")
+                     or snapshot.metadata.get(idx, "doc_id"))
+            if group is not None and group in seen:
+                continue
+            seen.add(group)
+            diverse.append(hit)
+        return diverse
+    
+    @staticmethod
+    def _format_hits(snapshot: StoreSnapshot, hits: List[Tuple[float, int]], **extra) -> Dict:
+        """Formato compatible con ChromaDB a partir de pares (similitud, posición)"""
+        similarities = np.array([sim for sim, _ in hits], dtype='float32')
+        distances = from_similarity(similarities, snapshot.index.metric)
+        return {
+            'documents': [[snapshot.documents[idx] for _, idx in hits]],
+            'distances': [[float(d) for d in distances]],
+            'similarities': [[float(sim) for sim in similarities]],
+            'metadatas': [[snapshot.metadata[idx] for _, idx in hits]],
+            **{key: [value] for key, value in extra.items()}
+        }
+    
+    def search_hybrid(self, query_text: str, query_embedding: np.ndarray, top_k: int = 3,
+                      shard: Optional[str] = None, min_similarity: Optional[float] = None,
+                      query_words: Optional[Sequence[str]] = None) -> Dict:
+        """
+        Búsqueda híbrida: BM25 + FAISS combinados con reciprocal rank fusion.
+        
+        Con shard las dos partes buscan solo en los documentos del shard.
+        
+        En corpus grandes (BM25_PREFILTER_MIN_DOCS) BM25 también actúa como
+        prefiltro: la similitud densa solo se calcula sobre sus candidatos.
+        El umbral min_similarity se aplica al resultado combinado: un acierto
+        solo léxico (una palabra en común con una consulta de otro tema)
+        también se descarta si su similitud coseno no llega.
+        
+        Args:
+            query_words: Palabras normalizadas de la consulta (QueryAnalysis.tokens)
+        
+        Returns:
+            Mismo formato que search_documents más 'scores' (puntuación RRF)
+        """
+        self.refresh()
+        snapshot = self._snapshot
+        if snapshot.index.ntotal == 0:
+            return self._format_hits(snapshot, [], scores=[])
+        
+        depth = max(top_k * 4, 20)
+        # Con shard la parte léxica se limita a sus documentos, igual que la densa
+        allowed = snapshot.shards.positions(shard) if shard is not None and snapshot.shards is not None else None
+        sparse = snapshot.bm25.search(query_text, depth, size=snapshot.size, query_words=query_words,
+                                      positions=allowed)
+        
+        live = snapshot.size - len(snapshot.deleted)
+        if live >= settings.BM25_PREFILTER_MIN_DOCS and len(sparse) >= top_k and shard is None:
+            candidates = snapshot.bm25.search(query_text, settings.BM25_PREFILTER_CANDIDATES, size=snapshot.size,
+                                              query_words=query_words)
+            dense = self._score_positions(snapshot, query_embedding, [idx for _, idx in candidates])
+            if min_similarity is not None:
+                dense = [hit for hit in dense if hit[0] >= min_similarity]
+            dense = dense[:depth]
+        else:
+            dense = self._dense_hits(snapshot, query_embedding, depth, shard, min_similarity)
         
-        # Formatear resultados
-        documents_result = []
-        metadatas_result = []
-        distances_result = []
+        # Reciprocal rank fusion
+        fused: Dict[int, float] = {}
+        for ranking in (dense, sparse):
+            for rank, (_, idx) in enumerate(ranking):
+                fused[idx] = fused.get(idx, 0.0) + 1.0 / (settings.RRF_K + rank + 1)
+        ranked = sorted(fused.items(), key=lambda item: (-item[1], item[0]))
         
-        for i, idx in enumerate(indices[0]):
-            if idx < len(self.documents):
-                documents_result.append(self.documents[idx])
-                metadatas_result.append(self.metadata[idx])
-                distances_result.append(float(distances[0][i]))
+        # Similitud coseno real también para los aciertos solo léxicos
+        cosine = {idx: sim for sim, idx in dense}
+        if min_similarity is not None:
+            lexical_only = [idx for idx, _ in ranked if idx not in cosine]
+            cosine.update({idx: sim for sim, idx in self._score_positions(snapshot, query_embedding, lexical_only)})
+            ranked = [(idx, score) for idx, score in ranked if cosine[idx] >= min_similarity]
+        best = [(idx, score) for score, idx in self._diversify(snapshot, [(score, idx) for idx, score in ranked])][:top_k]
+        missing = [idx for idx, _ in best if idx not in cosine]
+        if missing:
+            cosine.update({idx: sim for sim, idx in self._score_positions(snapshot, query_embedding, missing)})
+        
+        hits = [(cosine[idx], idx) for idx, _ in best]
+        return self._format_hits(snapshot, hits, scores=[score for _, score in best])
+    
+    def _score_positions(self, snapshot: StoreSnapshot, query_embedding: np.ndarray,
+                         positions: List[int]) -> List[Tuple[float, int]]:
+        """Similitud coseno exacta con posiciones concretas, de mejor a peor"""
+        if not positions:
+            return []
+        query = self._normalized_query(query_embedding)[0]
+        vectors = snapshot.index.reconstruct_batch(positions)
+        similarities = vectors @ query
+        if snapshot.index.metric == faiss.METRIC_L2:
+            # Los vectores guardados están normalizados salvo error numérico
+            similarities = similarities / np.maximum(np.linalg.norm(vectors, axis=1), 1e-12)
+        order = np.argsort(-similarities, kind='stable')
+        return [(float(similarities[i]), int(positions[i])) for i in order]
+    
+    def lookup_exact(self, query_text: str, candidates: Optional[Sequence[str]] = None) -> Dict:
+        """
+        Buscar identificadores exactos (folio, código de respuesta) en la consulta.
+        
+        No usa embeddings: tokeniza la consulta y consulta un dict.
+        
+        Args:
+            candidates: Tokens candidatos ya calculados (QueryAnalysis.key_candidates)
+        
+        Returns:
+            Mismo formato que search_documents más 'keys' (identificadores
+            encontrados); similitud 1.0 para cada coincidencia
+        """
+        self.refresh()
+        snapshot = self._snapshot
+        documents_result, metadatas_result, keys = [], [], []
+        for key, field, idx in snapshot.exact_keys.find_in_text(query_text, candidates):
+            if idx < snapshot.size and idx not in snapshot.deleted:
+                documents_result.append(self._document_text(snapshot, idx))
+                metadatas_result.append(snapshot.metadata[idx])
+                keys.append({"field": field, "value": key})
         
         return {
             'documents': [documents_result],
-            'distances': [distances_result],
-            'metadatas': [metadatas_result]
+            'distances': [[0.0] * len(documents_result)],
+            'similarities': [[1.0] * len(documents_result)],
+            'metadatas': [metadatas_result],
+            'keys': keys
+        }
+    
+    def search_keywords(self, query_text: str, top_k: int = 3,
+                        query_words: Optional[Sequence[str]] = None) -> Dict:
+        """
+        Documentos cuyas palabras clave curadas aparecen en la consulta.
+        
+        No usa embeddings. Se ordenan por número de palabras clave
+        encontradas y, a igualdad, por las palabras que cubren.
+        
+        Args:
+            query_words: Palabras normalizadas de la consulta (QueryAnalysis.tokens)
+        
+        Returns:
+            Mismo formato que search_documents más 'keywords' (las palabras
+            clave encontradas de cada documento); la similitud es la fracción
+            de palabras clave del documento que aparecen en la consulta
+        """
+        self.refresh()
+        snapshot = self._snapshot
+        matches = [
+            (idx, found) for idx, found in snapshot.keywords.match(query_text, query_words).items()
+            if idx < snapshot.size and idx not in snapshot.deleted
+        ]
+        matches.sort(key=lambda m: (-len(m[1]), -sum(k.count(" ") + 1 for k in m[1]), m[0]))
+        matches = matches[:top_k]
+        
+        similarities = [len(found) / len(snapshot.keywords.keywords_for(idx)) for idx, found in matches]
+        return {
+            'documents': [[self._document_text(snapshot, idx) for idx, _ in matches]],
+            'distances': [[1.0 - sim for sim in similarities]],
+            'similarities': [similarities],
+            'metadatas': [[snapshot.metadata[idx] for idx, _ in matches]],
+            'keywords': [[found for _, found in matches]]
         }
     
+    def _document_text(self, snapshot: StoreSnapshot, idx: int) -> str:
+        """Texto completo del documento de una posición (recompuesto si es un fragmento)"""
+        parent_id = snapshot.metadata.get(idx, "parent_id")
+        if parent_id is None:
+            return snapshot.documents[idx]
+        content = ""
+        for position in snapshot.parent_to_chunks.get(parent_id, [idx]):
+            if position >= snapshot.size or position in snapshot.deleted:
+                continue
+            # Los fragmentos se solapan: solo se añade lo que va después de lo ya recompuesto
+            start = snapshot.metadata.get(position, "chunk_start", 0)
+            content += snapshot.documents[position][max(len(content) - start, 0):]
+        return content
+    
+    def get_document(self, doc_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Documento por doc_id; el parent_id de un documento partido devuelve
+        el original recompuesto a partir de sus fragmentos.
+        
+        Returns:
+            Dict con 'content' y 'metadata', o None si no existe
+        """
+        self.refresh()
+        snapshot = self._snapshot
+        positions = snapshot.parent_to_chunks.get(doc_id) or [snapshot.doc_id_to_idx.get(doc_id)]
+        positions = [p for p in positions if p is not None and p < snapshot.size and p not in snapshot.deleted]
+        if not positions:
+            return None
+        
+        metadata = dict(snapshot.metadata[positions[0]])
+        if doc_id not in snapshot.parent_to_chunks:
+            return {"content": snapshot.documents[positions[0]], "metadata": metadata}
+        for field in CHUNK_FIELDS:
+            metadata.pop(field, None)
+        metadata["doc_id"] = doc_id
+        return {"content": self._document_text(snapshot, positions[0]), "metadata": metadata}
+    
+    def delete_documents(self, doc_ids: List[str]) -> int:
+        """
+        Borrar documentos por doc_id (el parent_id borra todos sus fragmentos).
+        
+        Se marcan como borrados (tombstones): dejan de aparecer en las
+        búsquedas y en los índices léxicos; sus vectores se ignoran. Los
+        mapeos e índices léxicos se copian sin ellos y se publican con la
+        instantánea nueva: las búsquedas en curso siguen viendo la anterior.
+        
+        Returns:
+            Número de documentos (o fragmentos) borrados
+        """
+        with self._writing():
+            doc_id_to_idx = dict(self.doc_id_to_idx)
+            parent_to_chunks = dict(self.parent_to_chunks)
+            doc_ids = [
+                chunk_id
+                for doc_id in doc_ids
+                for chunk_id in ([self.metadata.get(p, "doc_id") for p in parent_to_chunks.pop(doc_id)]
+                                 if doc_id in parent_to_chunks else [doc_id])
+            ]
+            positions = [doc_id_to_idx.pop(doc_id) for doc_id in doc_ids if doc_id in doc_id_to_idx]
+            if not positions:
+                return 0
+            
+            self.doc_id_to_idx = doc_id_to_idx
+            self.parent_to_chunks = parent_to_chunks
+            self.keywords = self.keywords.without(positions)
+            self.bm25 = self.bm25.without(positions)
+            self.dedup = self.dedup.without(positions)
+            self.deleted = self.deleted | set(positions)
+            
+            snapshot = self._snapshot
+            if self.router is not None:
+                indexed = [p for p in positions if p < snapshot.index.ntotal]
+                groups = {}
+                for position, vector in zip(indexed, snapshot.index.reconstruct_batch(indexed)):
+                    shard = snapshot.shards.shard_for({self.shard_key: self.metadata.get(position, self.shard_key)})
+                    groups.setdefault(shard, []).append(vector)
+                self.router = self.router.with_removed({k: np.vstack(v) for k, v in groups.items()})
+            self._publish(snapshot.index, snapshot.shards)
+            self.stats["total_documents"] = len(self.documents) - len(self.deleted)
+            self._save()
+        
+        logger.info(f"Borrados {len(positions)} documentos")
+        return len(positions)
+    
     def semantic_search(self, query_embedding: np.ndarray, top_k: int = 3) -> List[Dict]:
         """
         Búsqueda semántica con resultados formateados.
@@ -376,14 +1473,12 @@ class VectorStoreFAISS:
         results = self.search_documents(query_embedding, top_k)
         
         formatted = []
-        for doc, meta, dist in zip(
+        for doc, meta, dist, similarity in zip(
             results['documents'][0],
             results['metadatas'][0],
-            results['distances'][0]
+            results['distances'][0],
+            results['similarities'][0]
         ):
-            # Convertir distancia L2 a similitud coseno (aproximado)
-            similarity = 1 / (1 + dist) if dist > 0 else 1.0
-            
             formatted.append({
                 "content": doc,
                 "metadata": meta,
@@ -394,30 +1489,348 @@ class VectorStoreFAISS:
         
         return formatted
     
+    def _shard_positions(self) -> Dict[str, List[int]]:
+        """Agrupar las posiciones de los documentos indexados por shard"""
+        groups = {}
+        key = self.shards.shard_key
+        for idx in range(min(self.index.ntotal, len(self.metadata))):
+            groups.setdefault(self.shards.shard_for({key: self.metadata.get(idx, key)}), []).append(idx)
+        return groups
+    
+    def rebuild_shard(self, shard: str):
+        """
+        Reconstruir un shard a partir de los vectores del índice principal.
+        
+        Args:
+            shard: Nombre del shard a reconstruir
+        """
+        if self.shards is None:
+            raise ValueError("El almacén no está particionado (shard_key no configurado)")
+        
+        with self._write_lock:
+            snapshot = self._snapshot
+            positions = self._shard_positions().get(shard, [])
+            vectors = np.vstack([snapshot.index.reconstruct(idx) for idx in positions]) if positions else None
+            self._publish(snapshot.index, snapshot.shards.with_rebuilt(shard, vectors, positions))
+    
+    def verify(self, sample_size: int = 256) -> Dict:
+        """
+        Comprobar la consistencia entre índice, documentos, metadatos y matriz.
+        
+        Se comparan los conteos de cada estructura y, en una muestra de
+        posiciones, los vectores del índice con los de la matriz.
+        
+        Args:
+            sample_size: Posiciones a comparar vector a vector (0 = ninguna)
+        
+        Returns:
+            Dict con 'ok', los conteos y la lista de problemas encontrados
+        """
+        self.refresh(force=True)
+        with self._write_lock:
+            snapshot = self._snapshot
+            counts = {
+                "index": snapshot.index.ntotal,
+                "embeddings": len(self.embeddings),
+                "documents": len(snapshot.documents),
+                "metadata": len(snapshot.metadata),
+                "bm25": len(snapshot.bm25),
+                "deleted": len(snapshot.deleted)
+            }
+            if snapshot.shards is not None:
+                counts["shards"] = snapshot.shards.ntotal
+            
+            problems = []
+            for name in ("embeddings", "documents", "metadata", "bm25", "shards"):
+                if name in counts and counts[name] != counts["index"]:
+                    problems.append(f"{name}: {counts[name]} entradas, el índice tiene {counts['index']}")
+            
+            doc_ids = [snapshot.metadata.get(idx, "doc_id") for idx in range(counts["metadata"])]
+            missing_ids = sum(1 for doc_id in doc_ids if doc_id is None)
+            if missing_ids:
+                problems.append(f"metadata: {missing_ids} documentos sin doc_id")
+            if any(idx >= counts["documents"] for idx in snapshot.deleted):
+                problems.append("deleted: posiciones borradas fuera de rango")
+            
+            # Vectores del índice frente a la matriz (PQ es aproximado: solo se comparan conteos)
+            comparable = min(counts["index"], counts["embeddings"])
+            if sample_size and comparable and snapshot.index.index_type != "IVFPQ":
+                rng = np.random.default_rng(0)
+                positions = np.sort(rng.choice(comparable, size=min(sample_size, comparable), replace=False))
+                drift = np.abs(snapshot.index.reconstruct_batch(positions) - self.embeddings.vectors(positions))
+                tolerance = 1e-2 if self.embeddings.dtype == np.float16 else 1e-5
+                mismatched = int((drift.max(axis=1) > tolerance).sum())
+                if mismatched:
+                    problems.append(f"vectores: {mismatched}/{len(positions)} posiciones del índice "
+                                    f"no coinciden con la matriz")
+        
+        for problem in problems:
+            logger.warning(f"Inconsistencia en el almacén: {problem}")
+        return {"ok": not problems, "counts": counts, "problems": problems}
+    
+    def rebuild_index(self, index_type: Optional[str] = None) -> TieredIndex:
+        """
+        Reconstruir el índice FAISS (y los shards) desde la matriz de embeddings.
+        
+        No vuelve a codificar documentos: sirve para cambiar de tipo de
+        índice o recuperar un índice dañado. Los vectores que no alcanzan
+        para entrenar un índice IVF quedan en el delta.
+        
+        Args:
+            index_type: Tipo del índice principal (por defecto el actual)
+        
+        Returns:
+            El índice publicado
+        """
+        with self._writing():
+            index_type = index_type or self._snapshot.index.index_type
+            start = time.perf_counter()
+            index = self._index_from_matrix(index_type)
+            self._publish_rebuilt(index)
+            self._save(checkpoint=True)
+        
+        logger.info(f"Índice {index_type} reconstruido desde la matriz: {index.ntotal} vectores "
+                    f"en {time.perf_counter() - start:.2f} s")
+        return index
+    
+    def _index_from_matrix(self, index_type: str) -> TieredIndex:
+        """Índice nuevo con todos los vectores de la matriz (con el lock tomado)"""
+        if len(self.embeddings) < len(self.documents):
+            raise ValueError(f"La matriz tiene {len(self.embeddings)} vectores para {len(self.documents)} "
+                             f"documentos: hay que volver a codificar los que faltan")
+        
+        vectors = self.embeddings.vectors()[:len(self.documents)]
+        metric = self._snapshot.index.metric
+        main = build_index(index_type, self.embedding_dim, vectors, metric) if len(vectors) else None
+        if main is not None:
+            main.add(vectors)
+            index = TieredIndex(self.embedding_dim, index_type, main=main, metric=metric)
+        else:
+            index = TieredIndex(self.embedding_dim, index_type, metric=metric).with_vectors(vectors)
+        
+        if len(self.embeddings) > len(vectors):
+            dtype = self.embeddings.dtype
+            self.embeddings = EmbeddingMatrix(self.embedding_dim, dtype.name, vectors.astype(dtype))
+        return index
+    
+    def export_bundle(self, directory: str, batch_size: int = 1000) -> Dict:
+        """
+        Exportar el almacén como paquete portable (ver rag/bundle.py).
+        
+        Returns:
+            Manifiesto del paquete
+        """
+        return export_bundle(self, directory, batch_size)
+    
+    def import_bundle(self, directory: str, batch_size: int = 1000, index_type: Optional[str] = None) -> int:
+        """
+        Añadir los documentos de un paquete portable.
+        
+        Textos y metadatos se leen por lotes; el índice FAISS se construye
+        una sola vez al final desde la matriz de embeddings, en lugar de
+        copiar el delta en cada lote. Los documentos se añaden tal cual,
+        sin volver a agrupar casi duplicados. Si el paquete falla a mitad
+        (líneas que no cuadran, JSON inválido) el almacén vuelve al estado
+        de disco: no queda ningún lote a medias.
+        
+        Args:
+            directory: Directorio del paquete
+            batch_size: Documentos por lote
+            index_type: Tipo del índice principal (por defecto el actual)
+        
+        Returns:
+            Documentos añadidos
+        """
+        manifest = read_bundle_manifest(directory)
+        if manifest["embedding_dim"] != self.embedding_dim:
+            raise ValueError(f"El paquete tiene embeddings de dimensión {manifest['embedding_dim']}, "
+                             f"el almacén usa {self.embedding_dim}")
+        
+        added = 0
+        with self._writing():
+            if len(self.embeddings) != len(self.documents):
+                raise ValueError("El almacén tiene documentos sin vector: reconstrúyelo antes de importar")
+            
+            try:
+                for documents, vectors in iter_bundle(directory, manifest, batch_size):
+                    for doc in documents:
+                        self._append_document(doc['content'], doc['metadata'], deduplicate=False)
+                    self.embeddings.append(vectors)
+                    added += len(documents)
+                
+                if not self.intents.get("intents"):
+                    self._compile_intents(read_bundle_intents(directory),
+                                          manifest["files"][INTENTS_NAME]["sha256"])
+                
+                self._publish_rebuilt(self._index_from_matrix(index_type or self._snapshot.index.index_type))
+            except Exception:
+                # Los lotes ya añadidos solo están en memoria: se vuelve al estado de disco
+                self._adopt(*self._read_from_disk())
+                raise
+            self.stats["total_documents"] = len(self.documents) - len(self.deleted)
+            self._save(checkpoint=True)
+        
+        logger.info(f"Paquete importado desde {directory}: {added} de {manifest['documents']} documentos")
+        return added
+    
+    def merge_delta(self) -> bool:
+        """
+        Volcar el delta al índice principal y publicar el resultado.
+        
+        El volcado (clonar el principal y añadir el delta) se hace fuera del
+        lock; después solo se reaplican los vectores que llegaron mientras
+        tanto, así que las escrituras no quedan bloqueadas.
+        
+        Returns:
+            True si se volcó el delta de algún índice
+        """
+        base = self._snapshot.index
+        merged = base.merged() if base.needs_merge() else None
+        
+        with self._writing() as reloaded:
+            if reloaded:
+                return False  # Otro proceso publicó mientras tanto; se reintenta luego
+            snapshot = self._snapshot
+            index = snapshot.index
+            if merged is not None and index.main is base.main:
+                pending = index.delta.ntotal - base.delta.ntotal
+                index = merged.with_vectors(index.delta_vectors(base.delta.ntotal)) if pending else merged
+            
+            shards = snapshot.shards
+            shards_merged = shards is not None and shards.needs_merge()
+            if shards_merged:
+                shards = shards.with_merged()
+            
+            if index is snapshot.index and not shards_merged:
+                return False
+            
+            self._publish(index, shards)
+            self._save(checkpoint=True)
+        return True
+    
+    def _start_merger(self, interval: float):
+        """Arrancar el hilo que vuelca el delta en segundo plano"""
+        if interval <= 0:
+            return
+        
+        def _run():
+            while not self._stop_merger.wait(interval):
+                try:
+                    self.refresh()
+                    self.merge_delta()
+                except Exception as e:
+                    logger.error(f"Error volcando delta: {e}")
+        
+        threading.Thread(target=_run, name="faiss-delta-merger", daemon=True).start()
+    
+    def _object_store(self, object_store: Optional[ObjectStore]) -> ObjectStore:
+        object_store = object_store or object_store_from_settings()
+        if object_store is None:
+            raise ValueError("No hay almacén de objetos configurado (S3_BUCKET u OBJECT_STORE_DIR)")
+        return object_store
+    
+    @property
+    def snapshot_prefix(self) -> str:
+        return (settings.S3_VECTOR_STORE_PATH or "vector_store").strip("/")
+    
+    def publish_snapshot(self, object_store: Optional[ObjectStore] = None) -> Dict:
+        """
+        Publicar el estado actual en el almacén de objetos (S3 o directorio).
+        
+        Returns:
+            Manifiesto del snapshot publicado
+        """
+        object_store = self._object_store(object_store)
+        with self._writing():
+            # El snapshot se compone de los archivos completos: se consolida antes
+            if os.path.exists(self.journal_path):
+                self._save(checkpoint=True)
+            return publish_snapshot(object_store, self.persist_directory, self.documents,
+                                    self.snapshot_prefix, settings.SNAPSHOT_SEGMENT_SIZE,
+                                    signing_key=settings.SNAPSHOT_SIGNING_KEY)
+    
+    def pull_snapshot(self, object_store: Optional[ObjectStore] = None,
+                      prefetch: Optional[bool] = None) -> bool:
+        """
+        Sustituir el almacén local por el último snapshot publicado.
+        
+        Índices y metadatos se descargan de inmediato, así que el nodo puede
+        responder enseguida; los textos se descargan por segmentos al leerlos
+        (y opcionalmente en segundo plano).
+        
+        Returns:
+            True si se descargó un snapshot nuevo
+        """
+        object_store = self._object_store(object_store)
+        with self._write_lock, self.lock.exclusive():
+            manifest = pull_snapshot(object_store, self.persist_directory, self.snapshot_prefix,
+                                     cache_size=settings.DOC_CACHE_SIZE,
+                                     signing_key=settings.SNAPSHOT_SIGNING_KEY)
+            if manifest is None:
+                return False
+            self._sync_from_disk()
+        
+        if settings.SNAPSHOT_PREFETCH if prefetch is None else prefetch:
+            documents = self.documents
+            threading.Thread(target=documents.prefetch, name="snapshot-prefetch", daemon=True).start()
+        return True
+    
+    def close(self):
+        """Detener los hilos de fondo (volcado del delta y vigilancia de intents)"""
+        self._stop_merger.set()
+    
     def get_stats(self) -> Dict:
         """Obtener estadísticas del almacén"""
-        return {
+        snapshot = self._snapshot
+        stats = {
             **self.stats,
-            "index_size": self.index.ntotal if self.index else 0,
+            "index_size": snapshot.index.ntotal,
             "embedding_dim": self.embedding_dim,
-            "index_type": "FAISS-FlatL2"
+            "index_type": f"FAISS-{snapshot.index.index_type}",
+            "tiers": snapshot.index.get_stats(),
+            "snapshot_version": snapshot.version,
+            "metadata_memory": snapshot.metadata.memory_usage(),
+            "embedding_matrix": self.embeddings.memory_usage(),
+            "document_memory": snapshot.documents.memory_usage()
         }
+        if snapshot.shards is not None:
+            stats["sharding"] = snapshot.shards.get_stats()
+        if snapshot.router is not None:
+            stats["routing"] = snapshot.router.get_stats()
+        return stats
     
     def clear(self):
         """Limpiar todos los datos"""
-        self.index = None
-        self.documents = []
-        self.metadata = []
-        self.intents = {"intents": []}
-        self.doc_id_to_idx = {}
-        
-        # Eliminar archivos
-        for path in [self.index_path, self.documents_path, self.metadata_path, self.intents_path]:
-            if os.path.exists(path):
-                try:
-                    os.remove(path)
-                except:
-                    pass
-        
-        self.stats = {"total_documents": 0, "last_updated": None}
+        with self._write_lock, self.lock.exclusive():
+            # Las búsquedas en curso conservan la instantánea anterior
+            self.documents = self._new_document_store()
+            self.metadata = ColumnarMetadata()
+            self.exact_keys = self._new_exact_keys()
+            self.keywords = self._new_keyword_index()
+            self.bm25 = BM25Index()
+            self.dedup = self._new_dedup_index()
+            self.embeddings = self._new_embedding_matrix()
+            self.router = self._new_router()
+            self.deleted = frozenset()
+            self.intents = {"intents": []}
+            self.doc_id_to_idx = {}
+            self.parent_to_chunks = {}
+            self._checkpoint = (0, 0)
+            self._journal_updates = {}
+            self._saved_main = None
+            self._empty_snapshot()
+            
+            # Eliminar archivos
+            for path in [self.index_path, self.delta_path, self.documents_path, self.metadata_path,
+                         self.intents_path, self.intents_artifact_path, self.intents_overlay_path, self.deleted_path,
+                         self.bm25_path, self.dedup_path, self.embeddings_path, self.journal_path]:
+                if os.path.exists(path):
+                    try:
+                        os.remove(path)
+                    except:
+                        pass
+            
+            self.stats = {"total_documents": 0, "last_updated": None}
+            self.generation += 1
+            write_manifest(self.persist_directory, self.generation, documents=0)
         logger.info("Almacén vectorial limpiado")
\ No newline at end of file
@@ -0,0 +1,158 @@
+"""
+Enrutado de consultas a la partición de su categoría mediante centroides
+"""
+import logging
+import threading
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class _RoutingStats:
+    """Contadores compartidos entre versiones del router"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.routed = 0
+        self.global_searches = 0
+        self.audited = 0
+        self.correct = 0
+        self.routed_ms = 0.0
+        self.global_ms = 0.0
+
+    def record_route(self, routed: bool):
+        with self._lock:
+            if routed:
+                self.routed += 1
+            else:
+                self.global_searches += 1
+
+    def record_audit(self, correct: bool, routed_ms: float, global_ms: float):
+        with self._lock:
+            self.audited += 1
+            self.correct += int(correct)
+            self.routed_ms += routed_ms
+            self.global_ms += global_ms
+
+    def as_dict(self) -> Dict:
+        with self._lock:
+            total = self.routed + self.global_searches
+            return {
+                "routed": self.routed,
+                "global": self.global_searches,
+                "routed_ratio": round(self.routed / total, 3) if total else 0.0,
+                "audited": self.audited,
+                "accuracy": round(self.correct / self.audited, 3) if self.audited else None,
+                "avg_routed_ms": round(self.routed_ms / self.audited, 3) if self.audited else None,
+                "avg_global_ms": round(self.global_ms / self.audited, 3) if self.audited else None,
+                "latency_saving": round(1.0 - self.routed_ms / self.global_ms, 3) if self.global_ms else None
+            }
+
+
+class CentroidRouter:
+    """
+    Clasificador de consultas por similitud con el centroide de cada categoría.
+
+    Los centroides se mantienen como sumas de embeddings normalizados y se
+    actualizan al ingerir y al borrar, así que clasificar una consulta es
+    un solo producto matriz-vector. Como los índices, las instancias son
+    inmutables: with_added() y with_removed() devuelven una versión nueva.
+    """
+
+    def __init__(self, embedding_dim: int, min_margin: float = 0.05,
+                 sums: Optional[Dict[str, np.ndarray]] = None, counts: Optional[Dict[str, int]] = None,
+                 stats: Optional[_RoutingStats] = None):
+        """
+        Args:
+            embedding_dim: Dimensión de los embeddings
+            min_margin: Diferencia mínima de similitud entre la primera y la
+                segunda categoría para enrutar (si no, búsqueda global)
+            sums: Suma de embeddings por categoría (uso interno)
+            counts: Documentos por categoría (uso interno)
+            stats: Contadores compartidos entre versiones (uso interno)
+        """
+        self.embedding_dim = embedding_dim
+        self.min_margin = min_margin
+        self.sums = sums or {}
+        self.counts = counts or {}
+        self.stats = stats or _RoutingStats()
+
+        # Centroides normalizados en una matriz (categorías, dimensión)
+        self.categories = sorted(c for c, n in self.counts.items() if n > 0)
+        if self.categories:
+            matrix = np.vstack([self.sums[c] for c in self.categories]).astype('float32')
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            self.centroids = matrix / np.maximum(norms, 1e-12)
+        else:
+            self.centroids = np.zeros((0, embedding_dim), dtype='float32')
+
+    @staticmethod
+    def _normalized(vectors: np.ndarray) -> np.ndarray:
+        vectors = np.asarray(vectors, dtype='float32').reshape(-1, vectors.shape[-1])
+        return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+    def _derive(self, groups: Dict[str, np.ndarray], sign: int) -> "CentroidRouter":
+        sums, counts = dict(self.sums), dict(self.counts)
+        for category, vectors in groups.items():
+            if len(vectors) == 0:
+                continue
+            vectors = self._normalized(vectors)
+            current = sums.get(category, np.zeros(self.embedding_dim, dtype='float64'))
+            sums[category] = current + sign * vectors.sum(axis=0, dtype='float64')
+            counts[category] = counts.get(category, 0) + sign * len(vectors)
+        return CentroidRouter(self.embedding_dim, self.min_margin, sums, counts, self.stats)
+
+    def with_added(self, groups: Dict[str, np.ndarray]) -> "CentroidRouter":
+        """Nueva versión con embeddings añadidos (categoría → vectores)"""
+        return self._derive(groups, 1)
+
+    def with_removed(self, groups: Dict[str, np.ndarray]) -> "CentroidRouter":
+        """Nueva versión sin los embeddings de documentos borrados"""
+        return self._derive(groups, -1)
+
+    def classify(self, query_embedding: np.ndarray) -> Tuple[Optional[str], float]:
+        """
+        Categoría más probable de una consulta.
+
+        Returns:
+            (categoría, margen sobre la segunda); categoría None si no hay
+            al menos dos categorías
+        """
+        if len(self.categories) < 2:
+            return None, 0.0
+        sims = self.centroids @ self._normalized(query_embedding)[0]
+        second, first = np.argpartition(-sims, 1)[1], int(np.argmax(sims))
+        return self.categories[first], float(sims[first] - sims[second])
+
+    def route(self, query_embedding: np.ndarray) -> Optional[str]:
+        """Categoría a la que dirigir la búsqueda, o None si no hay confianza suficiente"""
+        category, margin = self.classify(query_embedding)
+        if category is not None and margin < self.min_margin:
+            category = None
+        self.stats.record_route(category is not None)
+        return category
+
+    def record_audit(self, routed: str, actual: Optional[str], routed_ms: float, global_ms: float):
+        """
+        Registrar una consulta enrutada que también se buscó globalmente.
+
+        Args:
+            routed: Categoría predicha
+            actual: Categoría del mejor resultado global
+            routed_ms: Latencia de la búsqueda en la partición
+            global_ms: Latencia de la búsqueda global
+        """
+        self.stats.record_audit(routed == actual, routed_ms, global_ms)
+        summary = self.stats.as_dict()
+        logger.info(f"Enrutado '{routed}' (real: '{actual}'): {routed_ms:.2f} ms frente a {global_ms:.2f} ms; "
+                    f"precisión {summary['accuracy']:.1%} en {summary['audited']} consultas auditadas, "
+                    f"ahorro medio {summary['latency_saving'] or 0.0:.1%}")
+
+    def get_stats(self) -> Dict:
+        return {
+            "categories": {c: self.counts[c] for c in self.categories},
+            "min_margin": self.min_margin,
+            **self.stats.as_dict()
+        }
@@ -0,0 +1,247 @@
+"""
+Índice FAISS particionado por una clave de metadatos (p. ej. 'categoria')
+"""
+import heapq
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import faiss
+import numpy as np
+
+from .tiered_index import TieredIndex
+
+logger = logging.getLogger(__name__)
+
+# Shard usado para documentos que no tienen la clave de partición
+DEFAULT_SHARD = "_sin_categoria"
+
+
+def shard_executor(max_workers: Optional[int] = None) -> ThreadPoolExecutor:
+    """Pool de hilos para repartir una consulta entre shards (uno por almacén)"""
+    return ThreadPoolExecutor(max_workers=max_workers or min(8, os.cpu_count() or 1),
+                              thread_name_prefix="faiss-shard")
+
+
+class _ShardStats:
+    """Contadores de latencia compartidos entre versiones de un shard (los actualizan varios hilos)"""
+
+    def __init__(self):
+        self.searches = 0
+        self.total_ms = 0.0
+        self.last_ms = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, elapsed_ms: float):
+        with self._lock:
+            self.searches += 1
+            self.total_ms += elapsed_ms
+            self.last_ms = elapsed_ms
+
+    def read(self) -> Tuple[int, float, float]:
+        """(búsquedas, ms totales, ms de la última) leídos a la vez"""
+        with self._lock:
+            return self.searches, self.total_ms, self.last_ms
+
+
+class _Shard:
+    """
+    Un índice FAISS independiente con el mapeo posición local → posición global.
+
+    La lista de posiciones solo crece y se comparte entre versiones: cada
+    versión solo consulta las posiciones que caben en su propio índice.
+    """
+
+    def __init__(self, index: TieredIndex, positions: List[int], stats: Optional[_ShardStats] = None):
+        self.index = index
+        self.positions = positions
+        self.stats = stats or _ShardStats()
+
+    def with_vectors(self, vectors: np.ndarray, positions: List[int]) -> "_Shard":
+        index = self.index.with_vectors(vectors)
+        self.positions.extend(positions)
+        return _Shard(index, self.positions, self.stats)
+
+    def _timed(self, fn, *args):
+        start = time.perf_counter()
+        result = fn(*args)
+        self.stats.record((time.perf_counter() - start) * 1000)
+        return result
+
+    def search(self, query: np.ndarray, top_k: int) -> List[Tuple[float, int]]:
+        """Buscar en el shard y devolver pares (distancia, posición global)"""
+        if self.index.ntotal == 0:
+            return []
+
+        distances, indices = self._timed(self.index.search, query, min(top_k, self.index.ntotal))
+        return [
+            (float(dist), self.positions[idx])
+            for dist, idx in zip(distances[0], indices[0])
+            if idx >= 0
+        ]
+
+    def range_search(self, query: np.ndarray, radius: float) -> List[Tuple[float, int]]:
+        """Vecinos del shard dentro del radio como pares (distancia, posición global)"""
+        if self.index.ntotal == 0:
+            return []
+
+        distances, indices = self._timed(self.index.range_search, query, radius)
+        return [(float(dist), self.positions[idx]) for dist, idx in zip(distances, indices)]
+
+    def get_stats(self) -> Dict:
+        searches, total_ms, last_ms = self.stats.read()
+        return {
+            "size": self.index.ntotal,
+            "searches": searches,
+            "avg_latency_ms": round(total_ms / searches, 3) if searches else 0.0,
+            "last_latency_ms": round(last_ms, 3)
+        }
+
+
+class ShardedIndex:
+    """
+    Conjunto de índices FAISS, uno por valor de la clave de partición.
+
+    Las consultas dirigidas a un shard solo buscan en ese índice; las
+    consultas sin shard se reparten entre todos en un pool de hilos
+    (FAISS libera el GIL durante la búsqueda) y se combinan con un heap.
+
+    Como TieredIndex, las instancias son inmutables: with_added(),
+    with_rebuilt() y with_merged() devuelven una versión nueva que comparte
+    los shards no modificados.
+    """
+
+    def __init__(self, shard_key: str, embedding_dim: int, max_workers: Optional[int] = None,
+                 metric: int = faiss.METRIC_L2, shards: Optional[Dict[str, _Shard]] = None,
+                 executor: Optional[ThreadPoolExecutor] = None):
+        """
+        Args:
+            shard_key: Campo de metadatos que define la partición
+            embedding_dim: Dimensión de los embeddings
+            max_workers: Hilos para la búsqueda en paralelo
+            metric: Métrica FAISS de los índices de cada shard
+            shards: Shards existentes (uso interno)
+            executor: Pool de hilos compartido entre versiones; sin él se crea
+                uno propio (quien reconstruye índices a menudo debe pasarlo)
+        """
+        self.shard_key = shard_key
+        self.embedding_dim = embedding_dim
+        self.metric = metric
+        self.shards: Dict[str, _Shard] = shards or {}
+        self._executor = executor or shard_executor(max_workers)
+
+    def _derive(self, shards: Dict[str, _Shard]) -> "ShardedIndex":
+        return ShardedIndex(self.shard_key, self.embedding_dim, metric=self.metric,
+                            shards=shards, executor=self._executor)
+
+    def _empty_shard(self) -> _Shard:
+        # Los shards son pequeños: índice principal exacto más delta
+        return _Shard(TieredIndex(self.embedding_dim, "FlatL2", metric=self.metric), [])
+
+    def shard_for(self, metadata: Dict) -> str:
+        """Obtener el shard al que pertenece un documento"""
+        value = metadata.get(self.shard_key)
+        if value is None or value == "":
+            return DEFAULT_SHARD
+        return str(value)
+
+    def with_added(self, groups: Dict[str, Tuple[np.ndarray, List[int]]]) -> "ShardedIndex":
+        """
+        Nueva versión con vectores añadidos a varios shards.
+
+        Args:
+            groups: shard → (vectores float32 (n, embedding_dim), posiciones globales)
+        """
+        shards = dict(self.shards)
+        for shard, (vectors, positions) in groups.items():
+            current = shards.get(shard) or self._empty_shard()
+            shards[shard] = current.with_vectors(vectors, positions)
+        return self._derive(shards)
+
+    def with_rebuilt(self, shard: str, vectors: Optional[np.ndarray], positions: List[int]) -> "ShardedIndex":
+        """Nueva versión con un shard reconstruido desde cero sin tocar los demás"""
+        new_shard = self._empty_shard()
+        if len(positions) > 0:
+            new_shard = new_shard.with_vectors(vectors, list(positions))
+        if shard in self.shards:
+            new_shard.stats = self.shards[shard].stats
+
+        logger.info(f"Shard '{shard}' reconstruido: {new_shard.index.ntotal} vectores")
+        return self._derive({**self.shards, shard: new_shard})
+
+    def needs_merge(self) -> bool:
+        return any(s.index.needs_merge() for s in self.shards.values())
+
+    def with_merged(self) -> "ShardedIndex":
+        """Nueva versión con el delta de cada shard volcado a su principal"""
+        shards = dict(self.shards)
+        for name, shard in self.shards.items():
+            merged = shard.index.merged() if shard.index.needs_merge() else None
+            if merged is not None:
+                shards[name] = _Shard(merged, shard.positions, shard.stats)
+        return self._derive(shards)
+
+    def search(self, query: np.ndarray, top_k: int, shard: Optional[str] = None) -> List[Tuple[float, int]]:
+        """
+        Buscar los top_k vecinos más cercanos.
+
+        Args:
+            query: Array float32 de forma (1, embedding_dim)
+            top_k: Número de resultados
+            shard: Shard al que dirigir la consulta (None = todos)
+
+        Returns:
+            Lista de pares (distancia, posición global) de mejor a peor
+        """
+        hits = self._fan_out(lambda s: s.search(query, top_k), shard)
+        return self._best(hits, top_k)
+
+    def range_search(self, query: np.ndarray, radius: float, shard: Optional[str] = None) -> List[Tuple[float, int]]:
+        """
+        Todos los vecinos dentro del radio, en uno o en todos los shards.
+
+        Returns:
+            Lista de pares (distancia, posición global) de mejor a peor
+        """
+        hits = self._fan_out(lambda s: s.range_search(query, radius), shard)
+        return self._best(hits, None)
+
+    def positions(self, shard: str) -> List[int]:
+        """Posiciones globales de un shard en esta versión (vacía si no existe)"""
+        target = self.shards.get(shard)
+        return target.positions[:target.index.ntotal] if target else []
+
+    def _fan_out(self, fn, shard: Optional[str]):
+        """Ejecutar fn en el shard indicado o en todos en paralelo"""
+        if shard is not None:
+            target = self.shards.get(shard)
+            return fn(target) if target else []
+
+        shards = list(self.shards.values())
+        if len(shards) <= 1:
+            return [hit for s in shards for hit in fn(s)]
+
+        partials = self._executor.map(fn, shards)
+        return [hit for hits in partials for hit in hits]
+
+    def _best(self, hits: List[Tuple[float, int]], top_k: Optional[int]) -> List[Tuple[float, int]]:
+        """Combinar resultados con un heap según la métrica"""
+        n = len(hits) if top_k is None else top_k
+        if self.metric == faiss.METRIC_INNER_PRODUCT:
+            return heapq.nlargest(n, hits)
+        return heapq.nsmallest(n, hits)
+
+    @property
+    def ntotal(self) -> int:
+        return sum(s.index.ntotal for s in self.shards.values())
+
+    def get_stats(self) -> Dict:
+        """Tamaño y latencias por shard"""
+        return {
+            "shard_key": self.shard_key,
+            "num_shards": len(self.shards),
+            "shards": {name: s.get_stats() for name, s in sorted(self.shards.items())}
+        }
@@ -0,0 +1,247 @@
+"""
+Publicación y descarga de snapshots del almacén vectorial en un ObjectStore
+"""
+import hashlib
+import hmac
+import json
+import logging
+import os
+import pickle
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from .document_store import CompressedTextStore, decode_segment
+from .object_store import ObjectStore
+from .persistence import atomic_write, read_manifest, write_manifest
+
+logger = logging.getLogger(__name__)
+
+# Archivos que se copian tal cual; los documentos se publican por segmentos
+SNAPSHOT_FILES = ("faiss_index.bin", "faiss_delta.bin", "metadata.pkl", "intents.bin", "intents.json",
+                  "intents_overlay.json", "deleted.json", "bm25.pkl", "dedup.pkl", "embeddings.npy")
+# Cambios locales sin consolidar: no se publican y el snapshot descargado los sustituye
+LOCAL_FILES = ("journal.pkl",)
+
+
+class SegmentFetcher:
+    """Descarga segmentos de documentos de un snapshot (serializable con pickle)"""
+
+    def __init__(self, object_store: ObjectStore, keys: List[str]):
+        self.object_store = object_store
+        self.keys = keys
+
+    def __call__(self, segment: int) -> List[bytes]:
+        key = self.keys[segment]
+        data = self.object_store.get(key)
+        # Los segmentos se guardan por su hash: el nombre es su checksum
+        _verify(key, data, os.path.splitext(os.path.basename(key))[0])
+        return decode_segment(data)
+
+
+def _digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def _verify(key: str, data: bytes, checksum: Optional[str]):
+    if checksum is None or not hmac.compare_digest(_digest(data), checksum):
+        raise ValueError(f"Checksum incorrecto en '{key}': el snapshot no se carga")
+
+
+def _signature(manifest: Dict[str, Any], signing_key: str) -> str:
+    """HMAC-SHA256 del manifiesto (sin el campo 'signature', con las claves ordenadas)"""
+    payload = json.dumps({k: v for k, v in manifest.items() if k != "signature"}, sort_keys=True)
+    return hmac.new(signing_key.encode("utf-8"), payload.encode("utf-8"), hashlib.sha256).hexdigest()
+
+
+def _require_key(signing_key: Optional[str]) -> str:
+    if not signing_key:
+        raise ValueError("Snapshots desactivados: define SNAPSHOT_SIGNING_KEY")
+    return signing_key
+
+
+def _manifest_key(prefix: str, generation: int) -> str:
+    return f"{prefix}/generations/{generation:08d}/manifest.json"
+
+
+def _latest(object_store: ObjectStore, prefix: str) -> Optional[Dict[str, Any]]:
+    try:
+        return json.loads(object_store.get(f"{prefix}/latest.json"))
+    except KeyError:
+        return None
+
+
+def _latest_generation(object_store: ObjectStore, prefix: str) -> int:
+    """
+    Última generación publicada (0 si no hay ninguna).
+
+    latest.json es solo una pista: dos publicadores pueden escribirlo en
+    desorden, así que se comprueba si existen manifiestos posteriores.
+    """
+    latest = _latest(object_store, prefix)
+    generation = latest["generation"] if latest else 0
+    while object_store.exists(_manifest_key(prefix, generation + 1)):
+        generation += 1
+    return generation
+
+
+def _put_content(object_store: ObjectStore, prefix: str, name: str, data: bytes) -> str:
+    """Subir un archivo bajo su hash (no se sobrescribe nunca); devuelve la clave"""
+    key = f"{prefix}/files/{_digest(data)}/{name}"
+    if not object_store.exists(key):
+        object_store.put(key, data)
+    return key
+
+
+def publish_snapshot(object_store: ObjectStore, persist_directory: str, documents: CompressedTextStore,
+                     prefix: str, segment_size: int = 256, signing_key: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Subir el estado actual del directorio como una generación nueva.
+
+    El directorio tiene que estar consolidado (sin journal.pkl). Archivos y
+    segmentos de documentos se guardan por su hash, así que solo se suben
+    los que cambiaron desde la última publicación y nunca se pisan. El
+    manifiesto, firmado con HMAC, se crea al final y solo si la generación
+    está libre: si otro publicador la ocupó se usa la siguiente. Los nodos
+    nunca ven un snapshot incompleto.
+
+    Args:
+        object_store: Destino
+        persist_directory: Directorio del almacén (con el lock tomado)
+        documents: Documentos correspondientes a ese directorio
+        prefix: Prefijo de las claves
+        segment_size: Documentos por segmento
+        signing_key: Clave HMAC de los manifiestos (obligatoria)
+
+    Returns:
+        Manifiesto publicado
+    """
+    signing_key = _require_key(signing_key)
+
+    files, checksums = {}, {}
+    for name in SNAPSHOT_FILES:
+        path = os.path.join(persist_directory, name)
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                data = f.read()
+            files[name] = _put_content(object_store, prefix, name, data)
+            checksums[files[name]] = _digest(data)
+
+    segments, uploaded = [], 0
+    for data in documents.segments(segment_size):
+        key = f"{prefix}/segments/{_digest(data)}.bin"
+        if not object_store.exists(key):
+            object_store.put(key, data)
+            uploaded += 1
+        segments.append(key)
+
+    header = documents.header()
+    documents_header = _put_content(object_store, prefix, "documents_header.bin", header)
+    checksums[documents_header] = _digest(header)
+
+    generation = _latest_generation(object_store, prefix) + 1
+    while True:
+        manifest = {
+            "generation": generation,
+            "created_at": datetime.now().isoformat(),
+            "documents": len(documents),
+            "segment_size": segment_size,
+            "files": files,
+            "documents_header": documents_header,
+            "segments": segments,
+            "checksums": checksums
+        }
+        manifest["signature"] = _signature(manifest, signing_key)
+        data = json.dumps(manifest, indent=2).encode("utf-8")
+        if object_store.put_if_absent(_manifest_key(prefix, generation), data):
+            break
+        logger.info(f"La generación {generation} ya se publicó desde otro nodo: se usa la siguiente")
+        generation += 1
+
+    latest = _latest(object_store, prefix)
+    if latest is None or latest["generation"] < generation:
+        object_store.put(f"{prefix}/latest.json", json.dumps({
+            "generation": generation,
+            "manifest": _manifest_key(prefix, generation)
+        }).encode("utf-8"))
+
+    logger.info(f"Snapshot {generation} publicado: {len(documents)} documentos, "
+                f"{uploaded}/{len(segments)} segmentos nuevos")
+    return manifest
+
+
+def pull_snapshot(object_store: ObjectStore, persist_directory: str, prefix: str,
+                  cache_size: int = 256, signing_key: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """
+    Descargar el último snapshot publicado al directorio local.
+
+    Solo se descargan índices, metadatos y la cabecera de documentos; los
+    segmentos de texto se piden al leer cada documento. Antes de escribir
+    nada se comprueban la firma del manifiesto y el checksum de cada
+    archivo: los pickles descargados solo se cargan si los publicó quien
+    tiene la clave. La generación local avanza para que los procesos
+    abiertos recarguen.
+
+    Args:
+        object_store: Origen
+        persist_directory: Directorio del almacén (con el lock exclusivo tomado)
+        prefix: Prefijo de las claves
+        cache_size: Caché LRU del almacén de documentos
+        signing_key: Clave HMAC de los manifiestos (obligatoria)
+
+    Returns:
+        Manifiesto descargado, o None si no hay snapshot o ya estaba al día
+
+    Raises:
+        ValueError: Si la firma o algún checksum no coinciden
+    """
+    signing_key = _require_key(signing_key)
+    generation = _latest_generation(object_store, prefix)
+    if generation == 0:
+        logger.info(f"No hay snapshots publicados en '{prefix}'")
+        return None
+
+    local = read_manifest(persist_directory)
+    if local.get("snapshot_generation") == generation:
+        return None
+
+    manifest_key = _manifest_key(prefix, generation)
+    manifest = json.loads(object_store.get(manifest_key))
+    if not hmac.compare_digest(str(manifest.get("signature", "")), _signature(manifest, signing_key)):
+        raise ValueError(f"Firma incorrecta en '{manifest_key}': el snapshot no se carga")
+
+    checksums = manifest["checksums"]
+    downloaded = {}
+    for name, key in manifest["files"].items():
+        if name in SNAPSHOT_FILES:
+            downloaded[name] = object_store.get(key)
+            _verify(key, downloaded[name], checksums.get(key))
+    header = object_store.get(manifest["documents_header"])
+    _verify(manifest["documents_header"], header, checksums.get(manifest["documents_header"]))
+
+    for name in SNAPSHOT_FILES:
+        path = os.path.join(persist_directory, name)
+        if name not in downloaded:
+            if os.path.exists(path):
+                os.remove(path)
+            continue
+        with atomic_write(path) as f:
+            f.write(downloaded[name])
+    for name in LOCAL_FILES:
+        path = os.path.join(persist_directory, name)
+        if os.path.exists(path):
+            os.remove(path)
+
+    documents = CompressedTextStore.from_header(
+        header,
+        SegmentFetcher(object_store, manifest["segments"]),
+        manifest["segment_size"],
+        cache_size=cache_size
+    )
+    with atomic_write(os.path.join(persist_directory, "documents.pkl")) as f:
+        pickle.dump(documents, f)
+
+    write_manifest(persist_directory, local["generation"] + 1,
+                   documents=manifest["documents"], snapshot_generation=manifest["generation"])
+    logger.info(f"Snapshot {manifest['generation']} descargado: {manifest['documents']} documentos "
+                f"({len(manifest['segments'])} segmentos bajo demanda)")
+    return manifest
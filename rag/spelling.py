@@ -0,0 +1,164 @@
+"""
+Corrección de errores de tecleo con un índice de borrados simétricos (estilo SymSpell)
+"""
+import re
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+from .text import fold_accents
+
+_TOKEN_PATTERN = re.compile(r"[^\W\d_]+")
+_CACHE_SIZE = 10000
+
+
+def edit_distance(a: str, b: str, max_distance: int) -> int:
+    """
+    Distancia de Damerau-Levenshtein restringida (transposiciones adyacentes).
+
+    Returns:
+        La distancia, o max_distance + 1 si la supera
+    """
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i] + [0] * len(b)
+        for j, char_b in enumerate(b, 1):
+            cost = 0 if char_a == char_b else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if (previous2 is not None and j > 1 and char_a == b[j - 2] and a[i - 2] == char_b):
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > max_distance:
+            return max_distance + 1
+        previous2, previous = previous, current
+    return min(previous[-1], max_distance + 1)
+
+
+class SymSpellIndex:
+    """
+    Vocabulario con los borrados de cada palabra precalculados.
+
+    Dos palabras están a distancia d o menos solo si comparten algún borrado
+    de hasta d caracteres, así que buscar una palabra es generar sus propios
+    borrados y consultar un diccionario: sin recorrer el vocabulario. Solo se
+    indexan los borrados del prefijo (prefix_length) para acotar la memoria;
+    los candidatos se confirman con la distancia real.
+
+    Las palabras se comparan sin acentos y se devuelven con la forma del
+    vocabulario, con acentos si alguna la tiene ("dia" → "día"). Entre candidatos a la misma distancia gana
+    el más frecuente en el corpus: una palabra de los patrones de intents
+    no tiene prioridad por estar en la lista, así que "sola" se corrige
+    hacia lo que escriben los alumnos y no hacia "hola". El índice solo
+    propone; quien lo usa decide si la corrección se acepta.
+    """
+
+    def __init__(self, max_distance: int = 2, prefix_length: int = 7, min_length: int = 3):
+        """
+        Args:
+            max_distance: Distancia de edición máxima de una corrección
+            prefix_length: Caracteres de cada palabra usados para los borrados
+            min_length: Palabras más cortas no se indexan ni se corrigen
+        """
+        self.max_distance = max_distance
+        self.prefix_length = prefix_length
+        self.min_length = min_length
+        # palabra sin acentos → (forma mostrada, frecuencia en el corpus)
+        self._words: Dict[str, Tuple[str, int]] = {}
+        self._deletes: Dict[str, Set[str]] = {}  # borrado → palabras que lo generan
+        self._cache: Dict[str, Optional[str]] = {}  # palabra consultada → corrección
+
+    def __len__(self) -> int:
+        return len(self._words)
+
+    def add(self, word: str, count: int = 0):
+        """
+        Añadir una palabra al vocabulario o sumar a su frecuencia.
+
+        Args:
+            count: Frecuencia en el corpus (0 para palabras de intents o vacías)
+        """
+        word = word.lower()
+        key = fold_accents(word)
+        if len(key) < self.min_length or not key.isalpha():
+            return
+        entry = self._words.get(key)
+        if entry is None or count:
+            self._cache = {}  # Cambian los candidatos o su orden
+        if entry is None:
+            for deleted in self._edits(key[:self.prefix_length], self.max_distance):
+                self._deletes.setdefault(deleted, set()).add(key)
+            entry = (word, 0)
+        surface = word if entry[0] == key and word != key else entry[0]  # Se guarda la forma con acentos
+        self._words[key] = (surface, entry[1] + count)
+
+    def add_many(self, words: Iterable[str]):
+        for word in words:
+            self.add(word)
+
+    def add_text(self, text: str):
+        """Añadir las palabras de un texto"""
+        self.add_many(_TOKEN_PATTERN.findall(text))
+
+    @staticmethod
+    def _edits(word: str, max_distance: int) -> Set[str]:
+        """La palabra y todos sus borrados de hasta max_distance caracteres"""
+        edits = {word}
+        frontier = {word}
+        for _ in range(max_distance):
+            frontier = {w[:i] + w[i + 1:] for w in frontier for i in range(len(w)) if len(w) > 1}
+            edits |= frontier
+        return edits
+
+    def _max_distance_for(self, key: str) -> int:
+        # Dos cambios solo en palabras largas: en las cortas casi cualquier palabra está a 2
+        return min(self.max_distance, 1 if len(key) < 8 else 2)
+
+    def lookup(self, word: str) -> Optional[str]:
+        """
+        Forma correcta de una palabra.
+
+        Returns:
+            La palabra si ya es conocida, si no la más cercana (menor
+            distancia, luego más frecuente en el corpus), o None si no hay ninguna
+        """
+        word = word.lower()
+        cached = self._cache.get(word, self)
+        if cached is not self:
+            return cached
+        correction = self._lookup(word)
+        if len(self._cache) >= _CACHE_SIZE:
+            self._cache = {}
+        self._cache[word] = correction
+        return correction
+
+    def _lookup(self, word: str) -> Optional[str]:
+        key = fold_accents(word)
+        entry = self._words.get(key)
+        if entry is not None:
+            return word if word != key else entry[0]
+        if len(key) < self.min_length or not key.isalpha():
+            return None
+
+        max_distance = self._max_distance_for(key)
+        best = None
+        seen = set()
+        for deleted in self._edits(key[:self.prefix_length], max_distance):
+            for candidate in self._deletes.get(deleted, ()):
+                if candidate in seen:
+                    continue
+                seen.add(candidate)
+                distance = edit_distance(key, candidate, max_distance)
+                if distance > max_distance:
+                    continue
+                surface, count = self._words[candidate]
+                rank = (distance, -count, candidate)
+                if best is None or rank < best[0]:
+                    best = (rank, surface)
+        return best[1] if best else None
+
+    def correct(self, text: str) -> str:
+        """Texto con cada palabra sustituida por su corrección (el resto intacto)"""
+        def replace(match):
+            token = match.group(0)
+            return self.lookup(token) or token
+        return _TOKEN_PATTERN.sub(replace, text.lower())
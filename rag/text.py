@@ -0,0 +1,47 @@
+"""
+Normalización de texto en español para índices léxicos
+"""
+import re
+import unicodedata
+from typing import Any, List
+
+_WORD_PATTERN = re.compile(r"[a-z0-9]+(?:[@._\-][a-z0-9]+)*")
+
+
+def fold_accents(text: str) -> str:
+    """Quitar acentos y diéresis (ñ → n) conservando el resto de caracteres"""
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def normalize_text(text: str) -> str:
+    """Minúsculas, sin acentos y con espacios simples"""
+    return " ".join(fold_accents(text).lower().split())
+
+
+def words(text: str) -> List[str]:
+    """
+    Palabras normalizadas de un texto.
+
+    Correos, dominios y números con guiones o puntos se conservan como una
+    sola palabra ("@prepaenlinea-sep.edu.mx", "25-450805").
+    """
+    return _WORD_PATTERN.findall(normalize_text(text))
+
+
+def as_keywords(value: Any) -> List[str]:
+    """
+    Palabras clave de un campo de metadatos: lista o string separado por comas.
+
+    Returns:
+        Frases normalizadas sin repetir (vacías descartadas)
+    """
+    if value is None:
+        return []
+    items = value if isinstance(value, (list, tuple, set)) else str(value).split(",")
+    keywords = []
+    for item in items:
+        phrase = " ".join(words(str(item)))
+        if phrase and phrase not in keywords:
+            keywords.append(phrase)
+    return keywords
@@ -0,0 +1,322 @@
+"""
+Índice en dos niveles (estilo LSM): índice ANN principal + índice delta plano
+"""
+import logging
+import os
+import time
+from typing import Dict, Optional, Tuple
+
+import faiss
+import numpy as np
+
+from config.settings import settings
+from .persistence import atomic_path
+
+logger = logging.getLogger(__name__)
+
+# Mínimo de vectores de entrenamiento por centroide que recomienda FAISS
+_MIN_POINTS_PER_CENTROID = 39
+
+
+def metric_from_settings() -> int:
+    """
+    Métrica FAISS según settings.FAISS_METRIC.
+
+    "cosine" y "l2" usan distancia L2 sobre embeddings normalizados (el
+    comportamiento original); "inner_product" usa producto interno directo.
+    """
+    if settings.FAISS_METRIC == "inner_product":
+        return faiss.METRIC_INNER_PRODUCT
+    return faiss.METRIC_L2
+
+
+def to_similarity(distances: np.ndarray, metric: int) -> np.ndarray:
+    """Convertir distancias FAISS a similitud coseno real (embeddings normalizados)"""
+    if metric == faiss.METRIC_INNER_PRODUCT:
+        return distances
+    # IndexFlatL2 devuelve L2 al cuadrado: ||a - b||² = 2 - 2·cos(a, b)
+    return 1.0 - distances / 2.0
+
+
+def from_similarity(similarities: np.ndarray, metric: int) -> np.ndarray:
+    """Inverso de to_similarity: similitud coseno → distancia FAISS"""
+    if metric == faiss.METRIC_INNER_PRODUCT:
+        return similarities
+    return 2.0 - 2.0 * similarities
+
+
+def similarity_radius(min_similarity: float, metric: int) -> float:
+    """Radio de range_search equivalente a un umbral de similitud coseno"""
+    if metric == faiss.METRIC_INNER_PRODUCT:
+        return min_similarity
+    return 2.0 - 2.0 * min_similarity
+
+
+def flat_index(embedding_dim: int, metric: int = faiss.METRIC_L2) -> faiss.Index:
+    """Índice exacto con la métrica indicada"""
+    if metric == faiss.METRIC_INNER_PRODUCT:
+        return faiss.IndexFlatIP(embedding_dim)
+    return faiss.IndexFlatL2(embedding_dim)
+
+
+def build_index(index_type: str, embedding_dim: int, vectors: Optional[np.ndarray] = None,
+                metric: int = faiss.METRIC_L2) -> Optional[faiss.Index]:
+    """
+    Crear (y entrenar si hace falta) un índice FAISS vacío.
+
+    Args:
+        index_type: "FlatL2", "IVFFlat", "IVFPQ" o "HNSW"
+        embedding_dim: Dimensión de los embeddings
+        vectors: Vectores de entrenamiento para índices IVF
+        metric: faiss.METRIC_L2 o faiss.METRIC_INNER_PRODUCT
+
+    Returns:
+        Índice listo para add(), o None si no hay datos suficientes para entrenarlo
+    """
+    if index_type == "FlatL2":
+        return flat_index(embedding_dim, metric)
+
+    if index_type == "HNSW":
+        return faiss.IndexHNSWFlat(embedding_dim, settings.FAISS_HNSW_M, metric)
+
+    if index_type in ("IVFFlat", "IVFPQ"):
+        n_train = 0 if vectors is None else vectors.shape[0]
+        nlist = min(settings.FAISS_NLIST, n_train // _MIN_POINTS_PER_CENTROID)
+        if index_type == "IVFPQ" and n_train < 256:
+            nlist = 0  # PQ de 8 bits necesita al menos 256 puntos
+        if nlist < 1:
+            return None
+
+        quantizer = flat_index(embedding_dim, metric)
+        if index_type == "IVFFlat":
+            index = faiss.IndexIVFFlat(quantizer, embedding_dim, nlist, metric)
+        else:
+            index = faiss.IndexIVFPQ(quantizer, embedding_dim, nlist, settings.FAISS_PQ_M, 8, metric)
+        index.train(vectors)
+        index.nprobe = settings.FAISS_NPROBE
+        index.make_direct_map()
+        return index
+
+    raise ValueError(f"Tipo de índice FAISS no soportado: {index_type}")
+
+
+class TieredIndex:
+    """
+    Índice principal (IVF/HNSW/Flat) más un índice delta plano.
+
+    Los vectores nuevos siempre van al delta, así que añadir documentos no
+    obliga a reentrenar ni reconstruir el índice principal. Las búsquedas
+    consultan ambos niveles y combinan resultados. Cuando el delta supera un
+    tamaño o una antigüedad se vuelca al principal (ver VectorStoreFAISS).
+
+    Las instancias no se modifican después de publicarse: with_vectors() y
+    merged() devuelven un índice nuevo (copy-on-write), de modo que las
+    búsquedas pueden ejecutarse sin bloqueo mientras otro hilo escribe.
+
+    Las posiciones son globales: el principal contiene [0, main.ntotal) y el
+    delta continúa a partir de ahí, igual que la lista de documentos.
+    """
+
+    def __init__(self, embedding_dim: int, index_type: str = None,
+                 main: Optional[faiss.Index] = None, delta: Optional[faiss.Index] = None,
+                 metric: Optional[int] = None, delta_since: Optional[float] = None, merges: int = 0):
+        """
+        Args:
+            embedding_dim: Dimensión de los embeddings
+            index_type: Tipo del índice principal (por defecto settings.FAISS_INDEX_TYPE)
+            main: Índice principal existente
+            delta: Índice delta existente
+            metric: Métrica FAISS (por defecto la del índice cargado o la de settings)
+            delta_since: Momento en que el delta recibió su primer vector
+            merges: Volcados realizados hasta ahora
+        """
+        self.embedding_dim = embedding_dim
+        self.index_type = index_type or settings.FAISS_INDEX_TYPE
+        if metric is None:
+            existing = main if main is not None else delta
+            metric = existing.metric_type if existing is not None else metric_from_settings()
+        self.metric = metric
+        self.main = main
+        if main is not None and faiss.try_extract_index_ivf(main) is not None:
+            faiss.extract_index_ivf(main).make_direct_map()
+        self.delta = delta if delta is not None else flat_index(embedding_dim, metric)
+        if delta_since is None and self.delta.ntotal:
+            delta_since = time.time()
+        self.delta_since = delta_since
+        self.merges = merges
+
+    @property
+    def ntotal(self) -> int:
+        return (self.main.ntotal if self.main is not None else 0) + self.delta.ntotal
+
+    @property
+    def main_size(self) -> int:
+        return self.main.ntotal if self.main is not None else 0
+
+    @property
+    def higher_is_better(self) -> bool:
+        return self.metric == faiss.METRIC_INNER_PRODUCT
+
+    def _derive(self, main: Optional[faiss.Index], delta: faiss.Index, delta_since: Optional[float],
+                merges: int) -> "TieredIndex":
+        return TieredIndex(self.embedding_dim, self.index_type, main=main, delta=delta,
+                           metric=self.metric, delta_since=delta_since, merges=merges)
+
+    def with_vectors(self, vectors: np.ndarray) -> "TieredIndex":
+        """
+        Nuevo índice con los vectores añadidos al delta.
+
+        Solo se copia el delta (pequeño); el índice principal se comparte.
+        """
+        delta = faiss.clone_index(self.delta)
+        delta.add(vectors)
+        return self._derive(self.main, delta, self.delta_since or time.time(), self.merges)
+
+    def _rank(self, distances: np.ndarray) -> np.ndarray:
+        """Orden de mejor a peor según la métrica"""
+        keys = -distances if self.higher_is_better else distances
+        return np.argsort(keys, kind='stable')
+
+    def search(self, query: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Buscar en ambos niveles y combinar.
+
+        Returns:
+            (distancias, posiciones) con forma (1, top_k), rellenas con -1 como FAISS
+        """
+        main_size = self.main_size
+        parts = []
+        if main_size:
+            parts.append(self.main.search(query, min(top_k, main_size)))
+        if self.delta.ntotal:
+            d, i = self.delta.search(query, min(top_k, self.delta.ntotal))
+            parts.append((d, np.where(i >= 0, i + main_size, -1)))
+
+        fill = -np.inf if self.higher_is_better else np.inf
+        distances = np.full((1, top_k), fill, dtype='float32')
+        indices = np.full((1, top_k), -1, dtype='int64')
+        if not parts:
+            return distances, indices
+
+        all_d = np.concatenate([d[0] for d, _ in parts])
+        all_i = np.concatenate([i[0] for _, i in parts])
+        valid = all_i >= 0
+        all_d, all_i = all_d[valid], all_i[valid]
+        order = self._rank(all_d)[:top_k]
+        distances[0, :len(order)] = all_d[order]
+        indices[0, :len(order)] = all_i[order]
+        return distances, indices
+
+    def range_search(self, query: np.ndarray, radius: float) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Todos los vecinos dentro del radio (L2: d < radius, IP: sim > radius).
+
+        Returns:
+            (distancias, posiciones) 1-D ordenadas de mejor a peor
+        """
+        main_size = self.main_size
+        parts = []
+        if main_size:
+            _, d, i = self.main.range_search(query, radius)
+            parts.append((d, i))
+        if self.delta.ntotal:
+            _, d, i = self.delta.range_search(query, radius)
+            parts.append((d, i + main_size))
+
+        if not parts:
+            return np.empty(0, dtype='float32'), np.empty(0, dtype='int64')
+
+        all_d = np.concatenate([d for d, _ in parts])
+        all_i = np.concatenate([i for _, i in parts])
+        order = self._rank(all_d)
+        return all_d[order], all_i[order]
+
+    def reconstruct(self, position: int) -> np.ndarray:
+        """Recuperar el vector almacenado en una posición global"""
+        main_size = self.main_size
+        if position < main_size:
+            return self.main.reconstruct(position)
+        return self.delta.reconstruct(position - main_size)
+
+    def reconstruct_batch(self, positions: np.ndarray) -> np.ndarray:
+        """Recuperar varios vectores por posición global"""
+        positions = np.asarray(positions, dtype='int64')
+        vectors = np.empty((len(positions), self.embedding_dim), dtype='float32')
+        in_main = positions < self.main_size
+        if in_main.any():
+            vectors[in_main] = self.main.reconstruct_batch(positions[in_main])
+        if not in_main.all():
+            vectors[~in_main] = self.delta.reconstruct_batch(positions[~in_main] - self.main_size)
+        return vectors
+
+    def delta_vectors(self, start: int = 0) -> np.ndarray:
+        """Vectores del delta a partir de una posición local"""
+        return self.delta.reconstruct_n(start, self.delta.ntotal - start)
+
+    def write(self, main_path: str, delta_path: str, write_main: bool = True):
+        """
+        Persistir ambos niveles en disco (cada archivo se reemplaza de forma atómica).
+
+        Args:
+            write_main: False si el principal ya está en disco (solo cambió el delta)
+        """
+        if self.main is not None and write_main:
+            with atomic_path(main_path) as tmp_path:
+                faiss.write_index(self.main, tmp_path)
+        if self.delta.ntotal:
+            with atomic_path(delta_path) as tmp_path:
+                faiss.write_index(self.delta, tmp_path)
+        elif os.path.exists(delta_path):
+            os.remove(delta_path)
+
+    def needs_merge(self) -> bool:
+        """El delta superó el tamaño o la antigüedad configurados"""
+        if self.delta.ntotal == 0:
+            return False
+        if self.delta.ntotal >= settings.DELTA_MAX_SIZE:
+            return True
+        return time.time() - self.delta_since >= settings.DELTA_MAX_AGE_SECONDS
+
+    def merged(self) -> Optional["TieredIndex"]:
+        """
+        Nuevo índice con el delta volcado al principal.
+
+        El principal se clona antes de añadir para no modificar el que
+        están usando las búsquedas en curso.
+
+        Mientras no hay vectores suficientes para entrenar un principal IVF
+        se usa uno exacto provisional, así que el delta siempre se vacía; en
+        cuanto hay datos el volcado lo sustituye por el IVF.
+
+        Returns:
+            El índice volcado, o None si no hay nada que volcar
+        """
+        if self.delta.ntotal == 0:
+            return None
+
+        vectors = self.delta_vectors()
+        if self.main is not None and not self._provisional_main():
+            main = faiss.clone_index(self.main)
+        else:
+            if self.main is not None:
+                vectors = np.vstack([self.main.reconstruct_n(0, self.main.ntotal), vectors])
+            main = build_index(self.index_type, self.embedding_dim, vectors, self.metric)
+            if main is None:
+                logger.debug(f"{len(vectors)} vectores no bastan para entrenar {self.index_type}: principal exacto")
+                main = flat_index(self.embedding_dim, self.metric)
+        main.add(vectors)
+
+        logger.info(f"Delta volcado al índice principal ({self.index_type}): {main.ntotal} vectores")
+        return self._derive(main, None, None, self.merges + 1)
+
+    def _provisional_main(self) -> bool:
+        """El principal es el exacto provisional de un tipo IVF aún sin entrenar"""
+        return (self.index_type in ("IVFFlat", "IVFPQ") and self.main is not None
+                and faiss.try_extract_index_ivf(self.main) is None)
+
+    def get_stats(self) -> Dict:
+        return {
+            "main_size": self.main_size,
+            "delta_size": self.delta.ntotal,
+            "merges": self.merges
+        }
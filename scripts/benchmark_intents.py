@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Benchmark del matching de intents: recorrido original frente al autómata compilado
+"""
+import os
+import sys
+import random
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rag.intent_matcher import IntentMatcher, scan_intents
+
+VOCABULARIO = (
+    "certificado constancia inscripción baja módulo asesor tutor plataforma correo contraseña "
+    "calificación examen extraordinario recursamiento pago beca credencial folio trámite "
+    "equivalencia revalidación historial académico calendario grupo facilitador foro tarea "
+    "entrega plazo fecha reporte incidencia acceso usuario cuenta bloqueada actualizar datos"
+).split()
+CONECTORES = ["cómo", "dónde", "cuándo", "necesito", "quiero", "tengo problema con", "ayuda con", "mi", "el", "la"]
+
+
+def synthetic_intents(num_intents: int, patterns_per_intent: int, seed: int = 0) -> dict:
+    """Intents sintéticos con patrones de 2 a 6 palabras"""
+    rng = random.Random(seed)
+    intents = []
+    for i in range(num_intents):
+        patterns = []
+        for _ in range(patterns_per_intent):
+            words = rng.sample(VOCABULARIO, rng.randint(1, 4))
+            patterns.append(" ".join([rng.choice(CONECTORES)] + words))
+        intents.append({
+            "tag": f"intent_{i}_{rng.choice(VOCABULARIO)}",
+            "patterns": patterns,
+            "responses": [f"Respuesta {i}"],
+            "context": ""
+        })
+    return {"intents": intents}
+
+
+def synthetic_queries(intents: dict, num_queries: int, seed: int = 1) -> list:
+    """Consultas con patrones completos, fragmentos, saludos y texto sin coincidencias"""
+    rng = random.Random(seed)
+    patterns = [p for intent in intents["intents"] for p in intent["patterns"]]
+    queries = []
+    for _ in range(num_queries):
+        pattern = rng.choice(patterns)
+        kind = rng.random()
+        if kind < 0.3:
+            queries.append(f"hola, {pattern} por favor")
+        elif kind < 0.6:
+            start = rng.randrange(len(pattern))
+            queries.append(pattern[start:start + rng.randint(3, 15)])
+        elif kind < 0.8:
+            queries.append(" ".join(rng.sample(VOCABULARIO, 6)))
+        else:
+            queries.append("no encuentro información sobre mi situación")
+    return queries
+
+
+def main():
+    """Función principal"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Benchmark del matching de intents')
+    parser.add_argument('--intents', type=int, default=1000, help='Número de intents')
+    parser.add_argument('--patterns', type=int, default=12, help='Patrones por intent')
+    parser.add_argument('--queries', type=int, default=200, help='Consultas a medir')
+    parser.add_argument('--top-k', type=int, default=3, help='Resultados por consulta')
+    args = parser.parse_args()
+
+    intents = synthetic_intents(args.intents, args.patterns)
+    queries = synthetic_queries(intents, args.queries)
+    total_patterns = args.intents * args.patterns
+
+    print("=" * 60)
+    print(f"⚙️  BENCHMARK DE INTENTS: {args.intents} intents, {total_patterns} patrones, {len(queries)} consultas")
+    print("=" * 60)
+
+    start = time.perf_counter()
+    matcher = IntentMatcher(intents)
+    compile_s = time.perf_counter() - start
+    print(f"Compilación del autómata: {compile_s:.2f} s")
+
+    start = time.perf_counter()
+    expected = [scan_intents(intents, q, args.top_k) for q in queries]
+    scan_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+    start = time.perf_counter()
+    actual = [matcher.match(q, args.top_k) for q in queries]
+    match_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+    mismatches = sum(1 for e, a in zip(expected, actual) if e != a)
+    print(f"Recorrido original: {scan_ms:.3f} ms/consulta")
+    print(f"Autómata compilado: {match_ms:.3f} ms/consulta ({scan_ms / match_ms:.1f}x)")
+    print(f"Resultados distintos: {mismatches}")
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
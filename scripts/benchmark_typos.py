@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Tasa de consultas que pasan al camino RAG con y sin corrección de errores de tecleo
+"""
+import os
+import sys
+import random
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rag.core import RAGSystem
+
+# Errores habituales al escribir rápido en el celular
+SUSTITUCIONES = [("c", "s"), ("s", "c"), ("z", "s"), ("ll", "y"), ("v", "b"), ("b", "v"), ("qu", "k")]
+SIN_ACENTO = str.maketrans("áéíóú", "aeiou")
+
+
+def add_typo(text: str, rng: random.Random) -> str:
+    """Un error de tecleo en una palabra de 3 letras o más"""
+    words = text.split()
+    candidates = [i for i, w in enumerate(words) if len(w) >= 3 and w.isalpha()]
+    if not candidates:
+        return text
+    i = rng.choice(candidates)
+    word = words[i]
+    kind = rng.randrange(5)
+    if kind == 0 and word.lower().startswith("h"):
+        word = word[1:]
+    elif kind == 1:
+        options = [(a, b) for a, b in SUSTITUCIONES if a in word]
+        if options:
+            a, b = rng.choice(options)
+            word = word.replace(a, b, 1)
+    elif kind == 2:
+        word = word + word[-1]
+    elif kind == 3:
+        j = rng.randrange(len(word) - 1)
+        word = word[:j] + word[j + 1] + word[j] + word[j + 2:]
+    words[i] = word.translate(SIN_ACENTO)
+    return " ".join(words)
+
+
+def main():
+    """Función principal"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Benchmark de la corrección de errores de tecleo en intents')
+    parser.add_argument('--intents', type=str, default='data/intents.json', help='Archivo de intents')
+    parser.add_argument('--variants', type=int, default=3, help='Variantes con errores por patrón')
+    parser.add_argument('--seed', type=int, default=0, help='Semilla de los errores')
+    args = parser.parse_args()
+
+    rag = RAGSystem()
+    rag.load_intents(args.intents)
+    rng = random.Random(args.seed)
+    patterns = [p for intent in rag.vector_store.intents.get("intents", []) for p in intent.get("patterns", [])]
+    queries = [add_typo(p, rng) for p in patterns for _ in range(args.variants)]
+
+    print("=" * 60)
+    print(f"⚙️  CORRECCIÓN DE TECLEO: {len(patterns)} patrones, {len(queries)} consultas con errores")
+    print("=" * 60)
+
+    start = time.perf_counter()
+    for query in queries:
+        rag.vector_store.correct_spelling(query)
+    correct_us = (time.perf_counter() - start) * 1e6 / len(queries)
+
+    for query in queries:
+        rag._match_intent(rag.analyze_query(query))
+
+    stats = rag.intent_routing_stats()
+    print(f"Corrección: {correct_us:.1f} µs/consulta")
+    print(f"Pasan a RAG sin corrección: {stats['fall_through_rate_without_correction']:.1%}")
+    print(f"Pasan a RAG con corrección: {stats['fall_through_rate']:.1%}")
+    print(f"Consultas rescatadas: {stats['typo_rescued']}")
+
+
+if __name__ == "__main__":
+    main()
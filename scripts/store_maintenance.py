@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Mantenimiento del almacén vectorial: verificar consistencia, reconstruir índices
+y exportar/importar paquetes portables
+"""
+import os
+import sys
+import json
+import logging
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config.settings import settings
+from rag.retriever import VectorStoreFAISS
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+def verify(store: VectorStoreFAISS, sample_size: int) -> bool:
+    """Mostrar el informe de consistencia; True si no hay problemas"""
+    report = store.verify(sample_size=sample_size)
+    print("=" * 60)
+    print("🔎 VERIFICACIÓN DEL ALMACÉN VECTORIAL")
+    print("=" * 60)
+    print(json.dumps(report["counts"], indent=2))
+    if report["ok"]:
+        print("\n✅ Índice, documentos, metadatos y matriz de embeddings son consistentes")
+    else:
+        print("\n❌ Problemas encontrados:")
+        for problem in report["problems"]:
+            print(f"   • {problem}")
+    return report["ok"]
+
+
+def main():
+    """Función principal"""
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description='Mantenimiento del almacén vectorial FAISS',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Ejemplos de uso:
+  %(prog)s verify
+  %(prog)s rebuild --index-type HNSW
+  %(prog)s rebuild --dir data/vector_store
+  %(prog)s export --bundle /tmp/kb_bundle
+  %(prog)s import --bundle /tmp/kb_bundle --dir data/vector_store
+        """
+    )
+    parser.add_argument('command', choices=['verify', 'rebuild', 'export', 'import'], help='Acción a realizar')
+    parser.add_argument('--dir', type=str, default=settings.FAISS_PERSIST_DIR,
+                        help='Directorio del almacén vectorial')
+    parser.add_argument('--index-type', type=str, default=None,
+                        choices=['FlatL2', 'IVFFlat', 'IVFPQ', 'HNSW'],
+                        help='Tipo del índice reconstruido (por defecto el actual)')
+    parser.add_argument('--sample', type=int, default=256,
+                        help='Vectores comparados entre índice y matriz al verificar')
+    parser.add_argument('--bundle', type=str, default=None,
+                        help='Directorio del paquete portable (export/import)')
+    parser.add_argument('--batch-size', type=int, default=1000,
+                        help='Documentos por lote al exportar/importar')
+    args = parser.parse_args()
+    if args.command in ('export', 'import') and not args.bundle:
+        parser.error(f"{args.command} requiere --bundle")
+
+    store = VectorStoreFAISS(persist_directory=args.dir)
+    try:
+        if args.command == 'verify':
+            ok = verify(store, args.sample)
+        elif args.command == 'rebuild':
+            store.rebuild_index(args.index_type)
+            ok = verify(store, args.sample)
+        elif args.command == 'export':
+            manifest = store.export_bundle(args.bundle, args.batch_size)
+            print(f"📦 Paquete exportado en {args.bundle}: {manifest['documents']} documentos")
+            ok = True
+        else:
+            added = store.import_bundle(args.bundle, args.batch_size, args.index_type)
+            print(f"📥 Importados {added} documentos desde {args.bundle}")
+            ok = verify(store, args.sample)
+    finally:
+        store.close()
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,8 +2,14 @@ import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+import asyncio
+import threading
+import time
+
+import pytest
 from fastapi.testclient import TestClient
 from api.main import app
+from rag.executors import BoundedExecutor, ExecutorBusy
 import json
 
 client = TestClient(app)
@@ -57,9 +63,51 @@ def test_feedback_endpoint():
     
     print("✓ Feedback endpoint test passed")
 
+def test_bounded_executor_keeps_event_loop_free():
+    """Test pool acotado: el event loop sigue libre y las tareas de más se rechazan"""
+    executor = BoundedExecutor("test", max_workers=1, max_queue=1)
+    release = threading.Event()
+
+    async def scenario():
+        slow = [asyncio.ensure_future(executor.run(release.wait, 5)) for _ in range(2)]
+        await asyncio.sleep(0.05)
+        # Un hilo ocupado y uno en cola: la tercera se rechaza sin esperar
+        with pytest.raises(ExecutorBusy):
+            await executor.run(time.sleep, 0)
+        # El event loop atiende otras corrutinas mientras el pool trabaja
+        ticks = 0
+        for _ in range(5):
+            await asyncio.sleep(0.01)
+            ticks += 1
+        release.set()
+        return ticks, await asyncio.gather(*slow)
+
+    ticks, results = asyncio.run(scenario())
+    assert ticks == 5 and results == [True, True]
+    stats = executor.get_stats()
+    assert stats["completed"] == 2 and stats["rejected"] == 1 and stats["in_flight"] == 0
+    assert asyncio.run(executor.run(sum, [1, 2, 3])) == 6
+    executor.shutdown()
+    print("✓ Bounded executor test passed")
+
+def test_intents_reload_reports_busy_executor(monkeypatch):
+    """Test la recarga de intents espera al pool y devuelve 503 si está lleno"""
+    from api import main
+    monkeypatch.setattr(main.settings, "ADMIN_API_KEY", "clave")
+
+    async def busy(*args):
+        raise ExecutorBusy("Pool 'ingest' lleno")
+
+    monkeypatch.setattr(main.rag_system.ingest_executor, "run", busy)
+    response = client.post("/admin/intents/reload", headers={"X-Admin-Key": "clave"})
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+    print("✓ Intents reload busy test passed")
+
 if __name__ == "__main__":
     test_root_endpoint()
     test_health_endpoint()
     test_chat_endpoint()
     test_feedback_endpoint()
+    test_bounded_executor_keeps_event_loop_free()
     print("\n✅ Todos los tests de API pasaron correctamente!")
\ No newline at end of file
@@ -2,9 +2,20 @@ import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from rag.core import RAGSystem
+import json
+import time
+
+import numpy as np
 import pytest
 
+from config.settings import settings
+from rag.core import RAGSystem
+from rag.query_analysis import QueryAnalysis
+from rag.response_cache import ResponseCache, SemanticResponseCache
+from rag.retriever import VectorStoreFAISS
+from tests.test_retriever import DIM, _random_embeddings, _ticket_documents
+
+
 def test_rag_initialization():
     """Test inicialización del sistema RAG"""
     rag = RAGSystem()
@@ -63,9 +74,146 @@ def test_fallback_response():
     assert "No encontré" in response or "fuera del alcance" in response
     print("✓ Fallback response test passed")
 
+def test_response_cache_versioning(tmp_path):
+    """Test caché de respuestas: LRU, caducidad e invalidación al cambiar documentos o intents"""
+    cache = ResponseCache(max_size=2, ttl_seconds=0.2)
+    cache.put("hola", 1, "a")
+    cache.put("baja", 1, "b")
+    assert cache.get("hola", 1) == "a"
+    cache.put("pago", 1, "c")  # Expulsa "baja", la usada hace más tiempo
+    assert cache.get("baja", 1) is None and cache.get("hola", 1) == "a"
+    assert cache.get("hola", 2) is None and len(cache) == 1  # Otra versión: se descarta
+    time.sleep(0.25)
+    assert cache.get("pago", 1) is None
+    assert cache.get_stats()["hits"] == 2 and cache.get_stats()["invalidated"] == 2
+
+    intents_file = tmp_path / "intents.json"
+    intents_file.write_text(json.dumps({"intents": [
+        {"tag": "saludo", "patterns": ["hola"], "responses": ["¡Hola!"]}
+    ]}), encoding="utf-8")
+    store = VectorStoreFAISS(persist_directory=str(tmp_path / "store"))
+    store.store_intents(str(intents_file))
+    version = store.data_version()
+    assert store.data_version() == version
+
+    store.add_documents(_ticket_documents(3), _random_embeddings(3))
+    assert store.data_version() != version
+    version = store.data_version()
+    store.add_intent_pattern("saludo", "buenas tardes")
+    assert store.data_version() != version
+    version = store.data_version()
+
+    # Otro proceso que escribe en el mismo directorio también cambia la versión
+    writer = VectorStoreFAISS(persist_directory=str(tmp_path / "store"))
+    writer.delete_documents([writer.metadata.get(0, "doc_id")])
+    store._last_refresh_check = 0
+    assert store.data_version() != version
+    store.close()
+    writer.close()
+    print("✓ Response cache versioning test passed")
+
+def test_semantic_response_cache():
+    """Test caché semántica: radio de similitud, expulsión LRU, versión y falsos aciertos"""
+    vectors = _random_embeddings(4, seed=31)
+    cache = SemanticResponseCache(DIM, min_similarity=0.9, max_size=2)
+    cache.put(vectors[0], 1, "correo")
+    cache.put(vectors[1], 1, "baja")
+
+    # Una pregunta cercana (no idéntica) reutiliza la respuesta; una lejana no
+    near = vectors[0] + 0.1 * vectors[2]
+    assert cache.get(near / np.linalg.norm(near), 1) == "correo"
+    assert cache.get(vectors[3], 1) is None
+
+    cache.put(vectors[2], 1, "pago")  # Expulsa "baja", la usada hace más tiempo
+    assert cache.get(vectors[1], 1) is None and cache.get(vectors[2], 1) == "pago"
+    assert cache.get(vectors[0], 2) is None and len(cache) == 0  # Otra versión: se vacía
+
+    cache.record_audit(False)
+    cache.record_audit(True)
+    stats = cache.get_stats()
+    assert stats["hits"] == 2 and stats["misses"] == 3
+    assert stats["audited"] == 2 and stats["false_hit_rate"] == 0.5
+    print("✓ Semantic response cache test passed")
+
+def test_semantic_cache_skips_expired_neighbours(monkeypatch):
+    """Test caché semántica: una pregunta caducada no tapa a otra vigente y se expulsa al buscar"""
+    vectors = _random_embeddings(3, seed=32)
+    clock = [100.0]
+    monkeypatch.setattr(time, "monotonic", lambda: clock[0])
+    cache = SemanticResponseCache(DIM, min_similarity=0.9, max_size=10, ttl_seconds=10)
+
+    near = vectors[0] + 0.1 * vectors[1]
+    cache.put(vectors[0], 1, "antigua")
+    clock[0] += 8
+    cache.put(near / np.linalg.norm(near), 1, "reciente")
+    cache.put(vectors[2], 1, "otra")
+    clock[0] += 5  # Caduca solo la primera, la más parecida a la consulta
+
+    assert cache.get(vectors[0], 1) == "reciente"
+    assert len(cache) == 2 and cache._index.ntotal == 2
+    print("✓ Semantic cache expired neighbours test passed")
+
+def test_query_analysis_shared_across_stages():
+    """Test análisis de la consulta: normalización, prioridad y embedding calculado una sola vez"""
+    calls = []
+
+    def embed(text):
+        calls.append(text)
+        return _random_embeddings(1, seed=len(calls))[0]
+
+    analysis = QueryAnalysis("  ¡Hola! ¿Cómo cambio mi CORREO?  ", embed=embed)
+    assert analysis.text == "¡Hola! ¿Cómo cambio mi CORREO?"
+    assert analysis.clean == "hola ¿cómo cambio mi correo?"
+    assert analysis.tokens == ("hola", "como", "cambio", "mi", "correo")
+    assert "25-450805" in QueryAnalysis("¿Qué pasó con el folio 25-450805?").key_candidates
+    assert analysis.keyword_hits == ("saludo",) and analysis.priority == "saludo"
+    assert QueryAnalysis("¿Dónde descargo mi constancia?").priority == "neutral"
+    assert QueryAnalysis("dónde descargo mi constancia").priority == "rag_preferido"
+    assert QueryAnalysis("necesito soporte, gracias").priority == "gracias"
+
+    # El embedding se calcula bajo demanda y lo comparten las etapas y la consulta corregida
+    assert calls == []
+    corrected = analysis.with_text("hola cómo cambio mi correo")
+    assert corrected.embedding is analysis.embedding
+    assert calls == ["¡Hola! ¿Cómo cambio mi CORREO?"]
+    assert analysis.with_text(" ¡Hola! ¿Cómo cambio mi CORREO? ") is analysis
+    print("✓ Query analysis test passed")
+
+def test_typo_correction_never_promotes_to_greeting(monkeypatch):
+    """Test corrección de tecleo: no convierte palabras normales en saludos y solo rescata coincidencias de patrón"""
+    monkeypatch.setattr(settings, "INTENT_SEMANTIC_ENABLED", False)
+    rag = RAGSystem()
+    rag.load_intents("data/intents.json")
+
+    for query in ["la plataforma me deja sola", "se me cayo la bola", "hay mucha cola en el registro",
+                  "tengo una gracia"]:
+        analysis = rag.analyze_query(query)
+        _, use_intent = rag._match_intent(analysis)
+        assert not use_intent, query
+        assert analysis.priority == "neutral"
+    assert rag.intent_stats["typo_rescued"] == 0
+
+    intent_results, use_intent = rag._match_intent(rag.analyze_query("no puedo aceder a mi aula"))
+    assert use_intent and intent_results['metadatas'][0][0]['tag'] == "problemas_ingreso_plataforma"
+    assert rag.intent_stats["typo_rescued"] == 1
+    print("✓ Typo correction guard test passed")
+
+def test_semantic_intents_only_after_lexical_miss():
+    """Test un saludo o un patrón literal se responden sin calcular el embedding de la consulta"""
+    rag = RAGSystem()
+    rag.load_intents("data/intents.json")
+
+    for query in ["hola", "muchas gracias"]:
+        analysis = rag.analyze_query(query)
+        _, use_intent = rag._match_intent(analysis)
+        assert use_intent and analysis._embedding is None, query
+    print("✓ Lexical intents without embedding test passed")
+
 if __name__ == "__main__":
     test_rag_initialization()
     test_intent_matching()
     test_rag_response()
     test_fallback_response()
+    test_semantic_response_cache()
+    test_query_analysis_shared_across_stages()
     print("\n✅ Todos los tests pasaron correctamente!")
\ No newline at end of file
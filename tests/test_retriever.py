@@ -0,0 +1,1011 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import gzip
+import json
+import threading
+import time
+
+import faiss
+import numpy as np
+import pytest
+
+from config.settings import settings
+
+from rag.bundle import file_checksum
+from rag.chunking import TokenChunker
+from rag.document_store import CompressedTextStore
+from rag.intent_matcher import scan_intents
+from rag.metadata_store import ColumnarMetadata
+from rag.object_store import LocalDirectoryObjectStore
+from rag.retriever import VectorStoreFAISS
+from rag.tiered_index import TieredIndex
+
+DIM = 384
+
+
+def _random_embeddings(n: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((n, DIM)).astype('float32')
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def _ticket_documents(n: int):
+    categorias = ["Soporte Técnico", "Control Escolar", "Mesa de Servicio"]
+    return [
+        {
+            "content": f"ASUNTO: Ticket {i}\nDESCRIPCIÓN DEL PROBLEMA:\nProblema número {i}",
+            "metadata": {"title": f"Ticket {i}", "categoria": categorias[i % len(categorias)]}
+        }
+        for i in range(n)
+    ]
+
+
+def test_sharded_search(tmp_path):
+    """Test búsqueda dirigida a un shard y búsqueda en todos los shards"""
+    store = VectorStoreFAISS(persist_directory=str(tmp_path), shard_key="categoria")
+    embeddings = _random_embeddings(30)
+    store.add_documents(_ticket_documents(30), embeddings)
+
+    # Sin shard: mismo resultado que el índice global
+    results = store.search_documents(embeddings[4].copy(), top_k=3)
+    assert results['metadatas'][0][0]['title'] == "Ticket 4"
+
+    # Con shard: solo documentos de esa categoría
+    results = store.search_documents(embeddings[4].copy(), top_k=5, shard="Control Escolar")
+    assert all(m['categoria'] == "Control Escolar" for m in results['metadatas'][0])
+
+    stats = store.get_stats()["sharding"]
+    assert stats["num_shards"] == 3
+    assert sum(s["size"] for s in stats["shards"].values()) == 30
+
+    # Los contadores de latencia no pierden búsquedas hechas desde varios hilos
+    before = stats["shards"]["Control Escolar"]["searches"]
+    threads = [
+        threading.Thread(target=lambda: [store.search_documents(embeddings[4].copy(), top_k=2, shard="Control Escolar")
+                                         for _ in range(25)])
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert store.get_stats()["sharding"]["shards"]["Control Escolar"]["searches"] == before + 200
+
+    # Los shards se reconstruyen al recargar desde disco
+    reloaded = VectorStoreFAISS(persist_directory=str(tmp_path), shard_key="categoria")
+    assert reloaded.get_stats()["sharding"]["shards"]["Soporte Técnico"]["size"] == 10
+
+    # Las recargas por escrituras de otro proceso reutilizan el pool de hilos de los shards
+    executor = store.shards._executor
+    reloaded.add_documents(_ticket_documents(1), _random_embeddings(1, seed=40))
+    assert store.refresh(force=True)
+    assert store.shards._executor is executor and store.get_stats()["index_size"] == 31
+
+    # La búsqueda híbrida dirigida a un shard tampoco trae aciertos léxicos de otros
+    results = store.search_hybrid("3, 6, 9 y 12", embeddings[4].copy(), top_k=5, shard="Control Escolar")
+    assert len(results['metadatas'][0]) == 5
+    assert all(m['categoria'] == "Control Escolar" for m in results['metadatas'][0])
+    store.close()
+    reloaded.close()
+    print("✓ Sharded search test passed")
+
+
+def test_centroid_query_routing(tmp_path):
+    """Test consultas dirigidas al shard de su centroide y búsqueda global si es dudosa"""
+    store = VectorStoreFAISS(persist_directory=str(tmp_path), shard_key="categoria")
+    rng = np.random.default_rng(12)
+    centers = _random_embeddings(3, seed=12)
+    embeddings = np.repeat(centers, 20, axis=0) + 0.05 * rng.standard_normal((60, DIM)).astype('float32')
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    documents = _ticket_documents(60)
+    categorias = ["Soporte Técnico", "Control Escolar", "Mesa de Servicio"]
+    for i, doc in enumerate(documents):
+        doc["metadata"]["categoria"] = categorias[i // 20]
+    store.add_documents(documents, embeddings)
+
+    assert store.route_query(centers[1].copy()) == "Control Escolar"
+    results = store.search_documents(embeddings[25].copy(), top_k=5, shard=store.route_query(embeddings[25].copy()))
+    assert results['metadatas'][0][0]['title'] == "Ticket 25"
+    assert all(m['categoria'] == "Control Escolar" for m in results['metadatas'][0])
+
+    # A medio camino entre dos categorías no hay confianza: búsqueda global
+    assert store.route_query((centers[0] + centers[2]) / 2) is None
+    stats = store.get_stats()["routing"]
+    assert stats["routed"] == 2 and stats["global"] == 1
+    assert stats["categories"] == {c: 20 for c in categorias}
+
+    # Los centroides siguen a los borrados y se reconstruyen al recargar
+    store.delete_documents([store.metadata.get(i, "doc_id") for i in range(40, 45)])
+    assert store.get_stats()["routing"]["categories"]["Mesa de Servicio"] == 15
+    reloaded = VectorStoreFAISS(persist_directory=str(tmp_path), shard_key="categoria")
+    assert reloaded.get_stats()["routing"]["categories"]["Mesa de Servicio"] == 15
+    assert reloaded.route_query(centers[2].copy()) == "Mesa de Servicio"
+    store.close()
+    reloaded.close()
+    print("✓ Centroid query routing test passed")
+
+
+def test_delta_index_merge():
+    """Test delta plano + índice IVF principal sin reentrenar al añadir"""
+    index = TieredIndex(DIM, index_type="IVFFlat")
+    embeddings = _random_embeddings(2005, seed=1)
+
+    index = index.with_vectors(embeddings[:2000]).merged()
+    assert index.main_size == 2000 and index.get_stats()["delta_size"] == 0
+
+    # Los nuevos vectores quedan en el delta y son visibles de inmediato
+    updated = index.with_vectors(embeddings[2000:])
+    assert updated.main_size == 2000 and updated.ntotal == 2005
+    _, positions = updated.search(embeddings[2003:2004], 1)
+    assert positions[0][0] == 2003
+    assert index.ntotal == 2000  # La versión anterior no cambia
+
+    merged = updated.merged()
+    _, positions = merged.search(embeddings[2003:2004], 1)
+    assert positions[0][0] == 2003 and merged.main_size == 2005
+    assert updated.main_size == 2000
+    print("✓ Delta index merge test passed")
+
+
+def test_small_ivf_corpus_drains_delta(monkeypatch):
+    """Test con pocos vectores para entrenar el IVF el delta se vuelca igual a un principal exacto"""
+    monkeypatch.setattr(settings, "FAISS_NLIST", 2)
+    embeddings = _random_embeddings(100, seed=3)
+    index = TieredIndex(DIM, index_type="IVFFlat").with_vectors(embeddings[:10])
+
+    merged = index.merged()
+    assert merged is not None and merged.main_size == 10 and merged.get_stats()["delta_size"] == 0
+    _, positions = merged.search(embeddings[7:8], 1)
+    assert positions[0][0] == 7
+
+    # Con datos suficientes el volcado sustituye el principal provisional por el IVF
+    merged = merged.with_vectors(embeddings[10:]).merged()
+    assert merged.main_size == 100 and faiss.try_extract_index_ivf(merged.main) is not None
+    _, positions = merged.search(embeddings[42:43], 1)
+    assert positions[0][0] == 42
+    print("✓ Small IVF corpus merge test passed")
+
+
+def test_concurrent_search_during_ingest(tmp_path, monkeypatch):
+    """Test búsquedas en paralelo mientras se añaden documentos y se vuelca el delta"""
+    monkeypatch.setattr(settings, "DELTA_MAX_SIZE", 40)
+    store = VectorStoreFAISS(persist_directory=str(tmp_path), shard_key="categoria")
+    embeddings = _random_embeddings(300, seed=3)
+    documents = _ticket_documents(300)
+    store.add_documents(documents[:60], embeddings[:60])
+
+    errors = []
+    done = threading.Event()
+
+    def reader(seed):
+        rng = np.random.default_rng(seed)
+        while not done.is_set():
+            try:
+                snapshot = store.snapshot()
+                i = int(rng.integers(snapshot.size))
+                results = store.search_documents(embeddings[i].copy(), top_k=3)
+                # Cada resultado corresponde a un documento completo de la instantánea
+                for text, meta in zip(results['documents'][0], results['metadatas'][0]):
+                    assert text.startswith(f"ASUNTO: {meta['title']}\n")
+            except Exception as e:
+                errors.append(e)
+
+    readers = [threading.Thread(target=reader, args=(seed,)) for seed in range(4)]
+    for thread in readers:
+        thread.start()
+    for start in range(60, 300, 20):
+        store.add_documents(documents[start:start + 20], embeddings[start:start + 20])
+        store.merge_delta()
+    done.set()
+    for thread in readers:
+        thread.join()
+    store.close()
+
+    assert not errors, errors[0]
+    assert store.index.ntotal == 300 and store.index.main_size > 0
+    results = store.search_documents(embeddings[250].copy(), top_k=1)
+    assert results['metadatas'][0][0]['title'] == "Ticket 250"
+    print("✓ Concurrent search during ingest test passed")
+
+
+def test_cross_instance_writes_are_lossless(tmp_path):
+    """Test dos escritores sobre el mismo directorio: nadie pierde documentos"""
+    embeddings = _random_embeddings(80, seed=4)
+    documents = _ticket_documents(80)
+    writers = [VectorStoreFAISS(persist_directory=str(tmp_path)) for _ in range(2)]
+
+    def ingest(store, offset):
+        for start in range(offset, 80, 20):
+            store.add_documents(documents[start:start + 10], embeddings[start:start + 10])
+
+    threads = [threading.Thread(target=ingest, args=(store, offset))
+               for store, offset in zip(writers, (0, 10))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    reader = VectorStoreFAISS(persist_directory=str(tmp_path))
+    titles = sorted(reader.metadata.get(i, "title") for i in range(len(reader.documents)))
+    assert titles == sorted(d["metadata"]["title"] for d in documents)
+    assert reader.index.ntotal == 80
+
+    # Un lector abierto antes detecta la generación nueva y recarga
+    writers[0].add_document("ASUNTO: Ticket extra", {"title": "Ticket extra"}, embeddings[0])
+    assert reader.refresh(force=True)
+    assert len(reader.documents) == 81 and reader.generation == writers[0].generation
+    assert not any(name.endswith(".tmp-%d" % os.getpid()) for name in os.listdir(tmp_path))
+    for store in writers + [reader]:
+        store.close()
+    print("✓ Cross-instance writes test passed")
+
+
+def test_snapshot_publish_and_lazy_pull(tmp_path, monkeypatch):
+    """Test publicar un snapshot y servir desde otro nodo antes de tener todos los textos"""
+    monkeypatch.setattr(settings, "SNAPSHOT_SIGNING_KEY", "clave-de-prueba")
+    bucket = LocalDirectoryObjectStore(str(tmp_path / "bucket"))
+    embeddings = _random_embeddings(600, seed=5)
+    source = VectorStoreFAISS(persist_directory=str(tmp_path / "origen"))
+    source.add_documents(_ticket_documents(600), embeddings)
+    manifest = source.publish_snapshot(bucket)
+    assert manifest["documents"] == 600 and len(manifest["segments"]) == 3
+
+    node = VectorStoreFAISS(persist_directory=str(tmp_path / "nodo"))
+    assert node.pull_snapshot(bucket, prefetch=False)
+    assert node.index.ntotal == 600
+    assert node.get_stats()["document_memory"]["remote_pending"] == 600
+
+    # Solo se descarga el segmento del documento leído
+    results = node.search_documents(embeddings[300].copy(), top_k=1)
+    assert results['documents'][0][0] == source.documents[300]
+    assert node.documents.pending_segments() == [0, 2]
+
+    # El snapshot ya descargado no se repite y la siguiente publicación
+    # solo sube los segmentos que cambiaron
+    assert not node.pull_snapshot(bucket, prefetch=False)
+    source.add_document("ASUNTO: Ticket nuevo", {"title": "Ticket nuevo"}, embeddings[0])
+    segment_count = len(bucket.list("vector_store/segments/"))
+    source.publish_snapshot(bucket)
+    assert len(bucket.list("vector_store/segments/")) == segment_count + 1
+
+    # Al reabrir el nodo los segmentos pendientes siguen siendo remotos
+    reopened = VectorStoreFAISS(persist_directory=str(tmp_path / "nodo"))
+    assert reopened.documents[599] == source.documents[599]
+    for store in (source, node, reopened):
+        store.close()
+    print("✓ Snapshot publish and lazy pull test passed")
+
+
+def test_snapshot_signature_and_generation_claim(tmp_path, monkeypatch):
+    """Test solo se cargan snapshots firmados e íntegros y dos publicadores no se pisan"""
+    monkeypatch.setattr(settings, "SNAPSHOT_SIGNING_KEY", "clave-de-prueba")
+    bucket = LocalDirectoryObjectStore(str(tmp_path / "bucket"))
+    source = VectorStoreFAISS(persist_directory=str(tmp_path / "origen"))
+    source.add_documents(_ticket_documents(10), _random_embeddings(10, seed=6))
+    manifest = source.publish_snapshot(bucket)
+
+    # Un latest.json atrasado (otro publicador más lento) no hace reutilizar la generación
+    bucket.put("vector_store/latest.json", json.dumps({"generation": 0}).encode("utf-8"))
+    assert source.publish_snapshot(bucket)["generation"] == manifest["generation"] + 1
+    assert not bucket.put_if_absent("vector_store/generations/00000001/manifest.json", b"{}")
+    assert json.loads(bucket.get("vector_store/generations/00000001/manifest.json")) == manifest
+
+    # Un archivo manipulado o una clave distinta impiden cargar el snapshot
+    node = VectorStoreFAISS(persist_directory=str(tmp_path / "nodo"))
+    bucket.put(manifest["files"]["metadata.pkl"], b"manipulado")
+    monkeypatch.setattr(settings, "SNAPSHOT_SIGNING_KEY", "otra-clave")
+    with pytest.raises(ValueError):
+        node.pull_snapshot(bucket, prefetch=False)
+    monkeypatch.setattr(settings, "SNAPSHOT_SIGNING_KEY", None)
+    with pytest.raises(ValueError):
+        node.pull_snapshot(bucket, prefetch=False)
+    assert len(node.documents) == 0 and not os.path.exists(tmp_path / "nodo" / "metadata.pkl")
+
+    # Con la clave correcta falla el checksum: las dos generaciones comparten el archivo (se guarda por hash)
+    monkeypatch.setattr(settings, "SNAPSHOT_SIGNING_KEY", "clave-de-prueba")
+    with pytest.raises(ValueError):
+        node.pull_snapshot(bucket, prefetch=False)
+    source.close()
+    node.close()
+    print("✓ Snapshot signature and generation claim test passed")
+
+
+def test_exact_key_lookup(tmp_path):
+    """Test folio y código de respuesta encontrados sin búsqueda vectorial"""
+    store = VectorStoreFAISS(persist_directory=str(tmp_path))
+    documents = _ticket_documents(6)
+    documents[2]["metadata"]["folio"] = "25-450805"
+    documents[4]["metadata"]["codigo_respuesta"] = "r012"
+    store.add_documents(documents, _random_embeddings(6, seed=6))
+
+    results = store.lookup_exact("hola, mi folio 25-450805 sigue sin respuesta")
+    assert [m['title'] for m in results['metadatas'][0]] == ["Ticket 2"]
+    assert results['keys'] == [{"field": "folio", "value": "25-450805"}]
+
+    assert store.lookup_exact("aplica la respuesta R012.")['metadatas'][0][0]['title'] == "Ticket 4"
+    assert store.lookup_exact("folio 25-999999")['documents'][0] == []
+
+    # El índice se reconstruye desde los metadatos al recargar
+    reloaded = VectorStoreFAISS(persist_directory=str(tmp_path))
+    assert reloaded.lookup_exact("25-450805")['metadatas'][0][0]['title'] == "Ticket 2"
+    store.close()
+    reloaded.close()
+    print("✓ Exact key lookup test passed")
+
+
+def test_keyword_index_and_delete(tmp_path):
+    """Test palabras clave normalizadas sin acentos, mantenidas al añadir y borrar"""
+    store = VectorStoreFAISS(persist_directory=str(tmp_path))
+    documents = _ticket_documents(4)
+    documents[1]["metadata"].update({"palabras_clave": "Correo Institucional, contraseña", "codigo_respuesta": "R007"})
+    documents[3]["metadata"]["palabras_clave"] = ["contraseña", "plataforma"]
+    store.add_documents(documents, _random_embeddings(4, seed=7))
+
+    results = store.search_keywords("Olvidé mi CONTRASENA del correo institucional")
+    assert [m['title'] for m in results['metadatas'][0]] == ["Ticket 1", "Ticket 3"]
+    assert results['keywords'][0][0] == ["contrasena", "correo institucional"]
+    assert store.search_keywords("respuesta r007")['metadatas'][0][0]['title'] == "Ticket 1"
+
+    # Borrar quita el documento de las palabras clave y de la búsqueda vectorial
+    doc_id = results['metadatas'][0][0]['doc_id']
+    assert store.delete_documents([doc_id]) == 1
+    assert [m['title'] for m in store.search_keywords("contraseña")['metadatas'][0]] == ["Ticket 3"]
+    query = _random_embeddings(4, seed=7)[1]
+    titles = [m['title'] for m in store.search_documents(query, top_k=3)['metadatas'][0]]
+    assert "Ticket 1" not in titles and len(titles) == 3
+
+    # Los borrados se conservan al recargar
+    reloaded = VectorStoreFAISS(persist_directory=str(tmp_path))
+    assert reloaded.search_keywords("correo institucional")['documents'][0] == []
+    assert reloaded.get_stats()["total_documents"] == 3
+    store.close()
+    reloaded.close()
+    print("✓ Keyword index and delete test passed")
+
+
+def test_delete_keeps_published_snapshot(tmp_path):
+    """Test borrar no modifica la instantánea que ya leen las búsquedas en curso"""
+    store = VectorStoreFAISS(persist_directory=str(tmp_path))
+    documents = _ticket_documents(4)
+    documents[1]["metadata"]["palabras_clave"] = "contraseña"
+    store.add_documents(documents, _random_embeddings(4, seed=3))
+    doc_id = store.metadata.get(1, "doc_id")
+    before = store._snapshot
+
+    assert store.delete_documents([doc_id]) == 1
+    after = store._snapshot
+
+    # La instantánea anterior conserva el documento en todos sus índices
+    assert 1 in before.keywords.match("contraseña") and 1 not in after.keywords.match("contraseña")
+    assert 1 in [idx for _, idx in before.bm25.search("ticket 1", 4, size=before.size)]
+    assert 1 not in [idx for _, idx in after.bm25.search("ticket 1", 4, size=after.size)]
+    assert before.doc_id_to_idx[doc_id] == 1 and doc_id not in after.doc_id_to_idx
+    assert "Problema número 1" in store._document_text(before, 1)
+    assert store.get_document(doc_id) is None
+    store.close()
+    print("✓ Delete keeps published snapshot test passed")
+
+
+def test_bm25_hybrid_search(tmp_path, monkeypatch):
+    """Test BM25 encuentra términos literales y RRF los combina con FAISS"""
+    store = VectorStoreFAISS(persist_directory=str(tmp_path))
+    documents = _ticket_documents(40)
+    documents[9]["content"] += "\nEl alumno debe validar su CURP en alumno@prepaenlinea-sep.edu.mx"
+    documents[21]["content"] += "\nRevisa los módulos 3 y 4 de la plataforma"
+    embeddings = _random_embeddings(40, seed=8)
+    store.add_documents(documents, embeddings)
+
+    hits = store.bm25.search("¿dónde valido la curp?", top_k=3)
+    assert [idx for _, idx in hits] == [9]
+    assert [idx for _, idx in store.bm25.search("@prepaenlinea-sep.edu.mx", top_k=3)] == [9]
+    assert store.bm25.search("modulo", top_k=3)[0][1] == 21
+
+    # El embedding apunta a otro documento; el término literal entra por BM25
+    query = embeddings[30].copy()
+    results = store.search_hybrid("validar CURP", query, top_k=2)
+    titles = [m['title'] for m in results['metadatas'][0]]
+    assert sorted(titles) == ["Ticket 30", "Ticket 9"]
+    assert results['similarities'][0][titles.index("Ticket 30")] == pytest.approx(1.0, abs=1e-4)
+
+    # Con umbral, una consulta de otro tema que comparte una palabra no trae el documento léxico
+    results = store.search_hybrid("mi CURP", query, top_k=2, min_similarity=0.5)
+    assert [m['title'] for m in results['metadatas'][0]] == ["Ticket 30"]
+    # ...pero sí si su similitud llega al umbral
+    mixed = embeddings[9] + embeddings[30]
+    results = store.search_hybrid("mi CURP", mixed / np.linalg.norm(mixed), top_k=2, min_similarity=0.5)
+    assert sorted(m['title'] for m in results['metadatas'][0]) == ["Ticket 30", "Ticket 9"]
+    assert min(results['similarities'][0]) >= 0.5
+
+    # Con prefiltro BM25 la parte densa solo puntúa candidatos léxicos
+    monkeypatch.setattr(settings, "BM25_PREFILTER_MIN_DOCS", 10)
+    results = store.search_hybrid("validar CURP ticket", embeddings[9].copy(), top_k=1)
+    assert results['metadatas'][0][0]['title'] == "Ticket 9"
+
+    # Borrado y recarga mantienen el índice BM25
+    store.delete_documents([store.metadata.get(9, "doc_id")])
+    assert store.bm25.search("curp", top_k=3) == []
+    reloaded = VectorStoreFAISS(persist_directory=str(tmp_path))
+    assert reloaded.bm25.search("modulo", top_k=1)[0][1] == 21
+
+    # Bajas por lote: las repetidas o ya borradas no descuentan su longitud dos veces
+    bm25 = reloaded.bm25.without([21, 22, 22, 9])
+    assert bm25.live_documents == reloaded.bm25.live_documents - 2
+    assert bm25._total_length == reloaded.bm25._total_length - bm25._lengths[21] - bm25._lengths[22]
+    assert bm25.search("modulo", top_k=1) == [] and reloaded.bm25.search("modulo", top_k=1)[0][1] == 21
+    store.close()
+    reloaded.close()
+    print("✓ BM25 hybrid search test passed")
+
+
+def test_near_duplicate_ingest(tmp_path, monkeypatch):
+    """Test casi duplicados agrupados al ingerir o marcados y omitidos en resultados"""
+    base = ("ASUNTO: Error o Corrección de Correo\nDESCRIPCIÓN DEL PROBLEMA:\nNo puedo acceder a mi correo "
+            "institucional desde ayer, me marca contraseña incorrecta y ya la cambié dos veces en la plataforma")
+    documents = _ticket_documents(10) + [
+        {"content": base, "metadata": {"title": "Original"}},
+        {"content": base.upper().replace("CAMBIÉ", "cambie") + " hoy", "metadata": {"title": "Copia"}},
+    ]
+    embeddings = _random_embeddings(12, seed=11)
+    embeddings[11] = embeddings[10]
+
+    monkeypatch.setattr(settings, "DEDUP_MODE", "collapse")
+    store = VectorStoreFAISS(persist_directory=str(tmp_path / "collapse"))
+    store.add_documents(documents, embeddings)
+    assert store.get_stats()["total_documents"] == 11
+    results = store.search_documents(embeddings[10].copy(), top_k=1)
+    assert results['metadatas'][0][0]['title'] == "Original"
+    assert results['metadatas'][0][0]['duplicate_count'] == 1
+
+    # Modo "tag": se guardan ambos, pero la copia no repite resultado
+    monkeypatch.setattr(settings, "DEDUP_MODE", "tag")
+    tagged = VectorStoreFAISS(persist_directory=str(tmp_path / "tag"))
+    tagged.add_documents(documents, embeddings)
+    assert tagged.get_stats()["total_documents"] == 12
+    assert tagged.metadata.get(11, "duplicate_of") == tagged.metadata.get(10, "doc_id")
+    titles = [m['title'] for m in tagged.search_documents(embeddings[10].copy(), top_k=3)['metadatas'][0]]
+    assert titles.count("Original") + titles.count("Copia") == 1 and len(titles) == 3
+    store.close()
+    tagged.close()
+    print("✓ Near duplicate ingest test passed")
+
+def test_collapse_keeps_distinct_folios_and_keywords(tmp_path, monkeypatch):
+    """Test agrupar casi duplicados no pierde folios distintos ni palabras clave"""
+    monkeypatch.setattr(settings, "DEDUP_MODE", "collapse")
+    base = ("ASUNTO: Error o Corrección de Correo\nDESCRIPCIÓN DEL PROBLEMA:\nNo puedo acceder a mi correo "
+            "institucional desde ayer, me marca contraseña incorrecta y ya la cambié dos veces en la plataforma")
+    documents = [
+        {"content": base, "metadata": {"title": "Primero", "folio": "25-111111"}},
+        {"content": base + " hoy", "metadata": {"title": "Segundo", "folio": "25-222222"}},
+        {"content": base + " ayer", "metadata": {"title": "Copia", "folio": "25-111111",
+                                                   "palabras_clave": "credencial"}},
+    ]
+    embeddings = _random_embeddings(3, seed=12)
+    store = VectorStoreFAISS(persist_directory=str(tmp_path / "store"))
+    store.add_documents(documents, embeddings)
+
+    # El segundo folio es otro ticket: se guarda (marcado) y su folio se sigue encontrando
+    assert store.get_stats()["total_documents"] == 2
+    for folio, title in [("25-111111", "Primero"), ("25-222222", "Segundo")]:
+        results = store.lookup_exact(f"mi folio {folio}")
+        assert [m["title"] for m in results["metadatas"][0]] == [title]
+    # La copia con el mismo folio se agrupa, pero sus palabras clave pasan al canónico
+    assert store.search_keywords("no tengo mi credencial")["metadatas"][0][0]["title"] == "Primero"
+
+    reopened = VectorStoreFAISS(persist_directory=str(tmp_path / "store"))
+    assert reopened.lookup_exact("25-222222")["metadatas"][0][0]["title"] == "Segundo"
+    assert reopened.search_keywords("credencial")["metadatas"][0][0]["title"] == "Primero"
+    store.close()
+    reopened.close()
+    print("✓ Collapse keeps distinct folios test passed")
+
+
+
+def test_incremental_save_with_journal(tmp_path, monkeypatch):
+    """Test cada alta escribe solo el journal; los archivos completos se reescriben al consolidar"""
+    monkeypatch.setattr(settings, "DEDUP_MODE", "collapse")
+    monkeypatch.setattr(settings, "STORE_CHECKPOINT_DOCS", 5)
+    base = ("ASUNTO: Cambio de correo\nDESCRIPCIÓN DEL PROBLEMA:\nNecesito cambiar el correo registrado "
+            "en mi expediente porque ya no tengo acceso a la cuenta anterior")
+    store = VectorStoreFAISS(persist_directory=str(tmp_path))
+    documents = _ticket_documents(3) + [{"content": base, "metadata": {"title": "Original"}}]
+    embeddings = _random_embeddings(7, seed=15)
+    store.add_documents(documents, embeddings[:4])
+    assert store.checkpoint() and not store.checkpoint()
+    full_files = ["documents.pkl", "metadata.pkl", "bm25.pkl", "dedup.pkl", "embeddings.npy"]
+    written = {name: os.stat(tmp_path / name).st_mtime_ns for name in full_files}
+
+    # Altas, agrupación en un documento consolidado y borrado: solo journal.pkl
+    store.add_document("Duplicado de credencial extraviada", {"title": "Ticket 4"}, embeddings[4])
+    store.add_documents([{"content": base + " hoy", "metadata": {"title": "Copia"}}], embeddings[3:4])
+    store.delete_documents([store.metadata.get(1, "doc_id")])
+    assert {name: os.stat(tmp_path / name).st_mtime_ns for name in full_files} == written
+    assert os.path.exists(tmp_path / "journal.pkl")
+
+    # Otro proceso reconstruye el estado desde los archivos completos más el journal
+    reloaded = VectorStoreFAISS(persist_directory=str(tmp_path))
+    assert len(reloaded.documents) == 5 and len(reloaded.embeddings) == 5
+    assert reloaded.metadata.get(3, "duplicate_count") == 1
+    assert [idx for _, idx in reloaded.bm25.search("credencial extraviada", top_k=3)] == [4]
+    assert 1 not in [idx for _, idx in reloaded.bm25.search("problema número 1", top_k=5)]
+    results = reloaded.search_documents(embeddings[4].copy(), top_k=1)
+    assert results['metadatas'][0][0]['title'] == "Ticket 4"
+    reloaded.close()
+
+    # Al llegar a STORE_CHECKPOINT_DOCS documentos en el journal se consolida sola
+    monkeypatch.setattr(settings, "STORE_CHECKPOINT_DOCS", 2)
+    store.add_document("Constancia de estudios sin sello", {"title": "Ticket 5"}, embeddings[5])
+    assert not os.path.exists(tmp_path / "journal.pkl")
+    assert len(np.load(tmp_path / "embeddings.npy")) == 6
+    store.close()
+    print("✓ Incremental save with journal test passed")
+
+
+def test_verify_and_rebuild_from_embedding_matrix(tmp_path):
+    """Test matriz de embeddings en disco: verificación y reconstrucción sin recodificar"""
+    store = VectorStoreFAISS(persist_directory=str(tmp_path))
+    embeddings = _random_embeddings(50, seed=13)
+    store.add_documents(_ticket_documents(50), embeddings)
+    assert store.checkpoint()
+    assert np.allclose(np.load(tmp_path / "embeddings.npy"), embeddings)
+    assert store.verify()["ok"]
+    store.close()
+
+    # Índice perdido: la verificación lo detecta y la matriz lo reconstruye
+    os.remove(tmp_path / "faiss_delta.bin")
+    damaged = VectorStoreFAISS(persist_directory=str(tmp_path))
+    report = damaged.verify()
+    assert not report["ok"] and report["counts"]["index"] == 0 and report["counts"]["embeddings"] == 50
+
+    index = damaged.rebuild_index("HNSW")
+    assert index.main_size == 50 and index.index_type == "HNSW"
+    assert damaged.verify()["ok"]
+    results = damaged.search_documents(embeddings[17].copy(), top_k=1)
+    assert results['metadatas'][0][0]['title'] == "Ticket 17"
+    damaged.close()
+    print("✓ Verify and rebuild from embedding matrix test passed")
+
+
+def test_portable_bundle_roundtrip(tmp_path):
+    """Test exportar e importar un paquete portable con checksums, sin borrados"""
+    source = VectorStoreFAISS(persist_directory=str(tmp_path / "origen"))
+    documents = _ticket_documents(30)
+    documents[5]["metadata"]["folio"] = "25-450805"
+    embeddings = _random_embeddings(30, seed=14)
+    source.add_documents(documents, embeddings)
+    source.delete_documents([source.metadata.get(3, "doc_id")])
+
+    manifest = source.export_bundle(str(tmp_path / "paquete"), batch_size=7)
+    assert manifest["documents"] == 29 and manifest["embedding_model"] == settings.EMBEDDING_MODEL
+    assert set(manifest["files"]) == {"vectors.npy", "metadata.jsonl", "documents.jsonl.gz", "intents.json"}
+
+    target = VectorStoreFAISS(persist_directory=str(tmp_path / "destino"))
+    assert target.import_bundle(str(tmp_path / "paquete"), batch_size=7) == 29
+    assert target.verify()["ok"]
+    assert target.lookup_exact("25-450805")['metadatas'][0][0]['title'] == "Ticket 5"
+    results = target.search_documents(embeddings[20].copy(), top_k=1)
+    assert results['metadatas'][0][0]['title'] == "Ticket 20"
+    assert results['metadatas'][0][0]['added_at'] == source.metadata.get(20, "added_at")
+
+    # Un archivo alterado se detecta por su checksum
+    with open(tmp_path / "paquete" / "metadata.jsonl", 'a', encoding='utf-8') as f:
+        f.write("{}\n")
+    with pytest.raises(ValueError, match="Checksum"):
+        VectorStoreFAISS(persist_directory=str(tmp_path / "otro")).import_bundle(str(tmp_path / "paquete"))
+    source.close()
+    target.close()
+    print("✓ Portable bundle roundtrip test passed")
+
+
+def test_failed_bundle_import_leaves_store_unchanged(tmp_path):
+    """Test un paquete que falla a mitad de la importación no deja lotes en el almacén"""
+    source = VectorStoreFAISS(persist_directory=str(tmp_path / "origen"))
+    embeddings = _random_embeddings(20, seed=15)
+    source.add_documents(_ticket_documents(20), embeddings)
+    bundle = tmp_path / "paquete"
+    source.export_bundle(str(bundle))
+
+    # documents.jsonl.gz truncado (con su checksum actualizado): el segundo lote no cuadra
+    path = bundle / "documents.jsonl.gz"
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        lines = f.readlines()[:15]
+    with gzip.open(path, 'wt', encoding='utf-8') as f:
+        f.writelines(lines)
+    manifest = json.loads((bundle / "manifest.json").read_text(encoding='utf-8'))
+    manifest["files"]["documents.jsonl.gz"]["sha256"] = file_checksum(str(path))
+    (bundle / "manifest.json").write_text(json.dumps(manifest), encoding='utf-8')
+
+    target = VectorStoreFAISS(persist_directory=str(tmp_path / "destino"))
+    target.add_documents(_ticket_documents(3), _random_embeddings(3, seed=16))
+    with pytest.raises(ValueError, match="distinto número de líneas"):
+        target.import_bundle(str(bundle), batch_size=10)
+    assert len(target.documents) == 3 and len(target.embeddings) == 3 and target.bm25.live_documents == 3
+
+    # Las posiciones siguen alineadas para lo que se añada después
+    target.add_document("ASUNTO: Ticket nuevo", {"title": "Ticket nuevo"}, embeddings[0])
+    assert target.search_documents(embeddings[0].copy(), top_k=1)['metadatas'][0][0]['title'] == "Ticket nuevo"
+    assert target.verify()["ok"]
+    source.close()
+    target.close()
+    print("✓ Failed bundle import test passed")
+
+
+def test_compiled_intent_matching(tmp_path):
+    """Test intents compilados: mismas distancias y orden que el recorrido original"""
+    intents = {"intents": [
+        {"tag": "saludo", "patterns": ["Hola", "buenos días"], "responses": ["¡Hola!"]},
+        {"tag": "certificado", "patterns": ["¿Cómo obtengo mi certificado?", "constancia de estudios"],
+         "responses": ["Solicítalo en Control Escolar"]},
+        {"tag": "baja", "patterns": ["quiero darme de baja"], "responses": ["Llena el formato"]},
+        {"tag": "vacio", "patterns": [], "responses": []},
+    ]}
+    intents_file = tmp_path / "intents.json"
+    intents_file.write_text(json.dumps(intents, ensure_ascii=False), encoding="utf-8")
+    store = VectorStoreFAISS(persist_directory=str(tmp_path / "store"))
+    store.store_intents(str(intents_file))
+
+    queries = ["hola", "CONSTANCIA", "necesito un certificado", "me quiero dar de baja", "darme de baja",
+               "ayuda", "xyz", "   ", "¿cómo obtengo mi certificado? gracias"]
+    for query in queries:
+        results = store.search_intents(query_text=query, top_k=4)
+        expected, distances = scan_intents(intents, query, top_k=4)
+        assert results['metadatas'][0] == expected and results['distances'][0] == distances, query
+
+    results = store.search_intents(query_text="darme de baja")
+    assert results['metadatas'][0][0]['tag'] == "baja" and results['distances'][0] == [0.1]
+    assert store.search_intents(query_text="necesito un certificado")['metadatas'][0][0]['match_type'] == "tag"
+    store.close()
+    print("✓ Compiled intent matching test passed")
+
+
+def test_semantic_intent_matching(tmp_path):
+    """Test paráfrasis de un patrón encontradas con la matriz de embeddings de patrones"""
+    intents = {"intents": [
+        {"tag": "saludo", "patterns": ["Hola", "buenos días"], "responses": ["¡Hola!"]},
+        {"tag": "certificado", "patterns": ["constancia de estudios", "¿Cómo obtengo mi certificado?"],
+         "responses": ["Solicítalo en Control Escolar"]},
+    ]}
+    intents_file = tmp_path / "intents.json"
+    intents_file.write_text(json.dumps(intents, ensure_ascii=False), encoding="utf-8")
+    patterns = ["Hola", "buenos días", "constancia de estudios", "¿Cómo obtengo mi certificado?"]
+    vectors = dict(zip(patterns, _random_embeddings(len(patterns), seed=15)))
+
+    store = VectorStoreFAISS(persist_directory=str(tmp_path / "store"))
+    store.store_intents(str(intents_file), embed_batch=lambda texts: np.vstack([vectors[t] for t in texts]))
+
+    # Sin coincidencia textual, pero el embedding está cerca de un patrón
+    paraphrase = vectors["constancia de estudios"] + 0.2 * _random_embeddings(1, seed=16)[0]
+    results = store.search_intents(query_text="papel que acredita mis materias", query_embedding=paraphrase)
+    assert results['metadatas'][0][0]['tag'] == "certificado"
+    assert results['metadatas'][0][0]['match_type'] == "semantic"
+    assert results['distances'][0][0] < 0.1
+    assert store.search_intents(query_text="papel que acredita mis materias")['metadatas'][0] == []
+
+    # Lejos de todos los patrones: ni coincidencia semántica ni textual
+    unrelated = _random_embeddings(1, seed=17)[0]
+    assert store.search_intents(query_text="xyz", query_embedding=unrelated)['metadatas'][0] == []
+
+    # Una pregunta de documentos solo parecida a un patrón (coseno 0.7) no se desvía al intent
+    pattern = vectors["constancia de estudios"]
+    other = _random_embeddings(1, seed=18)[0]
+    other -= (other @ pattern) * pattern
+    nearby = 0.7 * pattern + np.sqrt(1 - 0.7 ** 2) * other / np.linalg.norm(other)
+    results = store.search_intents(query_text="¿dónde descargo mi constancia de servicio social?",
+                                   query_embedding=nearby)
+    assert results['metadatas'][0] == []
+    store.close()
+    print("✓ Semantic intent matching test passed")
+
+
+def test_compiled_intents_artifact(tmp_path):
+    """Test artefacto de intents: se reutiliza mientras el origen no cambie y no se reescribe al añadir"""
+    intents = {"intents": [
+        {"tag": "saludo", "patterns": ["Hola", "buenos días"], "responses": ["¡Hola!"]},
+        {"tag": "baja", "patterns": ["darme de baja"], "responses": ["Solicítala en línea"]},
+    ]}
+    intents_file = tmp_path / "intents.json"
+    intents_file.write_text(json.dumps(intents, ensure_ascii=False), encoding="utf-8")
+    encoded = []
+
+    def embed_batch(texts):
+        encoded.extend(texts)
+        return _random_embeddings(len(texts), seed=len(encoded))
+
+    persist = str(tmp_path / "store")
+    store = VectorStoreFAISS(persist_directory=persist)
+    store.store_intents(str(intents_file), embed_batch=embed_batch)
+    assert len(encoded) == 3
+    artifact = os.path.join(persist, "intents.bin")
+    assert os.path.exists(artifact) and not os.path.exists(os.path.join(persist, "intents.json"))
+
+    # Añadir documentos no reescribe los intents
+    mtime = os.stat(artifact).st_mtime_ns
+    store.add_documents([{"content": "Texto de prueba", "metadata": {"title": "Doc"}}], _random_embeddings(1, seed=3))
+    assert os.stat(artifact).st_mtime_ns == mtime
+    store.close()
+
+    # Mismo origen: se abre el artefacto con mmap, sin codificar ni compilar
+    store = VectorStoreFAISS(persist_directory=persist)
+    assert store.search_intents(query_text="quiero darme de baja")['metadatas'][0][0]['tag'] == "baja"
+    store.store_intents(str(intents_file), embed_batch=embed_batch)
+    assert len(encoded) == 3
+    assert not store._compiled_intents.pattern_embeddings.flags.owndata
+    assert store.search_intents(query_text="hola")['metadatas'][0][0]['tag'] == "saludo"
+
+    # Origen modificado: se recompila (solo se codifican los patrones nuevos)
+    intents["intents"].append({"tag": "pago", "patterns": ["pagar examen"], "responses": ["En ventanilla"]})
+    intents_file.write_text(json.dumps(intents, ensure_ascii=False), encoding="utf-8")
+    store.store_intents(str(intents_file), embed_batch=embed_batch)
+    assert encoded[3:] == ["pagar examen"]
+    assert store.search_intents(query_text="pagar examen")['metadatas'][0][0]['tag'] == "pago"
+    store.close()
+    print("✓ Compiled intents artifact test passed")
+
+
+def test_typo_tolerant_intents(tmp_path):
+    """Test corrección de tecleo contra el vocabulario de intents antes del matching"""
+    intents = {"intents": [
+        {"tag": "saludo", "patterns": ["Hola", "buen día"], "responses": ["¡Hola!"]},
+        {"tag": "agradecimiento", "patterns": ["muchas gracias"], "responses": ["¡Con gusto!"]},
+        {"tag": "inscripcion", "patterns": ["cómo me inscribo"], "responses": ["En la convocatoria"]},
+    ]}
+    intents_file = tmp_path / "intents.json"
+    intents_file.write_text(json.dumps(intents, ensure_ascii=False), encoding="utf-8")
+    store = VectorStoreFAISS(persist_directory=str(tmp_path / "store"))
+    store.store_intents(str(intents_file))
+
+    assert store.correct_spelling("ola") == "hola"
+    assert store.correct_spelling("grasias!") == "gracias!"
+    assert store.correct_spelling("buen dia") == "buen día"
+    assert store.correct_spelling("como me inscrivo") == "cómo me inscribo"
+    assert store.search_intents(query_text="como me inscrivo")['metadatas'][0] == []
+    assert store.search_intents(query_text=store.correct_spelling("como me inscrivo"))['metadatas'][0][0]['tag'] == "inscripcion"
+
+    # Los términos del corpus se reconocen como correctos y no se cambian
+    assert store.correct_spelling("inscrito") == "inscribo"
+    store.add_documents([{"content": "Alumno inscrito en el módulo", "metadata": {"title": "Doc"}}],
+                        _random_embeddings(1, seed=5))
+    assert store.correct_spelling("inscrito") == "inscrito"
+
+    # A igual distancia gana la palabra más frecuente del corpus, no la de los intents
+    assert store.correct_spelling("bola") == "hola"
+    store.add_documents([{"content": "La plataforma me deja sola en la sesión", "metadata": {"title": "Doc 2"}}],
+                        _random_embeddings(1, seed=6))
+    assert store.correct_spelling("bola") == "sola"
+    store.close()
+    print("✓ Typo tolerant intents test passed")
+
+
+def test_intent_hot_reload_and_incremental_updates(tmp_path, monkeypatch):
+    """Test recarga de intents al cambiar el archivo y cambios sueltos sin recompilar"""
+    monkeypatch.setattr(settings, "INTENT_MAX_PENDING_CHANGES", 2)
+    intents = {"intents": [
+        {"tag": "saludo", "patterns": ["Hola", "buenos días"], "responses": ["¡Hola!"]},
+        {"tag": "baja", "patterns": ["darme de baja"], "responses": ["Solicítala en línea"]},
+    ]}
+    intents_file = tmp_path / "intents.json"
+    intents_file.write_text(json.dumps(intents, ensure_ascii=False), encoding="utf-8")
+    encoded, locked = [], []
+
+    def probe_lock():
+        acquired = store._write_lock.acquire(blocking=False)
+        if acquired:
+            store._write_lock.release()
+        locked.append(not acquired)
+
+    def embed_batch(texts):
+        encoded.extend(texts)
+        if store is not None:
+            # Codificar no bloquea a otros escritores
+            probe = threading.Thread(target=probe_lock)
+            probe.start()
+            probe.join()
+        return _random_embeddings(len(texts), seed=len(encoded))
+
+    store = None
+    store = VectorStoreFAISS(persist_directory=str(tmp_path / "store"))
+    store.store_intents(str(intents_file), embed_batch=embed_batch)
+    compiled = store._compiled_intents
+
+    # Cambios sueltos: solo se codifica el patrón nuevo, fuera del lock, y el
+    # archivo de origen (versionado) no se toca: los cambios van al almacén
+    locked.clear()
+    store.add_intent_pattern("baja", "quiero salirme")
+    store.upsert_intent({"tag": "pago", "patterns": ["pagar examen"], "responses": ["En ventanilla"]})
+    assert encoded == ["Hola", "buenos días", "darme de baja", "quiero salirme", "pagar examen"]
+    assert locked == [False, False]
+    assert store._compiled_intents._patterns is compiled._patterns
+    assert store.search_intents(query_text="quiero salirme ya")['metadatas'][0][0]['tag'] == "baja"
+    assert json.loads(intents_file.read_text(encoding="utf-8")) == intents
+    overlay = json.loads((tmp_path / "store" / "intents_overlay.json").read_text(encoding="utf-8"))
+    assert set(overlay) == {"baja", "pago"}
+    assert store.reload_intents() is False
+
+    # Otro proceso (o un reinicio) con el mismo archivo de origen ve los cambios
+    reopened = VectorStoreFAISS(persist_directory=str(tmp_path / "store"))
+    reopened.store_intents(str(intents_file))
+    assert [i["tag"] for i in reopened.intents["intents"]] == ["saludo", "baja", "pago"]
+    reopened.close()
+
+    store.remove_intent_pattern("saludo", "buenos días")
+    store.remove_intent("pago")
+    for query in ["hola", "buenos días", "pagar examen", "quiero salirme", "ayuda"]:
+        expected, distances = scan_intents(store.intents, query, top_k=3)
+        results = store.search_intents(query_text=query, top_k=3)
+        assert results['metadatas'][0] == expected and results['distances'][0] == distances
+
+    # Más de INTENT_MAX_PENDING_CHANGES cambios: se recompila en segundo plano
+    deadline = time.time() + 5
+    while store._compiled_intents.pending_changes and time.time() < deadline:
+        time.sleep(0.02)
+    assert store._compiled_intents.pending_changes == 0
+    assert store.search_intents(query_text="quiero salirme")['metadatas'][0][0]['tag'] == "baja"
+
+    # Edición externa del archivo: el vigilante recarga sin codificar lo ya conocido
+    store.watch_intents(0.05)
+    intents["intents"].append({"tag": "beca", "patterns": ["solicitar beca"], "responses": ["En la convocatoria"]})
+    intents_file.write_text(json.dumps(intents, ensure_ascii=False), encoding="utf-8")
+    deadline = time.time() + 5
+    while not store.search_intents(query_text="solicitar beca")['metadatas'][0] and time.time() < deadline:
+        time.sleep(0.02)
+    assert store.search_intents(query_text="solicitar beca")['metadatas'][0][0]['tag'] == "beca"
+    assert encoded[-1] == "solicitar beca" and encoded.count("Hola") == 1
+    store.close()
+    print("✓ Intent hot reload test passed")
+
+
+def test_range_search_threshold(tmp_path):
+    """Test range search: solo vecinos sobre el umbral y similitud coseno real"""
+    store = VectorStoreFAISS(persist_directory=str(tmp_path))
+    embeddings = _random_embeddings(20, seed=2)
+    store.add_documents(_ticket_documents(20), embeddings)
+
+    results = store.search_documents(embeddings[7].copy(), top_k=5, min_similarity=0.9)
+    assert [m['title'] for m in results['metadatas'][0]] == ["Ticket 7"]
+    assert results['similarities'][0][0] == pytest.approx(1.0, abs=1e-4)
+
+    # Consulta fuera de tema: nada supera el umbral
+    off_topic = _random_embeddings(1, seed=99)[0]
+    results = store.search_documents(off_topic, top_k=5, min_similarity=0.75)
+    assert results['documents'][0] == []
+
+    # Sin umbral se mantiene el top-k y la similitud coincide con el producto interno
+    results = store.search_documents(off_topic.copy(), top_k=3)
+    expected = np.sort(embeddings @ off_topic)[::-1][:3]
+    assert np.allclose(results['similarities'][0], expected, atol=1e-4)
+
+    # Por defecto el pipeline usa top-k: la búsqueda por rango es opcional
+    assert type(settings).model_fields['RANGE_SEARCH_ENABLED'].default is False
+    print("✓ Range search threshold test passed")
+
+
+def test_columnar_metadata_roundtrip():
+    """Test metadatos en columnas: mismos dicts y menos memoria"""
+    records = [
+        {
+            "title": f"Ticket {i}",
+            "source": "excel_import",
+            "sheet_name": "Tickets",
+            "area_responsable": "Mesa de Servicio",
+            "row_index": i,
+            "imported_at": f"2026-02-13T12:{i % 60:02d}:47.342015",
+            "palabras_clave": ["correo", "acceso"],
+            "doc_index": i
+        }
+        for i in range(500)
+    ]
+    records[10]["row_index"] = "sin número"  # Valor que no encaja en la columna
+
+    store = ColumnarMetadata.from_records(records)
+    assert len(store) == 500
+    assert all(store[i] == record for i, record in enumerate(records))
+    assert store.get(42, "area_responsable") == "Mesa de Servicio"
+
+    usage = store.memory_usage()
+    assert usage["columnar_bytes"] < usage["dict_bytes_estimate"]
+    print("✓ Columnar metadata roundtrip test passed")
+
+
+def test_compressed_document_store():
+    """Test textos comprimidos con diccionario entrenado y caché LRU"""
+    texts = [
+        f"ASUNTO: Error o Corrección de Correo\nFOLIO: 25-{450000 + i}\n"
+        f"\nDESCRIPCIÓN DEL PROBLEMA:\nNo puedo acceder a mi correo institucional número {i}"
+        f"\n\nRESPUESTA INSTITUCIONAL:\nEstimado estudiante, para corregir tu correo "
+        f"ingresa a la plataforma y solicita el cambio en Control Escolar."
+        for i in range(300)
+    ]
+    store = CompressedTextStore.from_texts(texts, cache_size=4, train_min_docs=200)
+
+    assert len(store) == 300 and list(store) == texts
+    assert store[17] == texts[17] and store[17] == texts[17]
+    usage = store.memory_usage()
+    assert usage["cache_hits"] == 1 and usage["cache_size"] == 1
+    assert usage["compression_ratio"] > 3
+
+    # Documentos añadidos después del entrenamiento usan el mismo diccionario
+    store.append("ASUNTO: Nuevo ticket")
+    assert store[300] == "ASUNTO: Nuevo ticket"
+    print("✓ Compressed document store test passed")
+
+
+def test_token_chunking(tmp_path):
+    """Test fragmentos por tokens: tamaño, secciones, solapamiento y recomposición del documento"""
+    count_words = lambda texts: [len(t.split()) for t in texts]
+    chunker = TokenChunker(count_words, chunk_size=20, chunk_overlap=6)
+    content = (
+        "ASUNTO: Problema con la plataforma.\nFOLIO: 25-450001\n"
+        "DESCRIPCIÓN DEL PROBLEMA: No puedo entrar al módulo. Lo intenté desde el celular y la computadora. "
+        "Sigue sin dejarme entrar y la entrega vence mañana.\n"
+        "RESPUESTA INSTITUCIONAL: Se restableció tu contraseña. Entra con tu matrícula. "
+        "Si el error persiste escribe a soporte con una captura de pantalla del mensaje que aparece."
+    )
+    chunks = chunker.split(content)
+    assert len(chunks) > 2
+    assert all(content[c.start:c.start + len(c.text)] == c.text for c in chunks)
+    assert all(count_words([c.text])[0] <= 20 for c in chunks)
+    assert any(c.text.startswith("RESPUESTA INSTITUCIONAL:") for c in chunks)
+    # Solapamiento: el último fragmento repite la oración anterior
+    assert chunks[-1].start < chunks[-2].start + len(chunks[-2].text)
+
+    # Un tamaño mayor que el del modelo se reduce manteniendo la proporción de solapamiento
+    capped = TokenChunker(count_words, chunk_size=768, chunk_overlap=128, max_tokens=126)
+    assert capped.chunk_size == 126 and capped.chunk_overlap == 21
+    assert chunker.split_document("Texto corto.", {"title": "Corto"}) == [{"content": "Texto corto.", "metadata": {"title": "Corto"}}]
+
+    documents = chunker.split_document(content, {"title": "Largo", "folio": "25-450001"}) + _ticket_documents(5)
+    parent_id = documents[0]["metadata"]["parent_id"]
+    embeddings = _random_embeddings(len(documents), seed=21)
+    embeddings[1] = embeddings[0]
+    store = VectorStoreFAISS(persist_directory=str(tmp_path / "store"))
+    store.add_documents(documents, embeddings)
+
+    # Un solo resultado por documento aunque varios fragmentos coincidan
+    parents = [m.get("parent_id") for m in store.search_documents(embeddings[0].copy(), top_k=3)["metadatas"][0]]
+    assert parents.count(parent_id) == 1
+    # El folio devuelve el documento completo
+    assert store.lookup_exact("mi folio es 25-450001")["documents"][0] == [content]
+
+    reopened = VectorStoreFAISS(persist_directory=str(tmp_path / "store"))
+    document = reopened.get_document(parent_id)
+    assert document["content"] == content
+    assert document["metadata"]["title"] == "Largo" and "chunk_index" not in document["metadata"]
+
+    assert reopened.delete_documents([parent_id]) == len(chunks)
+    assert reopened.get_document(parent_id) is None
+    assert reopened.get_stats()["total_documents"] == 5
+    store.close()
+    reopened.close()
+    print("✓ Token chunking test passed")
+
+
+def test_chunk_ids_are_unique_per_parent(tmp_path):
+    """Test fragmentos con el mismo texto en documentos distintos tienen IDs distintos"""
+    shared = "RESPUESTA INSTITUCIONAL: Se restableció tu contraseña, entra con tu matrícula."
+    documents = [
+        {"content": text, "metadata": {"title": parent, "parent_id": parent, "chunk_index": index,
+                                       "chunk_count": 2, "chunk_start": 0 if index == 0 else 40}}
+        for parent, texts in (("padre-a", ["ASUNTO: No puedo entrar a la plataforma.", shared]),
+                              ("padre-b", ["ASUNTO: Olvidé mi contraseña del correo.", shared]))
+        for index, text in enumerate(texts)
+    ]
+    store = VectorStoreFAISS(persist_directory=str(tmp_path))
+    store.add_documents(documents, _random_embeddings(4, seed=22))
+    doc_ids = [store.metadata.get(i, "doc_id") for i in range(4)]
+    assert doc_ids == ["padre-a-0", "padre-a-1", "padre-b-0", "padre-b-1"]
+
+    # Borrar un documento no se lleva el fragmento idéntico del otro
+    assert store.delete_documents(["padre-a"]) == 2
+    assert shared in store.get_document("padre-b")["content"]
+    assert store.get_stats()["total_documents"] == 2
+    store.close()
+    print("✓ Chunk ids test passed")
+
+
+
+
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])